@@ -0,0 +1,155 @@
+import asyncio
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from interactions import InteractionEngine
+
+
+def medicine_source(medicine_id: str) -> str:
+    return f"medicine:{medicine_id}"
+
+
+def prescription_source(prescription_id: str) -> str:
+    return f"prescription:{prescription_id}"
+
+
+def in_stock(medicine: dict) -> bool:
+    """Only medicines the user still has count towards the active regimen"""
+    return (medicine.get("quantity") or 0) > 0
+
+
+class ActiveDrugs:
+    """Per-user set of the drugs on a user's in-stock medicines and prescriptions, one document per drug
+
+    Each document lists the sources (``medicine:<id>``, ``prescription:<id>``) that put the drug
+    there, so removing one source only drops a drug nothing else references. Only names the
+    interaction index resolves are kept, under their canonical name; run ``python
+    active_drugs.py`` after changing the interaction dataset to rebuild the sets.
+    """
+
+    def __init__(self, collection, engine: InteractionEngine):
+        self.collection = collection
+        self.engine = engine
+
+    def _canonical(self, names: Iterable[str]) -> Dict[int, str]:
+        drugs = {}
+        for name in names:
+            drug_id = self.engine.resolve(name) if name else None
+            if drug_id is not None:
+                drugs[drug_id] = self.engine.canonical_name(drug_id)
+        return drugs
+
+    async def add(self, user_id: str, source: str, names: Iterable[str]):
+        await self.add_many(user_id, [(source, names)])
+
+    async def add_many(self, user_id: str, entries: Iterable[Tuple[str, Iterable[str]]]):
+        """Add several (source, names) entries in one bulk write, e.g. for an import"""
+        ops = [
+            UpdateOne({"user_id": user_id, "drug": drug}, {"$addToSet": {"sources": source}}, upsert=True)
+            for source, names in entries
+            for drug in self._canonical(names).values()
+        ]
+        if ops:
+            await self.collection.bulk_write(ops, ordered=False)
+
+    async def remove(self, user_id: str, source: str):
+        result = await self.collection.update_many(
+            {"user_id": user_id, "sources": source},
+            {"$pull": {"sources": source}},
+        )
+        if result.modified_count:
+            await self.collection.delete_many({"user_id": user_id, "sources": {"$size": 0}})
+
+    async def replace(self, user_id: str, source: str, names: Iterable[str]):
+        """Point a source at a new list of drugs, e.g. after a prescription is reprocessed"""
+        await self.remove(user_id, source)
+        await self.add(user_id, source, names)
+
+    async def track_medicine(self, user_id: str, before: Optional[dict], after: dict) -> List[dict]:
+        """Update the set after a medicine is added (``before`` None) or changed
+
+        A medicine leaves the set when its quantity reaches 0 and rejoins when it is restocked,
+        and a rename swaps its drug. Returns the conflicts of a drug that (re)joined the set.
+        """
+        source = medicine_source(after["id"])
+        was_active = before is not None and in_stock(before)
+        if was_active and in_stock(after) and before.get("name") == after.get("name"):
+            return []
+        if was_active:
+            await self.remove(user_id, source)
+        if not in_stock(after):
+            return []
+        conflicts = await self.conflicts(user_id, [after["name"]])
+        await self.add(user_id, source, [after["name"]])
+        return conflicts
+
+    async def conflicts(self, user_id: str, names: Iterable[str], source: Optional[str] = None) -> List[dict]:
+        """Interactions between new drugs and the user's active set, ignoring drugs only ``source`` added
+
+        Each new drug's k interaction partners are looked up by (user_id, drug) index, so the
+        cost is O(k) per drug rather than a re-read and re-pairing of the whole regimen.
+        """
+        partners: Dict[str, List[int]] = {}
+        for drug_id in self._canonical(names):
+            for other in self.engine.interactions_of(drug_id):
+                partners.setdefault(self.engine.canonical_name(other), []).append(drug_id)
+        if not partners:
+            return []
+
+        active = await self.collection.find(
+            {"user_id": user_id, "drug": {"$in": list(partners)}},
+            {"_id": 0, "drug": 1, "sources": 1},
+        ).to_list(None)
+        conflicts = []
+        for doc in active:
+            if source is not None and doc.get("sources") == [source]:
+                continue
+            other = self.engine.resolve(doc["drug"])
+            for drug_id in partners[doc["drug"]]:
+                conflicts.append(self.engine.conflict(drug_id, other))
+        return conflicts
+
+
+async def rebuild(db, engine: InteractionEngine, batch_size: int = 1000) -> int:
+    """Recreate every user's active-drug set from medicines and prescriptions (one-off backfill)"""
+    active = ActiveDrugs(db.active_drugs, engine)
+    await db.active_drugs.delete_many({})
+    ops = []
+
+    async def flush():
+        if ops:
+            await db.active_drugs.bulk_write(ops, ordered=False)
+            ops.clear()
+
+    async def collect(user_id: str, source: str, names: Iterable[str]):
+        for drug in active._canonical(names).values():
+            ops.append(UpdateOne({"user_id": user_id, "drug": drug}, {"$addToSet": {"sources": source}}, upsert=True))
+        if len(ops) >= batch_size:
+            await flush()
+
+    async for medicine in db.medicines.find({"quantity": {"$gt": 0}}, {"_id": 0, "id": 1, "user_id": 1, "name": 1}):
+        await collect(medicine["user_id"], medicine_source(medicine["id"]), [medicine.get("name")])
+    async for prescription in db.prescriptions.find({}, {"_id": 0, "id": 1, "user_id": 1, "medicines.name": 1}):
+        names = [med.get("name") for med in prescription.get("medicines") or []]
+        await collect(prescription["user_id"], prescription_source(prescription["id"]), names)
+    await flush()
+    return await db.active_drugs.count_documents({})
+
+
+async def _main() -> int:
+    # The server module builds the interaction index from the configured dataset
+    from server import db, interaction_engine
+    from indexes import INDEXES, ensure_indexes
+
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == "active_drugs"])
+    count = await rebuild(db, interaction_engine)
+    print(f"Rebuilt {count} active drug entries")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # python active_drugs.py
+    sys.exit(asyncio.run(_main()))
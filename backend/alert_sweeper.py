@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import os
+import sys
+import uuid
+from collections import Counter
+from datetime import date, datetime, timezone, timedelta
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from stats import EXPIRY_WINDOW_DAYS, LOW_STOCK_THRESHOLD, expiry_key
+
+ALERT_SWEEP_INTERVAL = float(os.environ.get('ALERT_SWEEP_INTERVAL', '3600'))
+RUNOUT_WINDOW_DAYS = int(os.environ.get('RUNOUT_WINDOW_DAYS', '7'))
+
+SWEEP_ID = "medicine_alerts"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def runout_date(quantity: int, daily_usage: int, counted_at: datetime) -> Optional[str]:
+    """Day the stock runs out at the daily usage, counted from when the quantity was set"""
+    if not daily_usage or daily_usage <= 0:
+        return None
+    days = max(0, quantity) // daily_usage
+    return (counted_at.date() + timedelta(days=days)).isoformat()
+
+
+def stock_fields(quantity: int, daily_usage: int, now: Optional[datetime] = None) -> dict:
+    """Derived fields stored on a medicine whenever its quantity or daily usage is written"""
+    now = now or _now()
+    return {
+        "stock_counted_at": now,
+        "runout_date": runout_date(quantity, daily_usage, now),
+    }
+
+
+def _epoch_seconds(value) -> Optional[int]:
+    # Dates stored before native BSON dates are ISO strings; Mongo keeps only milliseconds
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def _alert(medicine: dict, key: str, alert_type: str, severity: str, title: str, message: str, now: datetime) -> dict:
+    # The ID is derived from the medicine and the state it reached, so a state is alerted once
+    return {
+        "id": str(uuid.uuid5(uuid.NAMESPACE_URL, f"{medicine['id']}/{key}")),
+        "user_id": medicine["user_id"],
+        "type": alert_type,
+        "severity": severity,
+        "title": title,
+        "message": message,
+        "is_read": False,
+        "created_at": now,
+    }
+
+
+def expiry_alert(medicine: dict, today: date, now: datetime) -> Optional[dict]:
+    key = expiry_key(medicine.get("expiry_date"))
+    if key is None:
+        return None
+    days = (date.fromisoformat(key) - today).days
+    if days > EXPIRY_WINDOW_DAYS:
+        return None
+    if days < 0:
+        return _alert(medicine, f"expired/{key}", "expiry", "high", "Medicine Expired", f"{medicine['name']} expired on {key}", now)
+    return _alert(
+        medicine, f"expiry/{key}", "expiry", "medium", "Medicine Expiring Soon",
+        f"{medicine['name']} expires in {days} days", now,
+    )
+
+
+def runout_alert(medicine: dict, today: date, now: datetime) -> Optional[dict]:
+    key = medicine.get("runout_date")
+    if not key:
+        return None
+    days = (date.fromisoformat(key) - today).days
+    if days > RUNOUT_WINDOW_DAYS:
+        return None
+    return _alert(
+        medicine, f"runout/{key}", "stock", "high" if days <= 2 else "medium", "Medicine Running Out",
+        f"{medicine['name']} runs out in about {max(0, days)} days at {medicine.get('daily_usage', 1)} a day", now,
+    )
+
+
+def low_stock_alert(medicine: dict, now: datetime) -> Optional[dict]:
+    quantity = medicine.get("quantity", 0)
+    if quantity > LOW_STOCK_THRESHOLD:
+        return None
+    severity = "high" if quantity <= 2 else "medium"
+    # One alert per severity level per restock
+    restocked = _epoch_seconds(medicine.get("restocked_at") or medicine.get("created_at"))
+    return _alert(
+        medicine, f"stock/{severity}/{restocked}", "stock", severity, "Low Stock Alert",
+        f"Only {quantity} units of {medicine['name']} remaining", now,
+    )
+
+
+def medicine_alerts(medicine: dict, now: Optional[datetime] = None) -> List[dict]:
+    """Every alert a medicine's current state calls for; used when it is added or updated"""
+    now = now or _now()
+    today = now.date()
+    alerts = [expiry_alert(medicine, today, now), low_stock_alert(medicine, now), runout_alert(medicine, today, now)]
+    return [alert for alert in alerts if alert is not None]
+
+
+class AlertSweeper:
+    """Periodic expiry and run-out alerts that only read medicines crossing a threshold
+
+    Each sweep queries the indexed ``expiry_date`` and ``runout_date`` ranges that entered their
+    alert windows since the previous sweep (watermarks kept in ``alert_sweeps``), so its cost
+    follows the number of medicines changing state, not the size of the collection. Alert IDs
+    are deterministic and the insert is unordered, so states already alerted are skipped by
+    the unique index. Medicines are also evaluated when written, which covers edits that move
+    a date into a range already swept. One worker process at a time holds the sweep lease.
+    """
+
+    def __init__(self, db, on_alerts=None, interval: float = ALERT_SWEEP_INTERVAL):
+        self.db = db
+        # on_alerts(user_id, count) is awaited with the number of new alerts per user
+        self.on_alerts = on_alerts
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def insert(self, alerts: Iterable[dict]) -> int:
+        """Bulk-insert alerts, skipping any already stored; returns how many were new"""
+        alerts = list(alerts)
+        if not alerts:
+            return 0
+        failed = set()
+        try:
+            await self.db.alerts.insert_many(alerts, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get("writeErrors", []):
+                if error.get("code") != 11000:
+                    raise
+                failed.add(error["index"])
+        added = Counter(alert["user_id"] for i, alert in enumerate(alerts) if i not in failed)
+        if self.on_alerts is not None:
+            for user_id, count in added.items():
+                await self.on_alerts(user_id, count)
+        return sum(added.values())
+
+    async def _claim(self, now: datetime) -> Optional[dict]:
+        try:
+            return await self.db.alert_sweeps.find_one_and_update(
+                {"id": SWEEP_ID, "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lte": now}}]},
+                {"$set": {"lease_expires_at": now + timedelta(seconds=max(60.0, self.interval / 2))}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Another worker holds the lease
+            return None
+
+    async def sweep(self, now: Optional[datetime] = None) -> Optional[int]:
+        """Run one sweep if no other worker is; returns the number of new alerts"""
+        now = now or _now()
+        state = await self._claim(now)
+        if state is None:
+            return None
+        today = now.date()
+        projection = {"_id": 0, "id": 1, "user_id": 1, "name": 1, "expiry_date": 1, "runout_date": 1, "daily_usage": 1}
+        # (indexed field, watermark, last date now inside the alert window)
+        windows = [
+            ("expiry_date", "expiry_through", (today + timedelta(days=EXPIRY_WINDOW_DAYS)).isoformat()),
+            ("expiry_date", "expired_through", (today - timedelta(days=1)).isoformat()),
+            ("runout_date", "runout_through", (today + timedelta(days=RUNOUT_WINDOW_DAYS)).isoformat()),
+        ]
+
+        alerts = []
+        for field, watermark, through in windows:
+            window = {"$lte": through}
+            if state.get(watermark):
+                window["$gt"] = state[watermark]
+            async for medicine in self.db.medicines.find({field: window}, projection):
+                if field == "runout_date":
+                    alert = runout_alert(medicine, today, now)
+                else:
+                    alert = expiry_alert(medicine, today, now)
+                if alert is not None:
+                    alerts.append(alert)
+
+        added = await self.insert(alerts)
+        await self.db.alert_sweeps.update_one(
+            {"id": SWEEP_ID},
+            {"$set": {
+                **{watermark: through for _, watermark, through in windows},
+                "last_sweep_at": now,
+                "last_sweep_alerts": added,
+                "lease_expires_at": None,
+            }},
+        )
+        return added
+
+    async def _loop(self):
+        while True:
+            try:
+                added = await self.sweep()
+                if added:
+                    logging.info(f"Alert sweep added {added} alerts")
+            except Exception as e:
+                logging.error(f"Alert sweep error: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+async def backfill(db, batch_size: int = 1000) -> int:
+    """Give medicines stored before run-out forecasting a runout_date, counted from created_at"""
+    ops, updated = [], 0
+    cursor = db.medicines.find(
+        {"stock_counted_at": {"$exists": False}},
+        {"_id": 0, "id": 1, "quantity": 1, "daily_usage": 1, "created_at": 1},
+    )
+    async for medicine in cursor:
+        created_at = medicine.get("created_at")
+        if isinstance(created_at, str):
+            created_at = datetime.fromisoformat(created_at)
+        fields = stock_fields(int(medicine.get("quantity", 0)), int(medicine.get("daily_usage", 1)), created_at or _now())
+        ops.append(UpdateOne({"id": medicine["id"]}, {"$set": fields}))
+        if len(ops) >= batch_size:
+            updated += (await db.medicines.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.medicines.bulk_write(ops, ordered=False)).modified_count
+    return updated
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    from database import LazyDatabase
+    from indexes import INDEXES, ensure_indexes
+    from stats import UserStats
+
+    db = LazyDatabase()
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection in ("medicines", "alert_sweeps")])
+    print(f"Forecast run-out dates for {await backfill(db)} medicines")
+    added = await AlertSweeper(db, on_alerts=UserStats(db).alerts_added).sweep()
+    print("Another worker is sweeping" if added is None else f"Sweep added {added} alerts")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # python alert_sweeper.py
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,162 @@
+"""Local stand-ins for Gemini and openFDA with injectable latency and failures
+
+Used by the benchmark scripts and tests/test_resilience.py to exercise timeouts, circuit breakers and load shedding
+without network access. Both fakes read their ``latency``/``error_rate`` attributes on every
+call, so a scenario can degrade or restore a service while it is being driven.
+"""
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+from typing import Callable, Dict, Optional, Union
+from urllib.parse import parse_qs
+
+import uvicorn
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeServiceError(Exception):
+    pass
+
+
+class FakeGeminiModel:
+    """Drop-in for a GenerativeModel: replies with fixed or computed text after a delay"""
+
+    def __init__(
+        self,
+        reply: Union[str, Callable[[object], str]] = '{"medicines": []}',
+        latency: float = 0.05,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.reply = reply
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = 0
+        self._rng = random.Random(seed)
+
+    async def _delay(self):
+        await asyncio.sleep(max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter)))
+        if self._rng.random() < self.error_rate:
+            raise FakeServiceError("fake Gemini error")
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        self.calls += 1
+        await self._delay()
+        text = self.reply(contents) if callable(self.reply) else self.reply
+        if not stream:
+            return FakeResponse(text)
+
+        async def chunks():
+            for i in range(0, len(text), 16):
+                await asyncio.sleep(0)
+                yield FakeResponse(text[i:i + 16])
+        return chunks()
+
+
+def install_fake_gemini(inference, model: FakeGeminiModel, model_names=("gemini-pro-vision", "gemini-2.5-flash")):
+    """Route every named model of a GeminiInference to the fake"""
+    for name in model_names:
+        inference._models[name] = model
+    return model
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class FakeFDAServer:
+    """openFDA /drug/label.json served by uvicorn on a background thread
+
+        with FakeFDAServer(latency=0.05) as fda:
+            client = FDAClient(base_url=fda.url)
+    """
+
+    def __init__(
+        self,
+        labels: Optional[Dict[str, dict]] = None,
+        latency: float = 0.02,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        # brand name (lower case) -> label; unknown names get openFDA's 404
+        self.labels = labels if labels is not None else {
+            "warfarin": {"drug_interactions": ["Warfarin interacts with NSAIDs, aspirin and many antibiotics."]},
+            "aspirin": {"drug_interactions": ["Aspirin may increase the anticoagulant effect of warfarin."]},
+        }
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self.port = free_port()
+        self._server: Optional[uvicorn.Server] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        if self._rng.random() < self.error_rate:
+            status, body = 500, {"error": {"code": "SERVER_ERROR"}}
+        elif scope["path"] != "/drug/label.json":
+            status, body = 404, {"error": {"code": "NOT_FOUND"}}
+        else:
+            search = parse_qs(scope["query_string"].decode()).get("search", [""])[0]
+            name = search.split(":", 1)[-1].lower()
+            label = self.labels.get(name)
+            if label is None:
+                status, body = 404, {"error": {"code": "NOT_FOUND"}}
+            else:
+                status, body = 200, {"results": [label]}
+        payload = json.dumps(body).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    def start(self, timeout: float = 10.0) -> "FakeFDAServer":
+        config = uvicorn.Config(self, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline:
+                raise TimeoutError("fake FDA server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.should_exit = True
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self) -> "FakeFDAServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,166 @@
+"""Payload size, preprocessing cost and extraction accuracy with and without image preprocessing
+
+    python benchmarks/image_preprocess_bench.py --synthetic 20 [--llm]
+    python benchmarks/image_preprocess_bench.py --images DIR [--labels DIR/labels.json] [--llm]
+
+``--synthetic`` renders samples from the labelled text corpus onto phone-camera sized,
+EXIF-rotated JPEGs. ``--images`` takes real scans; labels map file names to the expected
+medicines. ``--llm`` runs the single-pass Gemini extraction on the original and the
+prepared bytes of every labelled image (needs GEMINI_API_KEY) and compares accuracy and
+latency.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+
+from PIL import Image, ImageDraw, ImageFilter, ImageFont  # noqa: E402
+
+from image_preprocess import IMAGE_JPEG_QUALITY, IMAGE_MAX_EDGE, hash_distance, prepare_image  # noqa: E402
+from local_parser import DRUG_LEXICON_FILE, DrugLexicon  # noqa: E402
+from text_parser import DEFAULT_CORPUS, score_sample, summarize  # noqa: E402
+from uploads import sniff_image_type  # noqa: E402
+
+
+def synthetic_images(count: int, seed: int = 7) -> list:
+    """(name, jpeg bytes, expected medicines) rendered from the text corpus"""
+    rng = random.Random(seed)
+    samples = [json.loads(line) for line in DEFAULT_CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+    font = ImageFont.load_default(size=96)
+    images = []
+    for i in range(count):
+        sample = samples[i % len(samples)]
+        image = Image.new("RGB", (3024, 4032), (rng.randint(225, 245), rng.randint(220, 240), rng.randint(205, 230)))
+        draw = ImageDraw.Draw(image)
+        draw.text((200, 300), "Rx", fill=(30, 30, 60), font=font)
+        for n, line in enumerate(sample["text"].split("\n")):
+            draw.text((200, 600 + n * 180), line, fill=(20, 20, 50), font=font)
+        noise = Image.effect_noise(image.size, 24).convert("RGB")
+        image = Image.blend(image, noise, 0.08).filter(ImageFilter.GaussianBlur(1.2))
+        # Stored sideways with an orientation tag, as phone cameras do
+        image = image.transpose(Image.ROTATE_90)
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=95, exif=exif)
+        images.append((f"synthetic-{i:03d}.jpg", out.getvalue(), sample["medicines"]))
+    return images
+
+
+def folder_images(folder: Path, labels_path: Path) -> list:
+    labels = json.loads(labels_path.read_text()) if labels_path and labels_path.exists() else {}
+    images = []
+    for path in sorted(folder.iterdir()):
+        if path.is_file() and path.name != "labels.json":
+            images.append((path.name, path.read_bytes(), labels.get(path.name)))
+    return images
+
+
+async def extract(inference, data: bytes, mime_type: str) -> tuple:
+    from extraction import IMAGE_EXTRACTION_PROMPT, PRESCRIPTION_SCHEMA, json_output, parse_prescription
+
+    started = time.perf_counter()
+    try:
+        response = await inference.generate(
+            'gemini-2.5-flash',
+            [IMAGE_EXTRACTION_PROMPT, {"mime_type": mime_type, "data": data}],
+            generation_config=json_output(PRESCRIPTION_SCHEMA),
+        )
+        medicines = parse_prescription(response.text)["medicines"]
+    except Exception as e:
+        print(f"LLM error: {e}", file=sys.stderr)
+        medicines = []
+    return medicines, (time.perf_counter() - started) * 1000
+
+
+async def compare_extraction(rows: list) -> dict:
+    from inference import GeminiInference
+
+    inference = GeminiInference(os.environ.get('GEMINI_API_KEY', ''))
+    lexicon = DrugLexicon.load(DRUG_LEXICON_FILE)
+    results = {"original": [], "prepared": []}
+    for name, data, expected, prepared in rows:
+        if expected is None:
+            continue
+        for variant, payload, mime in (
+            ("original", data, sniff_image_type(data[:16]) or "image/jpeg"),
+            ("prepared", prepared.data, prepared.mime_type),
+        ):
+            medicines, ms = await extract(inference, payload, mime)
+            results[variant].append({**score_sample(lexicon, medicines, expected), "ms": ms})
+    return {variant: summarize(rows) for variant, rows in results.items()}
+
+
+def main(args) -> None:
+    if args.images:
+        folder = Path(args.images)
+        images = folder_images(folder, Path(args.labels) if args.labels else folder / "labels.json")
+    else:
+        images = synthetic_images(args.synthetic)
+
+    rows, prepare_ms = [], []
+    for name, data, expected in images:
+        started = time.perf_counter()
+        prepared = prepare_image(data, sniff_image_type(data[:16]) or "image/jpeg", args.max_edge, args.quality, not args.color)
+        ms = (time.perf_counter() - started) * 1000
+        rows.append((name, data, expected, prepared))
+        prepare_ms.append(ms)
+        print(f"{name:28} {len(data) / 1024:9.0f} KiB -> {len(prepared.data) / 1024:7.0f} KiB  {prepared.width}x{prepared.height}  {ms:7.1f} ms")
+
+    before = sum(len(r[1]) for r in rows)
+    after = sum(len(r[3].data) for r in rows)
+    report = {
+        "images": len(rows),
+        "bytes_before": before,
+        "bytes_after": after,
+        "reduction": 1 - after / before if before else 0.0,
+        "max_edge": args.max_edge,
+        "quality": args.quality,
+        "grayscale": not args.color,
+        "prepare_ms_p50": statistics.median(prepare_ms) if prepare_ms else 0.0,
+    }
+    hashes = [r[3].phash for r in rows if r[3].phash]
+    if len(hashes) > 1:
+        distances = [hash_distance(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]]
+        report["min_hash_distance_between_images"] = min(distances)
+    print(
+        f"\n{len(rows)} images: {before / 1048576:.1f} MiB -> {after / 1048576:.1f} MiB "
+        f"({report['reduction']:.0%} smaller), median prepare {report['prepare_ms_p50']:.0f} ms"
+    )
+
+    if args.llm:
+        report["extraction"] = asyncio.run(compare_extraction(rows))
+        for variant, row in report["extraction"].items():
+            if row.get("samples"):
+                print(
+                    f"{variant:9} exact {row['exact_match']:.0%}  fields {row['field_accuracy']:.0%}  "
+                    f"recall {row['name_recall']:.2f}  p50 {row['latency_ms_p50']:.0f} ms  p95 {row['latency_ms_p95']:.0f} ms"
+                )
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--synthetic", type=int, default=10, help="render this many corpus samples (default)")
+    source.add_argument("--images", help="directory of real prescription images")
+    parser.add_argument("--labels", help="JSON mapping file name -> expected medicines")
+    parser.add_argument("--max-edge", type=int, default=IMAGE_MAX_EDGE)
+    parser.add_argument("--quality", type=int, default=IMAGE_JPEG_QUALITY)
+    parser.add_argument("--color", action="store_true", help="keep colour instead of converting to grayscale")
+    parser.add_argument("--llm", action="store_true", help="compare Gemini extraction on original vs prepared images")
+    parser.add_argument("--output", help="write the report as JSON")
+    main(parser.parse_args())
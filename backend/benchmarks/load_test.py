@@ -0,0 +1,347 @@
+"""Mixed-workload load test of the API against local stand-ins, with per-endpoint latency and throughput
+
+    python benchmarks/load_test.py [--duration 30] [--concurrency 16] [--mongomock] [--output run.json]
+    python benchmarks/load_test.py --mongomock --output new.json --compare baseline.json [--tolerance 0.2]
+
+Runs the app in process (startup and shutdown included) with Gemini replaced by a fake
+model (``--gemini-latency``/``--gemini-jitter``) and openFDA by a local fake server
+(``--fda-latency``), so no API key or network access is needed. MongoDB is MONGO_URL, using
+the ``--db`` database which is dropped afterwards, or mongomock-motor with ``--mongomock``
+(whose Python-side queries dominate the read latencies; compare runs of the same kind only).
+
+``--concurrency`` virtual users each log in once, then pick operations from the weighted mix
+(``--mix login=5,chat=10,...``; see WORKLOAD) until ``--duration`` seconds have passed.
+The report gives p50/p95/p99/mean/max latency in ms, requests per second and error counts
+per operation, plus the mean time of each processing stage from the app's own metrics.
+``--compare`` prints the change against an earlier report and exits non-zero if any
+operation's p95 rose, or its throughput fell, by more than ``--tolerance``.
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+# Uploaded images go to a throwaway blob store
+os.environ.setdefault('BLOB_STORE_DIR', tempfile.mkdtemp(prefix="mediassist-load-"))
+
+import httpx  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import server  # noqa: E402
+from fakes import FakeFDAServer, FakeGeminiModel, install_fake_gemini  # noqa: E402
+from fda_client import FDAClient  # noqa: E402
+from metrics import STAGE_SECONDS  # noqa: E402
+
+# passlib logs a traceback probing newer bcrypt releases for a version attribute
+logging.getLogger("passlib").setLevel(logging.ERROR)
+
+CORPUS_FILE = Path(__file__).resolve().parent / "prescription_corpus.jsonl"
+PASSWORD = "load-test-password"
+
+# Operation -> default weight in the mix
+WORKLOAD = {
+    "login": 5,
+    "upload_image": 5,
+    "submit_text": 10,
+    "chat": 10,
+    "dashboard": 20,
+    "add_medicine": 5,
+    "list_prescriptions": 15,
+    "list_medicines": 10,
+    "list_alerts": 15,
+    "chat_sessions": 5,
+}
+
+IMAGE_REPLY = {
+    "extracted_text": "Warfarin 5mg once daily\nAspirin 81mg once daily",
+    "medicines": [
+        {"name": "Warfarin", "dosage": "5mg", "frequency": "once daily"},
+        {"name": "Aspirin", "dosage": "81mg", "frequency": "once daily"},
+    ],
+    "legibility_score": 0.9,
+    "warnings": [],
+}
+
+
+def gemini_reply(contents) -> str:
+    """What the fake model answers for each kind of prompt the app sends"""
+    if isinstance(contents, list):
+        return json.dumps(IMAGE_REPLY)
+    if contents.startswith("Extract all medicines"):
+        return json.dumps({"medicines": [{"name": "Metformin", "dosage": "500mg", "frequency": "twice daily"}]})
+    return "Take it with food and speak to your doctor if the symptoms continue."
+
+
+def make_images(count: int, seed: int) -> list:
+    """Distinct small PNG scans; repeats of the same image hit the extraction cache"""
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new("L", (320, 240), 255)
+        image.putdata([rng.choice((0, 255)) if rng.random() < 0.05 else 255 for _ in range(320 * 240)])
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def parse_mix(spec: str) -> dict:
+    mix = dict(WORKLOAD)
+    for part in filter(None, spec.split(",")):
+        name, _, weight = part.partition("=")
+        if name not in WORKLOAD:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(WORKLOAD)}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, email: str, texts: list, images: list, rng: random.Random):
+        self.client = client
+        self.email = email
+        self.texts = texts
+        self.images = images
+        self.rng = rng
+        self.headers = {}
+        self.session_id = None
+
+    async def login(self) -> httpx.Response:
+        response = await self.client.post("/api/auth/login", json={"email": self.email, "password": PASSWORD})
+        if response.status_code == 200:
+            self.headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        return response
+
+    async def upload_image(self) -> httpx.Response:
+        image = self.rng.choice(self.images)
+        return await self.client.post(
+            "/api/prescriptions/upload-image", files={"file": ("scan.png", image, "image/png")}, headers=self.headers
+        )
+
+    async def submit_text(self) -> httpx.Response:
+        text = self.rng.choice(self.texts)
+        return await self.client.post("/api/prescriptions/submit-text", json={"type": "text", "text": text}, headers=self.headers)
+
+    async def chat(self) -> httpx.Response:
+        body = {"message": "Can I take ibuprofen with my current medicines?", "session_id": self.session_id}
+        response = await self.client.post("/api/chat", json=body, headers=self.headers)
+        if response.status_code == 200:
+            self.session_id = response.json().get("session_id")
+        return response
+
+    async def dashboard(self) -> httpx.Response:
+        return await self.client.get("/api/dashboard/stats", headers=self.headers)
+
+    async def add_medicine(self) -> httpx.Response:
+        body = {
+            "name": self.rng.choice(["Metformin", "Lisinopril", "Atorvastatin", "Ibuprofen", "Amoxicillin"]),
+            "dosage": "10mg",
+            "quantity": self.rng.randint(1, 90),
+            "daily_usage": self.rng.randint(1, 3),
+            "expiry_date": f"20{self.rng.randint(26, 30)}-{self.rng.randint(1, 12):02d}-15",
+        }
+        return await self.client.post("/api/medicines", json=body, headers=self.headers)
+
+    async def list_prescriptions(self) -> httpx.Response:
+        return await self.client.get("/api/prescriptions", params={"limit": 20}, headers=self.headers)
+
+    async def list_medicines(self) -> httpx.Response:
+        return await self.client.get("/api/medicines", params={"limit": 50}, headers=self.headers)
+
+    async def list_alerts(self) -> httpx.Response:
+        return await self.client.get("/api/alerts", params={"limit": 50}, headers=self.headers)
+
+    async def chat_sessions(self) -> httpx.Response:
+        return await self.client.get("/api/chat/sessions", headers=self.headers)
+
+
+def summarize(samples: list, errors: dict, elapsed: float) -> dict:
+    row = {"requests": len(samples), "rps": len(samples) / elapsed, "errors": dict(errors)}
+    if samples:
+        ordered = sorted(samples)
+        cuts = statistics.quantiles(ordered, n=100, method="inclusive") if len(ordered) > 1 else ordered * 99
+        row.update({
+            "ms_p50": cuts[49],
+            "ms_p95": cuts[94],
+            "ms_p99": cuts[98],
+            "ms_mean": statistics.fmean(ordered),
+            "ms_max": ordered[-1],
+        })
+    return row
+
+
+def stage_means() -> dict:
+    """Mean milliseconds per processing stage, from the app's stage histogram"""
+    totals = defaultdict(dict)
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith(("_sum", "_count")):
+                totals[sample.labels["stage"]][sample.name.rsplit("_", 1)[-1]] = sample.value
+    return {
+        stage: {"count": int(values["count"]), "ms_mean": values["sum"] / values["count"] * 1000}
+        for stage, values in sorted(totals.items())
+        if values.get("count")
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=Path(__file__).parent
+        ).stdout.strip()
+    except OSError:
+        return ""
+
+
+async def run(args) -> dict:
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        server.db._client = AsyncMongoMockClient()
+    else:
+        server.db.name = args.db
+    server.password_hasher.rounds = args.bcrypt_rounds
+    install_fake_gemini(
+        server.inference,
+        FakeGeminiModel(gemini_reply, latency=args.gemini_latency, jitter=args.gemini_jitter, seed=args.seed),
+    )
+    texts = [json.loads(line)["text"] for line in CORPUS_FILE.read_text().splitlines() if line.strip()]
+    images = make_images(args.images, args.seed)
+    mix = parse_mix(args.mix)
+    operations, weights = list(mix), list(mix.values())
+
+    with FakeFDAServer(latency=args.fda_latency, seed=args.seed) as fda:
+        server.fda_client = FDAClient(base_url=fda.url)
+        await server.startup_services()
+        transport = httpx.ASGITransport(app=server.create_app())
+        samples = defaultdict(list)
+        errors = defaultdict(lambda: defaultdict(int))
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://load", timeout=60.0) as client:
+                users = []
+                for i in range(args.concurrency):
+                    email = f"load-{i}@example.com"
+                    await client.post("/api/auth/register", json={"email": email, "password": PASSWORD, "full_name": f"Load {i}"})
+                    user = VirtualUser(client, email, texts, images, random.Random(args.seed + i))
+                    await user.login()
+                    users.append(user)
+
+                deadline = time.perf_counter() + args.duration
+
+                async def drive(user: VirtualUser):
+                    while time.perf_counter() < deadline:
+                        name = user.rng.choices(operations, weights)[0]
+                        started = time.perf_counter()
+                        try:
+                            response = await getattr(user, name)()
+                            status = response.status_code
+                        except Exception as e:
+                            status = type(e).__name__
+                        samples[name].append((time.perf_counter() - started) * 1000)
+                        if status not in (200, 202):
+                            errors[name][str(status)] += 1
+
+                started = time.perf_counter()
+                await asyncio.gather(*(drive(user) for user in users))
+                elapsed = time.perf_counter() - started
+        finally:
+            if not args.mongomock:
+                await server.db.client.drop_database(args.db)
+            await server.shutdown_services()
+
+    endpoints = {name: summarize(samples[name], errors[name], elapsed) for name in operations}
+    all_samples = [ms for name in operations for ms in samples[name]]
+    return {
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "mix": mix,
+            "gemini_latency": args.gemini_latency,
+            "gemini_jitter": args.gemini_jitter,
+            "fda_latency": args.fda_latency,
+            "bcrypt_rounds": args.bcrypt_rounds,
+            "images": args.images,
+            "mongomock": args.mongomock,
+            "seed": args.seed,
+        },
+        "environment": {"python": platform.python_version(), "cpus": os.cpu_count(), "revision": git_revision()},
+        "elapsed": elapsed,
+        "total": summarize(all_samples, {k: v for name in operations for k, v in errors[name].items()}, elapsed),
+        "endpoints": endpoints,
+        "stages": stage_means(),
+    }
+
+
+def print_report(report: dict):
+    print(f"{'operation':20} {'reqs':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for name, row in [*report["endpoints"].items(), ("total", report["total"])]:
+        if not row["requests"]:
+            continue
+        print(
+            f"{name:20} {row['requests']:6} {row['rps']:8.1f} {row['ms_p50']:8.1f} {row['ms_p95']:8.1f} "
+            f"{row['ms_p99']:8.1f} {sum(row['errors'].values()):7}"
+        )
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> bool:
+    """Print the change in p95 and throughput per operation; False if any regressed past the tolerance"""
+    ok = True
+    changed = [key for key, value in report["config"].items() if baseline.get("config", {}).get(key) != value]
+    if changed:
+        print(f"\nNote: the baseline ran with different {', '.join(changed)}")
+    print(f"\n{'operation':20} {'p95 before':>11} {'after':>8} {'change':>8} {'rps before':>11} {'after':>8} {'change':>8}")
+    for name, row in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or not before.get("requests") or not row["requests"]:
+            continue
+        p95_change = row["ms_p95"] / before["ms_p95"] - 1
+        rps_change = row["rps"] / before["rps"] - 1
+        regressed = p95_change > tolerance or rps_change < -tolerance
+        ok = ok and not regressed
+        print(
+            f"{name:20} {before['ms_p95']:11.1f} {row['ms_p95']:8.1f} {p95_change:+8.0%} "
+            f"{before['rps']:11.1f} {row['rps']:8.1f} {rps_change:+8.0%}{'  REGRESSED' if regressed else ''}"
+        )
+    return ok
+
+
+def main(args) -> None:
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.compare and not compare(report, json.loads(Path(args.compare).read_text()), args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load after setup")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users issuing requests back to back")
+    parser.add_argument("--mix", default="", help="operation weights overriding the defaults, e.g. chat=0,dashboard=40")
+    parser.add_argument("--gemini-latency", type=float, default=0.5, help="fake Gemini response time in seconds")
+    parser.add_argument("--gemini-jitter", type=float, default=0.2, help="uniform +/- jitter on the Gemini latency")
+    parser.add_argument("--fda-latency", type=float, default=0.1, help="fake openFDA response time in seconds")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="bcrypt cost for the load-test users")
+    parser.add_argument("--images", type=int, default=20, help="distinct prescription images to upload")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--db", default="mediassist_load_test", help="database used, then dropped, on a real server")
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative p95/throughput regression")
+    main(parser.parse_args())
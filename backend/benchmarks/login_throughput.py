@@ -0,0 +1,85 @@
+"""Login throughput with bcrypt on the event loop versus the password worker pool
+
+    python benchmarks/login_throughput.py [--logins 64] [--rounds 12] [--executor thread|process]
+
+Each run verifies ``--logins`` passwords concurrently, as a login storm would, and
+reports logins per second alongside the longest event-loop stall seen by a 10 ms
+ticker. The pool runs are repeated for 1, 2, 4, ... workers up to the core count.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from passwords import PasswordHasher, crypt_context  # noqa: E402
+
+
+async def _ticker(stop: asyncio.Event, stalls: list):
+    interval = 0.01
+    while not stop.is_set():
+        before = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - before - interval)
+
+
+async def _measure(login, logins: int) -> dict:
+    stop = asyncio.Event()
+    stalls: list = []
+    ticker = asyncio.create_task(_ticker(stop, stalls))
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return {
+        "seconds": elapsed,
+        "logins_per_second": logins / elapsed,
+        "max_loop_stall_ms": max(stalls, default=0.0) * 1000,
+    }
+
+
+def _worker_counts(cores: int) -> list:
+    counts, n = [], 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    return counts + [cores]
+
+
+async def main(args) -> None:
+    hashed = crypt_context(args.rounds).hash("correct horse battery staple")
+
+    async def inline_login():
+        # What the handlers used to do: verify synchronously on the event loop
+        crypt_context(args.rounds).verify("correct horse battery staple", hashed)
+
+    rows = [("inline", await _measure(inline_login, args.logins))]
+    for workers in _worker_counts(os.cpu_count() or 1):
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, executor=args.executor)
+        # Warm the pool so process start-up is not counted
+        await asyncio.gather(*(hasher.verify("warmup", hashed) for _ in range(workers)))
+
+        async def pooled_login():
+            valid, _ = await hasher.verify_and_update("correct horse battery staple", hashed)
+            assert valid
+
+        rows.append((f"{args.executor} x{workers}", await _measure(pooled_login, args.logins)))
+        hasher.close()
+
+    print(f"{args.logins} concurrent logins, bcrypt cost {args.rounds}, {os.cpu_count()} cores")
+    print(f"{'mode':14} {'logins/s':>10} {'seconds':>9} {'max stall ms':>13}")
+    for mode, row in rows:
+        print(f"{mode:14} {row['logins_per_second']:10.1f} {row['seconds']:9.2f} {row['max_loop_stall_ms']:13.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--executor", choices=("thread", "process"), default="thread")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,172 @@
+"""Latency of the list endpoints GET /api/prescriptions and /api/alerts, in process
+
+    python benchmarks/read_latency.py [--docs 1000] [--limit 100] [--requests 200] [--mongomock] [--legacy-dates [--migrate]]
+
+Seeds one user's prescriptions and alerts, then times sequential requests through the ASGI
+app (no network or uvicorn in the way). It also times encoding one page on its own, both
+through the response model as the endpoints used to (ISO string fix-up, validation, JSON
+encoding) and straight from the documents with orjson, which isolates the serialisation cost
+from the database's. Documents are stored the way the API writes them;
+``--legacy-dates`` stores ``created_at`` as ISO strings instead, as releases before native
+BSON dates did, and ``--migrate`` then converts them with migrate_dates.py before timing.
+``--mongomock`` runs against mongomock-motor instead of MONGO_URL (absolute numbers then
+include mongomock's overhead). Against a real server the seeded documents go to the ``--db``
+database, which is dropped afterwards.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+
+import httpx  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+import server  # noqa: E402
+from responses import DocumentResponse  # noqa: E402
+from migrate_dates import migrate  # noqa: E402
+
+ENDPOINTS = {"/api/prescriptions": server.Prescription, "/api/alerts": server.Alert}
+
+
+def seed_documents(user_id: str, count: int, legacy_dates: bool) -> dict:
+    started = datetime.now(timezone.utc) - timedelta(days=count)
+    prescriptions, alerts = [], []
+    for i in range(count):
+        created_at = started + timedelta(hours=i)
+        prescription = server.Prescription(
+            user_id=user_id,
+            type="text",
+            original_text="Metformin 500mg twice daily\nAtorvastatin 20mg at night",
+            extracted_text="Metformin 500mg twice daily\nAtorvastatin 20mg at night",
+            medicines=[
+                {"name": "Metformin", "dosage": "500mg", "frequency": "twice daily"},
+                {"name": "Atorvastatin", "dosage": "20mg", "frequency": "at night"},
+            ],
+            verification_score=100.0,
+            status="verified",
+            timings={"local_parse": 0.1, "conflicts": 0.4, "scoring": 0.01},
+            created_at=created_at,
+        ).model_dump()
+        alert = server.Alert(
+            user_id=user_id,
+            type="expiry",
+            severity="medium",
+            title="Medicine Expiring Soon",
+            message=f"Medicine {i} expires in 12 days",
+            created_at=created_at,
+        ).model_dump()
+        for doc in (prescription, alert):
+            if legacy_dates:
+                doc["created_at"] = doc["created_at"].isoformat()
+        prescriptions.append(prescription)
+        alerts.append(alert)
+    return {"prescriptions": prescriptions, "alerts": alerts}
+
+
+async def measure(client: httpx.AsyncClient, path: str, params: dict, requests: int) -> dict:
+    for _ in range(min(10, requests)):
+        # Warm up caches and lazily created clients
+        (await client.get(path, params=params)).raise_for_status()
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = await client.get(path, params=params)
+        samples.append((time.perf_counter() - started) * 1000)
+        response.raise_for_status()
+    samples.sort()
+    return {
+        "requests": requests,
+        "items": len(response.json()),
+        "ms_p50": statistics.median(samples),
+        "ms_p95": samples[int(len(samples) * 0.95) - 1],
+        "ms_mean": statistics.fmean(samples),
+    }
+
+
+def model_encode(docs: list, adapter: TypeAdapter) -> bytes:
+    for doc in docs:
+        if isinstance(doc["created_at"], str):
+            doc["created_at"] = datetime.fromisoformat(doc["created_at"])
+    return json.dumps(adapter.dump_python(adapter.validate_python(docs), mode="json")).encode()
+
+
+def measure_encoding(docs: list, model, rounds: int) -> dict:
+    adapter = TypeAdapter(List[model])
+    timings = {}
+    for name, encode in (("model", lambda page: model_encode(page, adapter)), ("orjson", DocumentResponse(None).render)):
+        samples = []
+        for _ in range(rounds):
+            page = [dict(doc) for doc in docs]
+            started = time.perf_counter()
+            encode(page)
+            samples.append((time.perf_counter() - started) * 1000)
+        timings[f"{name}_ms_p50"] = statistics.median(samples)
+    return timings
+
+
+async def run(args) -> dict:
+    if args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        server.db._client = AsyncMongoMockClient()
+    server.db.name = args.db
+    user_id = str(uuid.uuid4())
+    for name, docs in seed_documents(user_id, args.docs, args.legacy_dates).items():
+        await server.db[name].insert_many(docs)
+    if args.migrate:
+        await migrate(server.db)
+    if not args.mongomock:
+        await server.ensure_indexes(server.db)
+
+    token = server.create_access_token({"sub": user_id})
+    transport = httpx.ASGITransport(app=server.create_app())
+    report = {"docs": args.docs, "limit": args.limit, "legacy_dates": args.legacy_dates, "migrated": args.migrate, "mongomock": args.mongomock}
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", headers={"Authorization": f"Bearer {token}"}
+        ) as client:
+            for path, model in ENDPOINTS.items():
+                report[path] = await measure(client, path, {"limit": args.limit}, args.requests)
+                collection = server.db[path.rsplit("/", 1)[-1]]
+                page = await collection.find({"user_id": user_id}, {"_id": 0}).limit(args.limit).to_list(args.limit)
+                report[path]["encode"] = measure_encoding(page, model, args.requests)
+    finally:
+        if not args.mongomock:
+            await server.db.client.drop_database(args.db)
+        server.db.close()
+    return report
+
+
+def main(args) -> None:
+    report = asyncio.run(run(args))
+    for path in ENDPOINTS:
+        row = report[path]
+        encode = row["encode"]
+        print(f"{path:20} {row['items']:4} items  p50 {row['ms_p50']:7.2f} ms  p95 {row['ms_p95']:7.2f} ms  mean {row['ms_mean']:7.2f} ms")
+        print(f"{'':20} encode one page: model {encode['model_ms_p50']:6.2f} ms  orjson {encode['orjson_ms_p50']:6.2f} ms")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=1000, help="prescriptions and alerts to seed")
+    parser.add_argument("--limit", type=int, default=100, help="page size requested")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per endpoint")
+    parser.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--legacy-dates", action="store_true", help="store created_at as ISO strings")
+    parser.add_argument("--migrate", action="store_true", help="run the date migration after seeding")
+    parser.add_argument("--db", default="mediassist_read_bench", help="database seeded on a real server")
+    parser.add_argument("--output", help="write the report as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,102 @@
+"""Cold-start time of the API: module import, and optionally time until the first response
+
+    python benchmarks/startup_time.py [--runs 5] [--serve] [--workers 1]
+
+Every run uses a fresh interpreter. The import run also lists which heavy modules the
+import pulled in. ``--serve`` starts uvicorn (``--workers N``) and polls /openapi.json until
+it answers; the lifespan creates indexes first, so it needs MONGO_URL to be reachable.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ["google.generativeai", "motor.motor_asyncio", "PIL.Image", "passlib.context", "httpx"]
+
+IMPORT_PROBE = f"""
+import json, sys, time
+started = time.perf_counter()
+import server
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+    "mongo_client_created": server.db._client is not None,
+}}))
+"""
+
+
+def measure_import() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_serve(workers: int, timeout: float = 60.0) -> float:
+    port = _free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=os.environ.copy(),
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup (is MongoDB reachable?)")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/openapi.json", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"No response within {timeout}s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main(args) -> None:
+    runs = [measure_import() for _ in range(args.runs)]
+    seconds = [r["seconds"] for r in runs]
+    report = {
+        "import_seconds_median": statistics.median(seconds),
+        "import_seconds_min": min(seconds),
+        "loaded_at_import": runs[-1]["loaded"],
+        "mongo_client_created_at_import": runs[-1]["mongo_client_created"],
+    }
+    print(f"import server: median {report['import_seconds_median'] * 1000:.0f} ms, min {report['import_seconds_min'] * 1000:.0f} ms over {args.runs} runs")
+    print(f"heavy modules loaded at import: {', '.join(report['loaded_at_import']) or 'none'}")
+    print(f"Mongo client created at import: {report['mongo_client_created_at_import']}")
+
+    if args.serve:
+        serve = [measure_serve(args.workers) for _ in range(args.runs)]
+        report["first_response_seconds_median"] = statistics.median(serve)
+        report["workers"] = args.workers
+        print(f"first response with {args.workers} worker(s): median {report['first_response_seconds_median'] * 1000:.0f} ms")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--serve", action="store_true", help="also time uvicorn until its first response")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="write the report as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,144 @@
+"""Accuracy and latency of the local prescription parser versus Gemini on a labelled corpus
+
+    python benchmarks/text_parser.py [--corpus benchmarks/prescription_corpus.jsonl] [--llm]
+
+The local parser always runs. ``--llm`` also sends every sample to the text extraction
+model (needs GEMINI_API_KEY) and reports the hybrid route the API takes: local results at
+or above LOCAL_PARSER_THRESHOLD, Gemini for the rest.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv  # noqa: E402
+
+load_dotenv(Path(__file__).resolve().parent.parent / '.env')
+
+from interactions import normalize_drug_name  # noqa: E402
+from local_parser import (  # noqa: E402
+    DRUG_LEXICON_FILE, DrugLexicon, LocalPrescriptionParser, normalize_dosage, normalize_frequency
+)
+
+DEFAULT_CORPUS = Path(__file__).resolve().parent / 'prescription_corpus.jsonl'
+
+
+def _canonical(lexicon: DrugLexicon, name: str) -> str:
+    spans = lexicon.find(name or "")
+    return spans[0][2] if spans else normalize_drug_name(name or "")
+
+
+def score_sample(lexicon: DrugLexicon, predicted: list, expected: list) -> dict:
+    want = {_canonical(lexicon, m["name"]): m for m in expected}
+    got = {_canonical(lexicon, m.get("name", "")): m for m in predicted}
+    matched = want.keys() & got.keys()
+    fields = 0
+    for name in matched:
+        fields += normalize_dosage(got[name].get("dosage", "")) == normalize_dosage(want[name].get("dosage", ""))
+        fields += normalize_frequency(got[name].get("frequency", "")) == normalize_frequency(want[name].get("frequency", ""))
+    return {
+        "expected": len(want),
+        "predicted": len(got),
+        "matched": len(matched),
+        "fields_correct": fields,
+        "fields_total": 2 * len(matched),
+        "exact": matched == want.keys() == got.keys() and fields == 2 * len(matched),
+    }
+
+
+def summarize(rows: list) -> dict:
+    if not rows:
+        return {"samples": 0}
+    total = lambda key: sum(r[key] for r in rows)  # noqa: E731
+    latencies = sorted(r["ms"] for r in rows)
+    return {
+        "samples": len(rows),
+        "exact_match": total("exact") / len(rows),
+        "name_precision": total("matched") / max(total("predicted"), 1),
+        "name_recall": total("matched") / max(total("expected"), 1),
+        "field_accuracy": total("fields_correct") / max(total("fields_total"), 1),
+        "latency_ms_p50": statistics.median(latencies),
+        "latency_ms_p95": latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+
+async def run_llm(samples: list) -> list:
+    from extraction import MEDICINES_SCHEMA, TEXT_EXTRACTION_PROMPT, json_output, parse_medicines
+    from inference import GeminiInference
+
+    inference = GeminiInference(os.environ.get('GEMINI_API_KEY', ''))
+    results = []
+    for sample in samples:
+        started = time.perf_counter()
+        try:
+            response = await inference.generate(
+                'gemini-2.5-flash',
+                TEXT_EXTRACTION_PROMPT.format(text=sample["text"]),
+                generation_config=json_output(MEDICINES_SCHEMA),
+            )
+            medicines = parse_medicines(response.text)
+        except Exception as e:
+            print(f"LLM error on {sample['text'][:40]!r}: {e}", file=sys.stderr)
+            medicines = []
+        results.append((medicines, (time.perf_counter() - started) * 1000))
+    return results
+
+
+def main(args) -> None:
+    samples = [json.loads(line) for line in Path(args.corpus).read_text(encoding="utf-8").splitlines() if line.strip()]
+    lexicon = DrugLexicon.load(DRUG_LEXICON_FILE)
+    parser = LocalPrescriptionParser(lexicon)
+
+    local_rows, accepted_rows, local_results = [], [], []
+    for sample in samples:
+        started = time.perf_counter()
+        result = parser.parse(sample["text"])
+        ms = (time.perf_counter() - started) * 1000
+        row = {**score_sample(lexicon, result.medicines, sample["medicines"]), "ms": ms}
+        local_rows.append(row)
+        local_results.append(result)
+        if parser.accepts(result):
+            accepted_rows.append(row)
+
+    report = {
+        "threshold": parser.threshold,
+        "local_all": summarize(local_rows),
+        "local_accepted": {**summarize(accepted_rows), "acceptance_rate": len(accepted_rows) / len(samples)},
+    }
+
+    if args.llm:
+        llm_rows, hybrid_rows = [], []
+        for sample, result, local_row, (medicines, ms) in zip(samples, local_results, local_rows, asyncio.run(run_llm(samples))):
+            llm_row = {**score_sample(lexicon, medicines, sample["medicines"]), "ms": ms}
+            llm_rows.append(llm_row)
+            # The API pays for the local parse before falling back
+            hybrid_rows.append(local_row if parser.accepts(result) else {**llm_row, "ms": ms + local_row["ms"]})
+        report["llm"] = summarize(llm_rows)
+        report["hybrid"] = summarize(hybrid_rows)
+
+    print(f"{len(samples)} samples, {len(lexicon)} lexicon names, threshold {parser.threshold}")
+    print(f"{'path':16} {'n':>4} {'exact':>7} {'prec':>6} {'recall':>7} {'fields':>7} {'p50 ms':>9} {'p95 ms':>9}")
+    for path, row in report.items():
+        if not isinstance(row, dict) or not row.get("samples"):
+            continue
+        print(
+            f"{path:16} {row['samples']:4d} {row['exact_match']:7.2%} {row['name_precision']:6.2f} "
+            f"{row['name_recall']:7.2f} {row['field_accuracy']:7.2%} {row['latency_ms_p50']:9.3f} {row['latency_ms_p95']:9.3f}"
+        )
+    print(f"local acceptance rate: {report['local_accepted']['acceptance_rate']:.0%}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS))
+    parser.add_argument("--llm", action="store_true", help="also run the Gemini path (needs GEMINI_API_KEY)")
+    parser.add_argument("--output", help="write the report as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,145 @@
+import hashlib
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Optional, Tuple
+
+import anyio
+
+BLOB_STORE_DIR = os.environ.get('BLOB_STORE_DIR', str(Path(__file__).parent / 'blob_store'))
+BLOB_CHUNK_SIZE = int(os.environ.get('BLOB_CHUNK_SIZE', str(64 * 1024)))
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range ``Range`` header into an inclusive (start, end) pair
+
+    Returns None when the header is absent or not a single byte range, in which case
+    the whole body is served.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, end
+
+
+class BlobWriter:
+    """Incremental blob writer that hashes while streaming to a temp file"""
+
+    def __init__(self, store: "BlobStore"):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = None
+        self._tmp_path: Optional[str] = None
+
+    async def _open(self):
+        await anyio.Path(self.store.root).mkdir(parents=True, exist_ok=True)
+        fd, self._tmp_path = await anyio.to_thread.run_sync(
+            lambda: tempfile.mkstemp(dir=self.store.root, prefix=".tmp-")
+        )
+        self._file = await anyio.open_file(fd, "wb")
+
+    async def write(self, chunk: bytes):
+        if self._file is None:
+            await self._open()
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        await self._file.write(chunk)
+
+    async def commit(self) -> str:
+        """Move the temp file to its content address and return the digest"""
+        if self._file is None:
+            await self._open()
+        await self._file.aclose()
+        digest = self._hash.hexdigest()
+        path = self.store.path_for(digest)
+        await anyio.Path(path.parent).mkdir(parents=True, exist_ok=True)
+        await anyio.to_thread.run_sync(os.replace, self._tmp_path, path)
+        self._tmp_path = None
+        return digest
+
+    async def abort(self):
+        if self._file is not None:
+            await self._file.aclose()
+        if self._tmp_path is not None:
+            await anyio.Path(self._tmp_path).unlink(missing_ok=True)
+            self._tmp_path = None
+
+
+class BlobStore:
+    """Content-addressed on-disk blob store; blobs are named by the SHA-256 of their bytes"""
+
+    def __init__(self, root: str = BLOB_STORE_DIR, chunk_size: int = BLOB_CHUNK_SIZE):
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+
+    def path_for(self, digest: str) -> Path:
+        # Two levels of fan-out keep directories small
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def _write(self, data: bytes, digest: str):
+        path = self.path_for(digest)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    async def put(self, data: bytes) -> str:
+        """Store bytes and return their SHA-256 digest; identical content is stored once"""
+        digest = hashlib.sha256(data).hexdigest()
+        await anyio.to_thread.run_sync(self._write, data, digest)
+        return digest
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    async def read(self, digest: str) -> bytes:
+        return await anyio.Path(self.path_for(digest)).read_bytes()
+
+    async def size(self, digest: str) -> Optional[int]:
+        try:
+            stat = await anyio.Path(self.path_for(digest)).stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_size
+
+    async def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the blob from ``start`` to ``end`` (inclusive) in chunks"""
+        async with await anyio.open_file(self.path_for(digest), "rb") as f:
+            await f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = await f.read(self.chunk_size if remaining is None else min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
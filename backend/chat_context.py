@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+CHAT_CONTEXT_TOKENS = int(os.environ.get('CHAT_CONTEXT_TOKENS', '1500'))
+CHAT_SUMMARY_WORDS = int(os.environ.get('CHAT_SUMMARY_WORDS', '150'))
+CHAT_HISTORY_LIMIT = int(os.environ.get('CHAT_HISTORY_LIMIT', '50'))
+
+ROLE_LABELS = {"user": "User", "assistant": "Assistant"}
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a patient and MediAssist, a health assistant.
+Keep symptoms, medications, allergies, advice already given and open questions. Reply with the summary only, in under {words} words.
+
+Current summary: {summary}
+
+New turns:
+{turns}"""
+
+
+def estimate_tokens(text: str) -> int:
+    # About four characters per token for English text; close enough for budgeting
+    return len(text) // 4 + 1
+
+
+def format_turn(message: dict) -> str:
+    return f"{ROLE_LABELS.get(message['role'], message['role'])}: {message['content']}"
+
+
+class ChatContext(NamedTuple):
+    summary: str
+    recent: List[dict]
+    # Turns past the budget that still need folding into the summary
+    spilled: List[dict]
+    summary_until: Optional[datetime]
+
+    def render(self) -> str:
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        if self.recent:
+            parts.append("Recent conversation:\n" + "\n".join(format_turn(m) for m in self.recent))
+        return "\n\n".join(parts)
+
+
+def split_by_budget(messages: List[dict], budget: int, keep_ratio: float = 0.5) -> Tuple[List[dict], List[dict]]:
+    """Split oldest-first turns into (recent, spilled)
+
+    Recent is the newest run of turns that fits the budget. Once anything spills, the fold
+    also takes turns beyond ``keep_ratio`` of the budget, so the summary is recomputed every
+    few turns rather than on every one.
+    """
+    used = 0
+    start = len(messages)
+    for i in range(len(messages) - 1, -1, -1):
+        used += estimate_tokens(format_turn(messages[i]))
+        if used > budget:
+            break
+        start = i
+    if start == 0:
+        return messages, []
+    recent = messages[start:]
+    used = 0
+    keep = len(messages)
+    for i in range(len(messages) - 1, start - 1, -1):
+        used += estimate_tokens(format_turn(messages[i]))
+        if used > budget * keep_ratio:
+            break
+        keep = i
+    return recent, messages[:keep]
+
+
+class ChatContextBuilder:
+    """Builds chat prompts from recent turns within a token budget plus a rolling summary
+
+    The summary lives on the session's chat_sessions document together with the timestamp
+    of the last turn folded into it, so only turns after that point are ever loaded.
+    """
+
+    def __init__(
+        self,
+        messages,
+        sessions,
+        summarize: Callable[[str], Awaitable[str]],
+        budget: int = CHAT_CONTEXT_TOKENS,
+        history_limit: int = CHAT_HISTORY_LIMIT,
+        summary_words: int = CHAT_SUMMARY_WORDS,
+    ):
+        self.messages = messages
+        self.sessions = sessions
+        self.summarize = summarize
+        self.budget = budget
+        self.history_limit = history_limit
+        self.summary_words = summary_words
+        self._refreshing: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def build(self, user_id: str, session_id: str) -> ChatContext:
+        session = await self.sessions.find_one(
+            {"user_id": user_id, "session_id": session_id},
+            {"_id": 0, "summary": 1, "summary_until": 1},
+        ) or {}
+        summary_until = session.get("summary_until")
+        query = {"user_id": user_id, "session_id": session_id}
+        if summary_until:
+            query["timestamp"] = {"$gt": summary_until}
+        tail = await self.messages.find(
+            query, {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", -1).to_list(self.history_limit)
+        tail.reverse()
+        recent, spilled = split_by_budget(tail, self.budget)
+        context = ChatContext(session.get("summary", ""), recent, spilled, summary_until)
+        if spilled:
+            self._schedule_refresh(user_id, session_id, context)
+        return context
+
+    def _schedule_refresh(self, user_id: str, session_id: str, context: ChatContext):
+        key = (user_id, session_id)
+        if key in self._refreshing:
+            return
+        task = asyncio.create_task(self._refresh(user_id, session_id, context))
+        self._refreshing[key] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(key, None))
+
+    async def _refresh(self, user_id: str, session_id: str, context: ChatContext):
+        """Fold the spilled turns into the stored summary off the request path"""
+        prompt = SUMMARY_PROMPT.format(
+            words=self.summary_words,
+            summary=context.summary or "(none yet)",
+            turns="\n".join(format_turn(m) for m in context.spilled),
+        )
+        try:
+            summary = (await self.summarize(prompt)).strip()
+            # Conditional on summary_until so a concurrent refresh elsewhere is not overwritten
+            await self.sessions.update_one(
+                {"user_id": user_id, "session_id": session_id, "summary_until": context.summary_until},
+                {"$set": {"summary": summary, "summary_until": context.spilled[-1]["timestamp"]}},
+            )
+        except Exception as e:
+            logging.warning(f"Chat summary refresh failed for session {session_id}: {str(e)}")
+
+    async def close(self):
+        tasks = list(self._refreshing.values())
+        await asyncio.gather(*tasks, return_exceptions=True)
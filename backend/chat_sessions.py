@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from pymongo import DESCENDING
+
+from pagination import fetch_page
+
+SESSION_PREVIEW_CHARS = 50
+
+
+class ChatSessions:
+    """One summary document per chat session, upserted with every message written
+
+    Listing sessions reads this collection through its (user_id, last_timestamp) index
+    instead of grouping the user's whole message history.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def record(self, message: dict):
+        """Fold a stored chat message into its session summary in one atomic upsert"""
+        await self.collection.update_one(
+            {"user_id": message["user_id"], "session_id": message["session_id"]},
+            {
+                "$set": {
+                    "last_message": message["content"][:SESSION_PREVIEW_CHARS],
+                    "last_role": message["role"],
+                    "last_timestamp": message["timestamp"],
+                },
+                "$inc": {"message_count": 1},
+                # The session ID doubles as the pagination tie-breaker
+                "$setOnInsert": {"id": message["session_id"], "created_at": message["timestamp"]},
+            },
+            upsert=True,
+        )
+
+    async def get(self, user_id: str, session_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"user_id": user_id, "session_id": session_id}, {"_id": 0})
+
+    async def page(self, user_id: str, limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """Most recently active sessions first"""
+        return await fetch_page(
+            self.collection,
+            {"user_id": user_id},
+            "last_timestamp",
+            DESCENDING,
+            limit,
+            cursor,
+            {"_id": 0, "id": 1, "session_id": 1, "last_message": 1, "last_timestamp": 1, "message_count": 1},
+        )
+
+
+async def rebuild(db):
+    """Recreate every session summary from chat_messages (one-off backfill)"""
+    await db.chat_messages.aggregate([
+        {"$sort": {"timestamp": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "session_id": "$session_id"},
+            "last_message": {"$last": {"$substrCP": ["$content", 0, SESSION_PREVIEW_CHARS]}},
+            "last_role": {"$last": "$role"},
+            "last_timestamp": {"$last": "$timestamp"},
+            "created_at": {"$first": "$timestamp"},
+            "message_count": {"$sum": 1},
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "session_id": "$_id.session_id",
+            "id": "$_id.session_id",
+            "last_message": 1,
+            "last_role": 1,
+            "last_timestamp": 1,
+            "created_at": 1,
+            "message_count": 1,
+        }},
+        {"$merge": {"into": "chat_sessions", "on": ["user_id", "session_id"], "whenMatched": "merge", "whenNotMatched": "insert"}},
+    ]).to_list(None)
+
+
+async def _main() -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'mediassist_db')]
+    from indexes import INDEXES, ensure_indexes
+    # $merge needs the unique (user_id, session_id) index in place
+    await ensure_indexes(db, [spec for spec in INDEXES if spec.collection == "chat_sessions"])
+    await rebuild(db)
+    print(f"Rebuilt {await db.chat_sessions.count_documents({})} chat session summaries")
+    client.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # python chat_sessions.py
+    sys.exit(asyncio.run(_main()))
@@ -0,0 +1,91 @@
+import os
+from typing import Optional, Sequence
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+DB_NAME = os.environ.get('DB_NAME', 'mediassist_db')
+# Per worker process: a deployment opens up to workers x MONGO_MAX_POOL_SIZE connections
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '50'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_MS = int(os.environ.get('MONGO_MAX_IDLE_MS', '60000'))
+MONGO_TIMEOUT_MS = int(os.environ.get('MONGO_TIMEOUT_MS', '5000'))
+
+
+class LazyCollection:
+    """Stands in for a Motor collection until the first operation is called on it"""
+
+    def __init__(self, database: "LazyDatabase", name: str):
+        self._database = database
+        self._name = name
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def collection(self):
+        return self._database.database[self._name]
+
+    def __getattr__(self, attr):
+        return getattr(self.collection, attr)
+
+    def __repr__(self) -> str:
+        return f"LazyCollection({self._name!r})"
+
+
+class LazyDatabase:
+    """Motor database whose client, and its connection pool, is created on first use
+
+    Importing the app therefore opens no sockets and starts no monitor threads, and each
+    worker process builds its own pool sized by MONGO_MAX_POOL_SIZE.
+    """
+
+    def __init__(
+        self,
+        url: str = MONGO_URL,
+        name: str = DB_NAME,
+        max_pool_size: int = MONGO_MAX_POOL_SIZE,
+        min_pool_size: int = MONGO_MIN_POOL_SIZE,
+        max_idle_ms: int = MONGO_MAX_IDLE_MS,
+        timeout_ms: int = MONGO_TIMEOUT_MS,
+        event_listeners: Sequence = (),
+    ):
+        self.url = url
+        self.name = name
+        self.options = {
+            "maxPoolSize": max_pool_size,
+            "minPoolSize": min_pool_size,
+            "maxIdleTimeMS": max_idle_ms,
+            "serverSelectionTimeoutMS": timeout_ms,
+            # Stored dates are UTC; read them back as aware datetimes
+            "tz_aware": True,
+            "event_listeners": list(event_listeners),
+        }
+        self._client: Optional[AsyncIOMotorClient] = None
+
+    @property
+    def client(self) -> AsyncIOMotorClient:
+        if self._client is None:
+            self._client = AsyncIOMotorClient(self.url, **self.options)
+        return self._client
+
+    @property
+    def database(self):
+        return self.client[self.name]
+
+    def __getattr__(self, name: str) -> LazyCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return LazyCollection(self, name)
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        return LazyCollection(self, name)
+
+    async def command(self, *args, **kwargs):
+        return await self.database.command(*args, **kwargs)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
@@ -0,0 +1,101 @@
+import json
+import os
+import re
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, ValidationError
+
+# "single": one schema-constrained call reads the image and lists the medicines
+# "two_pass": OCR call, then a separate text extraction call (the original pipeline)
+EXTRACTION_MODE = os.environ.get('EXTRACTION_MODE', 'single').lower()
+
+_MEDICINE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "dosage": {"type": "string"},
+        "frequency": {"type": "string"},
+    },
+    "required": ["name"],
+}
+
+PRESCRIPTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "extracted_text": {"type": "string"},
+        "medicines": {"type": "array", "items": _MEDICINE_SCHEMA},
+        "legibility_score": {"type": "number"},
+        "warnings": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["extracted_text", "medicines", "legibility_score"],
+}
+
+MEDICINES_SCHEMA = {
+    "type": "object",
+    "properties": {"medicines": {"type": "array", "items": _MEDICINE_SCHEMA}},
+    "required": ["medicines"],
+}
+
+IMAGE_EXTRACTION_PROMPT = (
+    "Read this prescription image. Return the complete text in extracted_text, every prescribed "
+    "medicine with its dosage and frequency in medicines, a legibility_score from 0.0 to 1.0, "
+    "and any concerns about the prescription in warnings."
+)
+
+TEXT_EXTRACTION_PROMPT = "Extract all medicines from the following prescription text, with dosage and frequency.\nPrescription: {text}"
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*\n?(.*?)\n?\s*```$", re.DOTALL)
+
+
+class ExtractedMedicine(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    name: str
+    dosage: str = ""
+    frequency: str = ""
+
+
+class PrescriptionExtraction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    extracted_text: str = ""
+    medicines: List[ExtractedMedicine] = []
+    legibility_score: float = 0.7
+    warnings: List[str] = []
+
+
+class MedicineExtraction(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    medicines: List[ExtractedMedicine] = []
+
+
+def json_output(schema: dict) -> dict:
+    """generation_config constraining a Gemini response to JSON matching ``schema``"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+
+def parse_json_response(text: str) -> dict:
+    """Decode a model's JSON reply, allowing for a surrounding markdown code fence
+
+    Raises ValueError unless the payload is a JSON object.
+    """
+    text = (text or "").strip()
+    match = _FENCE.match(text)
+    if match:
+        text = match.group(1).strip()
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object")
+    return data
+
+
+def parse_prescription(text: str) -> dict:
+    try:
+        return PrescriptionExtraction.model_validate(parse_json_response(text)).model_dump()
+    except ValidationError as e:
+        raise ValueError(str(e))
+
+
+def parse_medicines(text: str) -> List[dict]:
+    try:
+        return MedicineExtraction.model_validate(parse_json_response(text)).model_dump()["medicines"]
+    except ValidationError as e:
+        raise ValueError(str(e))
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import os
+from typing import Dict, List, Optional
+
+import httpx
+from cachetools import TTLCache
+
+from resilience import AdaptiveLimiter, CircuitBreaker, DependencyGuard, DependencyUnavailable
+
+FDA_BASE_URL = os.environ.get('FDA_BASE_URL', 'https://api.fda.gov')
+FDA_TIMEOUT = float(os.environ.get('FDA_TIMEOUT', '5'))
+FDA_DEADLINE = float(os.environ.get('FDA_DEADLINE', '6'))
+FDA_MAX_CONNECTIONS = int(os.environ.get('FDA_MAX_CONNECTIONS', '20'))
+FDA_MAX_LOOKUPS = int(os.environ.get('FDA_MAX_LOOKUPS', '3'))
+FDA_CACHE_SIZE = int(os.environ.get('FDA_CACHE_SIZE', '4096'))
+FDA_CACHE_TTL = float(os.environ.get('FDA_CACHE_TTL', '86400'))
+FDA_MAX_QUEUE = int(os.environ.get('FDA_MAX_QUEUE', '64'))
+FDA_BREAKER_FAILURE_RATE = float(os.environ.get('FDA_BREAKER_FAILURE_RATE', '0.5'))
+FDA_BREAKER_OPEN_SECONDS = float(os.environ.get('FDA_BREAKER_OPEN_SECONDS', '60'))
+
+_MISSING = object()
+
+
+def fda_guard(max_connections: int = FDA_MAX_CONNECTIONS, timeout: float = FDA_TIMEOUT) -> DependencyGuard:
+    return DependencyGuard(
+        CircuitBreaker(
+            "fda",
+            failure_rate=FDA_BREAKER_FAILURE_RATE,
+            slow_call_seconds=timeout * 0.8,
+            open_seconds=FDA_BREAKER_OPEN_SECONDS,
+        ),
+        AdaptiveLimiter(
+            "fda",
+            max_limit=max_connections,
+            target_latency=timeout / 2,
+            max_queue=FDA_MAX_QUEUE,
+            queue_timeout=FDA_DEADLINE,
+        ),
+    )
+
+
+class FDAClient:
+    """Async openFDA drug label client with a shared pool and per-drug TTL/LRU cache
+
+    Lookups go through a circuit breaker and adaptive concurrency limit; while the
+    circuit is open, interaction checks skip openFDA and rely on the local dataset.
+    """
+
+    def __init__(
+        self,
+        base_url: str = FDA_BASE_URL,
+        timeout: float = FDA_TIMEOUT,
+        max_connections: int = FDA_MAX_CONNECTIONS,
+        cache_size: int = FDA_CACHE_SIZE,
+        cache_ttl: float = FDA_CACHE_TTL,
+        guard: Optional[DependencyGuard] = None,
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client: Optional[httpx.AsyncClient] = None
+        # Negative results are cached too (as None) so unknown names stay off the network
+        self._cache: TTLCache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.guard = guard or fda_guard(max_connections, timeout)
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _fetch_label(self, brand_name: str) -> Optional[dict]:
+        async with self.guard.call():
+            response = await self.client.get(
+                "/drug/label.json",
+                params={"search": f"openfda.brand_name:{brand_name}", "limit": 1},
+            )
+            if response.status_code == 404:
+                # openFDA answers 404 when the search has no matches
+                return None
+            response.raise_for_status()
+        results = response.json().get('results') or []
+        return results[0] if results else None
+
+    async def get_label(self, brand_name: str) -> Optional[dict]:
+        """Return the first drug label for a brand name, served from cache when possible"""
+        key = brand_name.lower().strip()
+        # A single lookup, since an entry can expire between a membership test and the read
+        cached = self._cache.get(key, _MISSING)
+        if cached is not _MISSING:
+            return cached
+
+        # Coalesce concurrent lookups of the same name onto a single request
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            label = await self._fetch_label(key)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so an unawaited failure does not log a warning
+            future.exception()
+            raise
+        else:
+            self._cache[key] = label
+            future.set_result(label)
+            return label
+        finally:
+            if not future.done():
+                # The owning lookup was cancelled; release anyone waiting on it
+                future.cancel()
+            self._inflight.pop(key, None)
+
+    async def find_interactions(
+        self,
+        medicines: List[str],
+        deadline: float = FDA_DEADLINE,
+        max_lookups: int = FDA_MAX_LOOKUPS,
+    ) -> List[dict]:
+        """Look up labels concurrently and return conflicts for those listing drug interactions"""
+        names = list(dict.fromkeys(med for med in medicines if med and med.strip()))[:max_lookups]
+        if not names:
+            return []
+        if not self.guard.available():
+            logging.warning("FDA circuit open; skipping label lookups")
+            return []
+
+        tasks = [asyncio.ensure_future(self.get_label(name)) for name in names]
+        done, not_done = await asyncio.wait(tasks, timeout=deadline)
+        for task in not_done:
+            task.cancel()
+        if not_done:
+            logging.warning(f"FDA API deadline exceeded for {len(not_done)} of {len(names)} lookups")
+
+        conflicts = []
+        for name, task in zip(names, tasks):
+            if task not in done or task.cancelled():
+                continue
+            error = task.exception()
+            if error is not None:
+                if not isinstance(error, DependencyUnavailable):
+                    logging.warning(f"FDA API error: {str(error)}")
+                continue
+            label = task.result()
+            if label and 'drug_interactions' in label:
+                conflicts.append({
+                    "drug1": name,
+                    "drug2": "multiple",
+                    "severity": "medium",
+                    "description": label['drug_interactions'][0][:200] if label['drug_interactions'] else "",
+                    "source": "fda_api"
+                })
+        return conflicts
+
+    def cache_info(self) -> dict:
+        return {
+            "size": len(self._cache),
+            "maxsize": self._cache.maxsize,
+            "inflight": len(self._inflight),
+            **self.guard.stats(),
+        }
@@ -0,0 +1,34 @@
+"""gunicorn settings for running the API with uvicorn workers
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Each worker is a separate process with its own event loop, Mongo pool, HTTP client and
+Gemini concurrency limit, so per-process limits multiply by WEB_CONCURRENCY. Without
+gunicorn, ``uvicorn server:app --workers N`` runs the same app.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8001')}")
+worker_class = "uvicorn.workers.UvicornWorker"
+# I/O-bound async workers: one per core; CPU work (bcrypt, images) already runs on pools
+workers = int(os.environ.get('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+# Import the app in each worker, after the fork, so no client or pool is shared across processes
+preload_app = False
+timeout = int(os.environ.get('WORKER_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('KEEPALIVE', '5'))
+# Recycle workers periodically to bound memory growth; jitter avoids restarting them together
+max_requests = int(os.environ.get('MAX_REQUESTS', '10000'))
+max_requests_jitter = int(os.environ.get('MAX_REQUESTS_JITTER', '1000'))
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def child_exit(server, worker):
+    # Per prometheus_client's multiprocess mode: clean up after a worker that exited
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from PIL import Image, ImageOps
+
+IMAGE_PREPROCESS = os.environ.get('IMAGE_PREPROCESS', 'true').lower() in ('1', 'true', 'yes')
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '1600'))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '80'))
+IMAGE_GRAYSCALE = os.environ.get('IMAGE_GRAYSCALE', 'true').lower() in ('1', 'true', 'yes')
+IMAGE_PREPROCESS_WORKERS = int(os.environ.get('IMAGE_PREPROCESS_WORKERS', str(os.cpu_count() or 1)))
+IMAGE_PREPROCESS_EXECUTOR = os.environ.get('IMAGE_PREPROCESS_EXECUTOR', 'process').lower()
+# Hashes at most this many bits apart are treated as the same scan
+IMAGE_DUPLICATE_DISTANCE = int(os.environ.get('IMAGE_DUPLICATE_DISTANCE', '6'))
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    phash: Optional[str]
+    original_size: int
+
+
+def difference_hash(image: Image.Image, size: int = 8) -> str:
+    """64-bit dHash as 16 hex digits: each bit says whether a pixel is brighter than its right neighbour
+
+    Stable under rescaling, recompression and small exposure changes, so re-uploads of the
+    same sheet land within a few bits of each other.
+    """
+    pixels = list(image.convert("L").resize((size + 1, size), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:0{size * size // 4}x}"
+
+
+def hash_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def prepare_image(
+    data: bytes,
+    mime_type: str,
+    max_edge: int = IMAGE_MAX_EDGE,
+    quality: int = IMAGE_JPEG_QUALITY,
+    grayscale: bool = IMAGE_GRAYSCALE,
+) -> PreparedImage:
+    """Decode, auto-orient, downscale, optionally grayscale and re-encode an image as JPEG
+
+    Formats Pillow cannot decode (HEIC without a plugin) are passed through unchanged.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            phash = difference_hash(image)
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            image = image.convert("L" if grayscale else "RGB")
+            out = io.BytesIO()
+            image.save(out, format="JPEG", quality=quality, optimize=True)
+            return PreparedImage(out.getvalue(), "image/jpeg", image.width, image.height, phash, len(data))
+    except (OSError, ValueError) as e:
+        logging.info(f"Image preprocessing skipped: {str(e)}")
+        return PreparedImage(data, mime_type, 0, 0, None, len(data))
+
+
+class ImagePreprocessor:
+    """Runs prepare_image on a worker pool so decoding and resizing never block the event loop"""
+
+    def __init__(
+        self,
+        enabled: bool = IMAGE_PREPROCESS,
+        max_edge: int = IMAGE_MAX_EDGE,
+        quality: int = IMAGE_JPEG_QUALITY,
+        grayscale: bool = IMAGE_GRAYSCALE,
+        workers: int = IMAGE_PREPROCESS_WORKERS,
+        executor: str = IMAGE_PREPROCESS_EXECUTOR,
+    ):
+        self.enabled = enabled
+        self.max_edge = max_edge
+        self.quality = quality
+        self.grayscale = grayscale
+        self.workers = workers
+        self.executor_kind = executor
+        self._executor: Optional[Executor] = None
+
+    @property
+    def signature(self) -> str:
+        """Identifies the settings, so cached model results are keyed by what the model saw"""
+        if not self.enabled:
+            return "raw"
+        return f"{self.max_edge}-q{self.quality}{'-gray' if self.grayscale else ''}"
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        return self._executor
+
+    async def prepare(self, data: bytes, mime_type: str) -> PreparedImage:
+        if not self.enabled:
+            return PreparedImage(data, mime_type, 0, 0, None, len(data))
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, prepare_image, data, mime_type, self.max_edge, self.quality, self.grayscale
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+from jobs import CLAIM_SORT, claim_filter, dead_lease_filter
+from pagination import encode_cursor, keyset_filter, keyset_sort
+from result_cache import LLM_CACHE_TTL
+
+INDEX_CHECK_ON_STARTUP = os.environ.get('INDEX_CHECK_ON_STARTUP', '').lower() in ('1', 'true', 'yes')
+
+
+class IndexSpec(NamedTuple):
+    collection: str
+    keys: list
+    options: dict = {}
+
+
+class QueryShape(NamedTuple):
+    name: str
+    collection: str
+    filter: dict
+    sort: Optional[list] = None
+
+
+# Every index the API relies on; created idempotently at startup
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", [("email", ASCENDING)], {"unique": True}),
+    IndexSpec("users", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("prescriptions", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("prescriptions", [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("medicines", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("medicines", [("user_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    IndexSpec("medicines", [("expiry_date", ASCENDING)]),
+    IndexSpec("medicines", [("runout_date", ASCENDING)]),
+    IndexSpec("chat_messages", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("chat_messages", [("user_id", ASCENDING), ("session_id", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)]),
+    IndexSpec("chat_sessions", [("user_id", ASCENDING), ("session_id", ASCENDING)], {"unique": True}),
+    IndexSpec("chat_sessions", [("user_id", ASCENDING), ("last_timestamp", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("alerts", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("alerts", [("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    IndexSpec("alerts", [("user_id", ASCENDING), ("is_read", ASCENDING)]),
+    IndexSpec("user_stats", [("user_id", ASCENDING)], {"unique": True}),
+    IndexSpec("alert_sweeps", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("active_drugs", [("user_id", ASCENDING), ("drug", ASCENDING)], {"unique": True}),
+    IndexSpec("active_drugs", [("user_id", ASCENDING), ("sources", ASCENDING)]),
+    IndexSpec("llm_result_cache", [("created_at", ASCENDING)], {"expireAfterSeconds": LLM_CACHE_TTL}),
+    IndexSpec("prescription_jobs", [("id", ASCENDING)], {"unique": True}),
+    IndexSpec("prescription_jobs", [("idempotency_key", ASCENDING)], {"unique": True, "sparse": True}),
+    IndexSpec("prescription_jobs", [("status", ASCENDING), ("run_after", ASCENDING)]),
+    IndexSpec("prescription_jobs", [("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+]
+
+_PAGE_CURSOR = encode_cursor({"id": "p", "created_at": datetime(2000, 1, 1, tzinfo=timezone.utc)}, "created_at")
+
+# The filter/sort each endpoint issues, with placeholder values
+QUERY_SHAPES: List[QueryShape] = [
+    QueryShape("login", "users", {"email": "user@example.com"}),
+    QueryShape("list_prescriptions", "prescriptions", {"user_id": "u"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    # Later pages add the cursor's (created_at, id) tie-break as an $or
+    QueryShape(
+        "list_prescriptions_page",
+        "prescriptions",
+        keyset_filter({"user_id": "u"}, "created_at", DESCENDING, _PAGE_CURSOR),
+        keyset_sort("created_at", DESCENDING),
+    ),
+    QueryShape("get_prescription", "prescriptions", {"id": "p", "user_id": "u"}),
+    QueryShape("duplicate_scan", "prescriptions", {"user_id": "u", "id": {"$ne": "p"}, "image_phash": {"$ne": None}}, [("created_at", DESCENDING)]),
+    QueryShape("list_medicines", "medicines", {"user_id": "u"}, [("created_at", ASCENDING), ("id", ASCENDING)]),
+    QueryShape("update_medicine", "medicines", {"id": "m", "user_id": "u"}),
+    QueryShape("sweep_expiry", "medicines", {"expiry_date": {"$gt": "2025-01-01", "$lte": "2025-01-31"}}),
+    QueryShape("sweep_runout", "medicines", {"runout_date": {"$gt": "2025-01-01", "$lte": "2025-01-08"}}),
+    QueryShape("chat_history", "chat_messages", {"user_id": "u", "session_id": "s"}, [("timestamp", ASCENDING), ("id", ASCENDING)]),
+    QueryShape("chat_sessions", "chat_sessions", {"user_id": "u"}, [("last_timestamp", DESCENDING), ("id", DESCENDING)]),
+    QueryShape("list_alerts", "alerts", {"user_id": "u"}, [("created_at", DESCENDING), ("id", DESCENDING)]),
+    QueryShape("mark_alert_read", "alerts", {"id": "a", "user_id": "u"}),
+    QueryShape("unread_alerts", "alerts", {"user_id": "u", "is_read": False}),
+    QueryShape("dashboard_stats", "user_stats", {"user_id": "u"}),
+    QueryShape("regimen_conflicts", "active_drugs", {"user_id": "u", "drug": {"$in": ["warfarin", "aspirin"]}}),
+    QueryShape("active_drug_sources", "active_drugs", {"user_id": "u", "sources": "medicine:m"}),
+    QueryShape("claim_job", "prescription_jobs", claim_filter(datetime(2000, 1, 1, tzinfo=timezone.utc)), CLAIM_SORT),
+    QueryShape("dead_letter_jobs", "prescription_jobs", dead_lease_filter(datetime(2000, 1, 1, tzinfo=timezone.utc))),
+    QueryShape("get_job", "prescription_jobs", {"id": "j", "user_id": "u"}),
+]
+
+
+async def ensure_indexes(db, indexes: List[IndexSpec] = INDEXES):
+    for spec in indexes:
+        collection = db[spec.collection]
+        try:
+            await collection.create_index(spec.keys, **spec.options)
+        except OperationFailure as e:
+            # Code 85/86: an index on these keys exists with other options (e.g. a changed TTL)
+            if e.code == 85 and "expireAfterSeconds" in spec.options:
+                await db.command({
+                    "collMod": spec.collection,
+                    "index": {"keyPattern": dict(spec.keys), "expireAfterSeconds": spec.options["expireAfterSeconds"]},
+                })
+            elif e.code in (85, 86):
+                logging.warning(f"Index {spec.keys} on {spec.collection} conflicts with an existing index: {str(e)}")
+            else:
+                raise
+
+
+def _plan_stages(plan: dict) -> List[str]:
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages.extend(_plan_stages(plan[key]))
+    for child in plan.get("inputStages", []):
+        stages.extend(_plan_stages(child))
+    return stages
+
+
+async def check_query_plans(db, shapes: List[QueryShape] = QUERY_SHAPES) -> List[dict]:
+    """Explain each endpoint's query shape and flag any winning plan that scans the collection"""
+    report = []
+    for shape in shapes:
+        cursor = db[shape.collection].find(shape.filter)
+        if shape.sort:
+            cursor = cursor.sort(shape.sort)
+        explain = await cursor.explain()
+        stages = _plan_stages(explain["queryPlanner"]["winningPlan"])
+        report.append({
+            "query": shape.name,
+            "collection": shape.collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
+
+
+async def _main(check: bool) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'mediassist_db')]
+    await ensure_indexes(db)
+    print(f"Ensured {len(INDEXES)} indexes")
+    status = 0
+    if check:
+        for row in await check_query_plans(db):
+            flag = "COLLSCAN" if row["collscan"] else "ok"
+            print(f"{flag:8} {row['query']:20} {row['collection']:18} {' <- '.join(row['stages'])}")
+            if row["collscan"]:
+                status = 1
+    client.close()
+    return status
+
+
+if __name__ == "__main__":
+    # python indexes.py [--check]
+    sys.exit(asyncio.run(_main("--check" in sys.argv[1:])))
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from resilience import AdaptiveLimiter, CircuitBreaker, DependencyGuard, Permit
+
+GEMINI_MAX_CONCURRENCY = int(os.environ.get('GEMINI_MAX_CONCURRENCY', '8'))
+GEMINI_TIMEOUT = float(os.environ.get('GEMINI_TIMEOUT', '60'))
+# Calls slower than this shrink the adaptive concurrency limit
+GEMINI_TARGET_LATENCY = float(os.environ.get('GEMINI_TARGET_LATENCY', '15'))
+GEMINI_MAX_QUEUE = int(os.environ.get('GEMINI_MAX_QUEUE', '32'))
+GEMINI_QUEUE_TIMEOUT = float(os.environ.get('GEMINI_QUEUE_TIMEOUT', '10'))
+GEMINI_BREAKER_FAILURE_RATE = float(os.environ.get('GEMINI_BREAKER_FAILURE_RATE', '0.5'))
+GEMINI_BREAKER_OPEN_SECONDS = float(os.environ.get('GEMINI_BREAKER_OPEN_SECONDS', '30'))
+
+
+def gemini_guard(max_concurrency: int = GEMINI_MAX_CONCURRENCY, timeout: float = GEMINI_TIMEOUT) -> DependencyGuard:
+    return DependencyGuard(
+        CircuitBreaker(
+            "gemini",
+            failure_rate=GEMINI_BREAKER_FAILURE_RATE,
+            slow_call_seconds=timeout * 0.8,
+            open_seconds=GEMINI_BREAKER_OPEN_SECONDS,
+        ),
+        AdaptiveLimiter(
+            "gemini",
+            max_limit=max_concurrency,
+            target_latency=GEMINI_TARGET_LATENCY,
+            max_queue=GEMINI_MAX_QUEUE,
+            queue_timeout=GEMINI_QUEUE_TIMEOUT,
+        ),
+    )
+
+
+class GeminiInference:
+    """Shared Gemini models behind a circuit breaker, an adaptive concurrency limit and per-call timeouts
+
+    When the circuit is open, or the wait queue is full, calls raise DependencyUnavailable
+    immediately instead of piling up behind a struggling API.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int = GEMINI_MAX_CONCURRENCY,
+        timeout: float = GEMINI_TIMEOUT,
+        guard: Optional[DependencyGuard] = None,
+    ):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._models: Dict[str, Any] = {}
+        self._genai = None
+        self.guard = guard or gemini_guard(max_concurrency, timeout)
+        self._metrics = {
+            "queued": 0,
+            "in_flight": 0,
+            "max_queued": 0,
+            "completed": 0,
+            "failed": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "wait_seconds_total": 0.0,
+            "call_seconds_total": 0.0,
+        }
+
+    def _sdk(self):
+        if self._genai is None:
+            # The SDK takes most of a second to import, so it is loaded with the first model
+            import google.generativeai as genai
+            genai.configure(api_key=self.api_key)
+            self._genai = genai
+        return self._genai
+
+    def model(self, model_name: str):
+        """Return the cached GenerativeModel for a model name, configuring the SDK once"""
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._models[model_name] = self._sdk().GenerativeModel(model_name)
+        return model
+
+    def available(self) -> bool:
+        """False while the circuit is open, so callers can degrade without trying"""
+        return self.guard.available()
+
+    def ensure_available(self):
+        self.guard.ensure_available()
+
+    async def _acquire(self) -> Tuple[float, Permit]:
+        """Wait for a concurrency slot, tracking queue depth; returns the start time and permit"""
+        metrics = self._metrics
+        metrics["queued"] += 1
+        metrics["max_queued"] = max(metrics["max_queued"], metrics["queued"])
+        queued_at = time.perf_counter()
+        try:
+            permit = await self.guard.acquire()
+        except Exception:
+            metrics["rejected"] += 1
+            raise
+        finally:
+            metrics["queued"] -= 1
+        started = time.perf_counter()
+        metrics["wait_seconds_total"] += started - queued_at
+        metrics["in_flight"] += 1
+        return started, permit
+
+    def _release(self, started: float, permit: Permit, failed: Optional[bool], latency: Optional[float] = None):
+        """Free the slot; ``latency`` overrides the call duration fed back to the limiter"""
+        seconds = time.perf_counter() - started
+        self._metrics["in_flight"] -= 1
+        self._metrics["call_seconds_total"] += seconds
+        self.guard.release(permit, seconds if latency is None else latency, failed)
+
+    async def generate(self, model_name: str, contents, timeout: Optional[float] = None, **kwargs):
+        """Run generate_content_async once a concurrency slot is free, bounded by a timeout"""
+        model = self.model(model_name)
+        metrics = self._metrics
+        started, permit = await self._acquire()
+        failed = True
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, **kwargs),
+                timeout=timeout or self.timeout,
+            )
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            logging.warning(f"Gemini call to {model_name} timed out")
+            raise
+        except asyncio.CancelledError:
+            # The caller went away; that says nothing about Gemini's health
+            failed = None
+            raise
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        else:
+            metrics["completed"] += 1
+            failed = False
+            return response
+        finally:
+            self._release(started, permit, failed)
+
+    async def stream(self, model_name: str, contents, timeout: Optional[float] = None, **kwargs) -> AsyncIterator[str]:
+        """Yield response text chunks as they arrive; the slot is held until the stream ends
+
+        ``timeout`` bounds the wait for each chunk rather than the whole generation, and the
+        adaptive limit is driven by the time to the first chunk.
+        """
+        model = self.model(model_name)
+        timeout = timeout or self.timeout
+        metrics = self._metrics
+        started, permit = await self._acquire()
+        failed, first_chunk = True, None
+        try:
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, stream=True, **kwargs),
+                timeout=timeout,
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                if chunk.text:
+                    yield chunk.text
+        except asyncio.TimeoutError:
+            metrics["timeouts"] += 1
+            logging.warning(f"Gemini stream from {model_name} timed out")
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            failed = None
+            raise
+        except Exception:
+            metrics["failed"] += 1
+            raise
+        else:
+            metrics["completed"] += 1
+            failed = False
+        finally:
+            self._release(started, permit, failed, first_chunk)
+
+    def stats(self) -> dict:
+        return {
+            **self._metrics,
+            "max_concurrency": self.max_concurrency,
+            **self.guard.stats(),
+            "models": sorted(self._models),
+        }
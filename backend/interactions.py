@@ -0,0 +1,174 @@
+import csv
+import json
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Union
+
+# Severities are stored as small integer codes on the adjacency edges
+SEVERITIES = ("low", "medium", "high")
+_SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+
+_WHITESPACE = re.compile(r"\s+")
+# Trailing strength/form such as "500mg", "10 mg tablet" or "(81 mg)"
+_STRENGTH_SUFFIX = re.compile(r"[\s(]+\d.*$")
+
+
+def normalize_drug_name(name: str) -> str:
+    return _WHITESPACE.sub(" ", name.lower().strip())
+
+
+class InteractionEngine:
+    """Indexed drug interaction lookup keyed by canonical integer drug IDs"""
+
+    def __init__(self):
+        self._names: List[str] = []
+        # Canonical names and every synonym/brand alias resolve through one index
+        self._index: Dict[str, int] = {}
+        # Symmetric adjacency: drug ID -> {interacting drug ID: severity code}
+        self._adjacency: List[Dict[int, int]] = []
+        # Only edges with a dataset description carry text, keyed by packed ID pair
+        self._descriptions: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def interaction_count(self) -> int:
+        return sum(len(edges) for edges in self._adjacency) // 2
+
+    def add_drug(self, name: str, aliases: Iterable[str] = ()) -> int:
+        key = normalize_drug_name(name)
+        drug_id = self._index.get(key)
+        if drug_id is None:
+            drug_id = len(self._names)
+            self._names.append(key)
+            self._adjacency.append({})
+            self._index[key] = drug_id
+        for alias in aliases:
+            self.add_alias(alias, drug_id)
+        return drug_id
+
+    def add_alias(self, alias: str, drug: Union[int, str]):
+        drug_id = drug if isinstance(drug, int) else self.add_drug(drug)
+        key = normalize_drug_name(alias)
+        if key and key not in self._index:
+            self._index[key] = drug_id
+
+    def add_interaction(self, drug1: str, drug2: str, severity: str = "high", description: Optional[str] = None):
+        id1 = self.add_drug(drug1)
+        id2 = self.add_drug(drug2)
+        if id1 == id2:
+            return
+        code = _SEVERITY_CODES.get(str(severity).lower(), _SEVERITY_CODES["high"])
+        # Keep the most severe rating when a pair is listed more than once
+        code = max(code, self._adjacency[id1].get(id2, code))
+        self._adjacency[id1][id2] = code
+        self._adjacency[id2][id1] = code
+        if description:
+            self._descriptions[self._pair_key(id1, id2)] = description
+
+    @staticmethod
+    def _pair_key(id1: int, id2: int) -> int:
+        low, high = (id1, id2) if id1 < id2 else (id2, id1)
+        return (low << 32) | high
+
+    def resolve(self, name: str) -> Optional[int]:
+        """Map a drug, brand or synonym name to its canonical ID"""
+        key = normalize_drug_name(name)
+        drug_id = self._index.get(key)
+        if drug_id is None and key:
+            stripped = _STRENGTH_SUFFIX.sub("", key)
+            if stripped != key:
+                drug_id = self._index.get(stripped)
+        return drug_id
+
+    def canonical_name(self, drug_id: int) -> str:
+        return self._names[drug_id]
+
+    def names(self) -> Dict[str, str]:
+        """Every known name and alias mapped to its canonical drug name"""
+        return {alias: self._names[drug_id] for alias, drug_id in self._index.items()}
+
+    def interactions_of(self, drug_id: int) -> Dict[int, int]:
+        return self._adjacency[drug_id]
+
+    def conflict(self, id1: int, id2: int) -> dict:
+        """Conflict record for a pair of drug IDs known to interact"""
+        name1, name2 = self._names[id1], self._names[id2]
+        description = self._descriptions.get(self._pair_key(id1, id2))
+        return {
+            "drug1": name1,
+            "drug2": name2,
+            "severity": SEVERITIES[self._adjacency[id1][id2]],
+            "description": description or f"Known interaction between {name1} and {name2}",
+            "source": "local_db"
+        }
+
+    def check(self, medicines: Sequence[str]) -> List[dict]:
+        """Return every interacting pair in a regimen in O(n*k) for k interactions per drug"""
+        positions: Dict[int, int] = {}
+        regimen: List[int] = []
+        for med in medicines:
+            drug_id = self.resolve(med)
+            if drug_id is None or drug_id in positions:
+                continue
+            positions[drug_id] = len(regimen)
+            regimen.append(drug_id)
+
+        conflicts = []
+        for pos, drug_id in enumerate(regimen):
+            edges = self._adjacency[drug_id]
+            # Walk whichever side is smaller: this drug's edges or the regimen itself
+            if len(edges) <= len(positions):
+                partners = (other for other in edges if other in positions)
+            else:
+                partners = (other for other in positions if other in edges)
+            for other in sorted(partners, key=positions.__getitem__):
+                if positions[other] > pos:
+                    conflicts.append(self.conflict(drug_id, other))
+        return conflicts
+
+    def check_batch(self, regimens: Iterable[Sequence[str]]) -> List[List[dict]]:
+        return [self.check(regimen) for regimen in regimens]
+
+    @classmethod
+    def from_mapping(cls, interactions: Mapping[str, Iterable[str]], severity: str = "high") -> "InteractionEngine":
+        engine = cls()
+        for drug, partners in interactions.items():
+            for partner in partners:
+                engine.add_interaction(drug, partner, severity)
+        return engine
+
+    @classmethod
+    def load(cls, path: Union[str, Path], aliases_path: Union[str, Path, None] = None) -> "InteractionEngine":
+        """Build an engine from a JSON or CSV interaction dataset plus an optional alias CSV
+
+        JSON files hold ``{"drugs": [{"name", "aliases"}], "interactions": [{"drug1", "drug2",
+        "severity", "description"}]}``; CSV files have ``drug1,drug2,severity,description``
+        columns and alias files ``alias,name`` columns.
+        """
+        engine = cls()
+        path = Path(path)
+        if path.suffix.lower() == ".json":
+            with path.open(encoding="utf-8") as f:
+                data = json.load(f)
+            for drug in data.get("drugs", []):
+                engine.add_drug(drug["name"], drug.get("aliases", []))
+            rows = data.get("interactions", [])
+        else:
+            with path.open(newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        for row in rows:
+            engine.add_interaction(
+                row["drug1"],
+                row["drug2"],
+                row.get("severity") or "high",
+                row.get("description") or None,
+            )
+        if aliases_path:
+            with Path(aliases_path).open(newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    engine.add_alias(row["alias"], row["name"])
+        logging.info(f"Loaded {len(engine)} drugs and {engine.interaction_count} interactions from {path}")
+        return engine
@@ -0,0 +1,261 @@
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Awaitable, Callable, List, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from resilience import DependencyUnavailable
+from streaming import SSE_KEEPALIVE, sse_event
+
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', '300'))
+JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', '5'))
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1'))
+JOB_EVENTS_INTERVAL = float(os.environ.get('JOB_EVENTS_INTERVAL', '0.5'))
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+# handler(job, progress) -> result dict; progress(stage) records the current pipeline stage
+JobHandler = Callable[[dict, Callable[[str], Awaitable[None]]], Awaitable[dict]]
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def claim_filter(now: datetime) -> dict:
+    """Jobs a worker may claim: queued ones that are due, and running ones whose lease ran out"""
+    return {"$or": [
+        {"status": "queued", "run_after": {"$lte": now}},
+        # A worker that died mid-job leaves a running job whose lease runs out
+        {
+            "status": "running",
+            "lease_expires_at": {"$lte": now},
+            "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+        },
+    ]}
+
+
+CLAIM_SORT = [("run_after", ASCENDING)]
+
+
+def dead_lease_filter(now: datetime) -> dict:
+    """Running jobs whose lease ran out on their last attempt"""
+    return {"status": "running", "lease_expires_at": {"$lte": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}}
+
+
+class JobQueue:
+    """Mongo-backed work queue with leased claims, retries with backoff and idempotent enqueue"""
+
+    def __init__(
+        self,
+        collection,
+        handler: JobHandler,
+        workers: int = JOB_WORKERS,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        retry_delay: float = JOB_RETRY_DELAY,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ):
+        self.collection = collection
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+
+    async def enqueue(
+        self,
+        job_type: str,
+        user_id: str,
+        payload: dict,
+        idempotency_key: Optional[str] = None,
+        delay: float = 0.0,
+    ) -> dict:
+        """Queue a job, or return the existing one when the idempotency key was seen before
+
+        ``delay`` holds the job back, e.g. until a tripped circuit is due to be probed again.
+        """
+        now = _now()
+        job = {
+            "id": str(uuid.uuid4()),
+            "type": job_type,
+            "user_id": user_id,
+            "payload": payload,
+            "status": "queued",
+            "stage": "queued",
+            "attempts": 0,
+            "max_attempts": self.max_attempts,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "run_after": now + timedelta(seconds=delay),
+            "lease_expires_at": None,
+        }
+        if idempotency_key:
+            job["idempotency_key"] = idempotency_key
+        try:
+            await self.collection.insert_one(job)
+        except DuplicateKeyError:
+            existing = await self.collection.find_one({"idempotency_key": idempotency_key}, {"_id": 0})
+            if existing is not None:
+                return existing
+            raise
+        job.pop("_id", None)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": job_id, "user_id": user_id}, {"_id": 0, "idempotency_key": 0})
+
+    async def _claim(self) -> Optional[dict]:
+        now = _now()
+        # A job whose last attempt's worker died has no attempt left to reclaim it with
+        await self.collection.update_many(
+            dead_lease_filter(now),
+            {"$set": {
+                "status": "failed",
+                "stage": "failed",
+                "error": "Lease expired on the last attempt",
+                "updated_at": now,
+                "lease_expires_at": None,
+            }},
+        )
+        job = await self.collection.find_one_and_update(
+            claim_filter(now),
+            {
+                "$set": {
+                    "status": "running",
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=CLAIM_SORT,
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is not None:
+            job.pop("_id", None)
+        return job
+
+    async def _run(self, job: dict):
+        async def progress(stage: str):
+            now = _now()
+            await self.collection.update_one(
+                {"id": job["id"]},
+                {"$set": {
+                    "stage": stage,
+                    "updated_at": now,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                }},
+            )
+
+        try:
+            result = await self.handler(job, progress)
+        except DependencyUnavailable as e:
+            # A downstream outage is not the job's fault: wait it out without using up an attempt
+            logging.warning(f"Job {job['id']} deferred: {str(e)}")
+            now = _now()
+            await self.collection.update_one(
+                {"id": job["id"]},
+                {
+                    "$set": {
+                        "status": "queued",
+                        "stage": "waiting",
+                        "run_after": now + timedelta(seconds=max(e.retry_after, self.retry_delay)),
+                        "error": str(e),
+                        "updated_at": now,
+                        "lease_expires_at": None,
+                    },
+                    "$inc": {"attempts": -1},
+                },
+            )
+            return
+        except Exception as e:
+            logging.error(f"Job {job['id']} attempt {job['attempts']} failed: {str(e)}")
+            now = _now()
+            if job["attempts"] < job["max_attempts"]:
+                update = {
+                    "status": "queued",
+                    "stage": "retrying",
+                    "run_after": now + timedelta(seconds=self.retry_delay * 2 ** (job["attempts"] - 1)),
+                }
+            else:
+                update = {"status": "failed", "stage": "failed"}
+            await self.collection.update_one(
+                {"id": job["id"]},
+                {"$set": {**update, "error": str(e), "updated_at": now, "lease_expires_at": None}},
+            )
+            return
+        await self.collection.update_one(
+            {"id": job["id"]},
+            {"$set": {
+                "status": "succeeded",
+                "stage": "done",
+                "result": result,
+                "error": None,
+                "updated_at": _now(),
+                "lease_expires_at": None,
+            }},
+        )
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logging.error(f"Job claim error: {str(e)}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                # The lease will expire and another worker picks the job up again
+                logging.error(f"Job {job['id']} status update error: {str(e)}")
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def events(self, job_id: str, user_id: str, interval: float = JOB_EVENTS_INTERVAL) -> AsyncIterator[str]:
+        """Server-sent events for a job: one event per status/stage change until it finishes"""
+        last = None
+        idle = 0.0
+        while True:
+            job = await self.get(job_id, user_id)
+            if job is None:
+                yield sse_event("error", {"detail": "Job not found"})
+                return
+            state = (job["status"], job["stage"], job["attempts"])
+            if state != last:
+                last = state
+                idle = 0.0
+                yield sse_event(job["status"], job)
+                if job["status"] in TERMINAL_STATUSES:
+                    return
+            elif idle >= 15:
+                idle = 0.0
+                yield SSE_KEEPALIVE
+            await asyncio.sleep(interval)
+            idle += interval
@@ -0,0 +1,195 @@
+import csv
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from interactions import normalize_drug_name
+
+DRUG_LEXICON_FILE = os.environ.get('DRUG_LEXICON_FILE', str(Path(__file__).parent / 'data' / 'drug_lexicon.csv'))
+LOCAL_PARSER_THRESHOLD = float(os.environ.get('LOCAL_PARSER_THRESHOLD', '0.75'))
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+# Lines and semicolons separate prescription items; periods do not ("2.5mg", "b.i.d.")
+_SEGMENT = re.compile(r"[^\n;]+")
+
+_STRENGTH = re.compile(
+    r"(?<![\w.])(\d+(?:\.\d+)?(?:\s*/\s*\d+(?:\.\d+)?)?)\s*(mg|mcg|µg|ug|g|ml|iu|units?|%)(?![a-z])",
+    re.IGNORECASE,
+)
+_UNITS = {"µg": "mcg", "ug": "mcg", "iu": " IU", "unit": " unit", "units": " units"}
+_DOSE_FORM = re.compile(
+    r"(?<![\w.])(\d+(?:\.\d+)?|one|two|half)\s*(tablets?|tabs?|capsules?|caps?|puffs?|drops?|sachets?)\b",
+    re.IGNORECASE,
+)
+
+# "Tab. X", "Cap X", "Syp. X", "Inj X": the word after a dose form prefix names a drug
+_ITEM_PREFIX = re.compile(r"\b(?:tabs?|tablets?|caps?|capsules?|syp|syrup|inj|injection)\.?\s+(?=[a-z])", re.IGNORECASE)
+
+# How a medicine is taken; a line saying so names a medicine even without a strength
+_ROUTE = re.compile(
+    r"\bby\s+mouth\b|\borally\b|\bp\.?o\.?(?![a-z])|\bsub-?lingual(?:ly)?\b|\btopical(?:ly)?\b"
+    r"|\bsubcutaneous(?:ly)?\b|\binhal(?:ed|er|ation)\b|\bnebuli[sz]ed\b|\bper\s+rectum\b",
+    re.IGNORECASE,
+)
+
+_PRN = re.compile(r"\bas needed\b|\bp\.?r\.?n\.?(?![a-z])|\bwhen required\b|\bsos\b", re.IGNORECASE)
+_EVERY_HOURS = re.compile(r"\bevery\s+(\d+)\s*(?:hours?|hrs?|h)\b|\bq\.?\s*(\d+)\s*h(?:rs?)?\b", re.IGNORECASE)
+# Checked in order, so the specific phrases win over a bare "daily"
+_FREQUENCIES: List[Tuple[re.Pattern, str]] = [
+    (re.compile(p, re.IGNORECASE), name) for p, name in [
+        (r"\b(?:four|4)\s*(?:times|x)\s+(?:a\s+|per\s+)?(?:day|daily)\b|\bq\.?i\.?d\.?(?![a-z])|\bqds\b", "four times daily"),
+        (r"\b(?:three|3)\s*(?:times|x)\s+(?:a\s+|per\s+)?(?:day|daily)\b|\bthrice\s+(?:a\s+)?(?:day|daily)\b|\bt\.?i\.?d\.?(?![a-z])|\btds\b", "three times daily"),
+        (r"\b(?:twice|two\s+times|2\s*(?:times|x))\s+(?:a\s+|per\s+)?(?:day|daily)\b|\bb\.?i\.?d\.?(?![a-z])|\bbd\b", "twice daily"),
+        (r"\bonce\s+(?:a|per)\s+week\b|\bevery\s+week\b|\bweekly\b", "once weekly"),
+        (r"\bat\s+(?:bed\s*time|night)\b|\bh\.?s\.?(?![a-z])|\bnocte\b|\bbefore\s+bed\b", "at bedtime"),
+        (r"\b(?:in\s+the|every)\s+morning\b|\bmane\b", "every morning"),
+        (r"\bonce\s+(?:a\s+|per\s+)?(?:day|daily)\b|\bdaily\b|\bevery\s+day\b|\bq\.?d\.?(?![a-z])|\bo\.?d\.?(?![a-z])"
+         r"|\b(?:with|after|before)\s+(?:breakfast|lunch|dinner|supper|(?:the\s+)?evening\s+meal)\b", "once daily"),
+    ]
+]
+
+
+def normalize_dosage(text: str) -> Optional[str]:
+    """First strength in the text as e.g. ``500mg``, falling back to a dose form (``1 tablet``)"""
+    match = _STRENGTH.search(text or "")
+    if match:
+        amount = re.sub(r"\s+", "", match.group(1))
+        unit = _UNITS.get(match.group(2).lower(), match.group(2).lower())
+        return f"{amount}{unit}"
+    match = _DOSE_FORM.search(text or "")
+    if match:
+        return f"{match.group(1).lower()} {match.group(2).lower()}"
+    return None
+
+
+def normalize_frequency(text: str) -> Optional[str]:
+    """Map a frequency phrase or Latin abbreviation to its canonical wording"""
+    text = text or ""
+    frequency = None
+    match = _EVERY_HOURS.search(text)
+    if match:
+        frequency = f"every {match.group(1) or match.group(2)} hours"
+    else:
+        for pattern, name in _FREQUENCIES:
+            if pattern.search(text):
+                frequency = name
+                break
+    if _PRN.search(text):
+        frequency = f"{frequency} as needed" if frequency else "as needed"
+    return frequency
+
+
+class LocalParse(NamedTuple):
+    medicines: List[dict]
+    confidence: float
+
+
+class DrugLexicon:
+    """Token trie over drug names and aliases for longest-match scanning of free text"""
+
+    _END = ""
+
+    def __init__(self):
+        self._root: dict = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, name: str, canonical: Optional[str] = None):
+        tokens = _TOKEN.findall(normalize_drug_name(name))
+        if not tokens:
+            return
+        node = self._root
+        for token in tokens:
+            node = node.setdefault(token, {})
+        if self._END not in node:
+            self._size += 1
+        node[self._END] = normalize_drug_name(canonical or name)
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Non-overlapping (start, end, canonical) spans, longest match first at each token"""
+        tokens = [(m.group(), m.start(), m.end()) for m in _TOKEN.finditer(text.lower())]
+        found = []
+        i = 0
+        while i < len(tokens):
+            node = self._root
+            match = None
+            j = i
+            while j < len(tokens) and tokens[j][0] in node:
+                node = node[tokens[j][0]]
+                j += 1
+                if self._END in node:
+                    match = (j, node[self._END])
+            if match:
+                found.append((tokens[i][1], tokens[match[0] - 1][2], match[1]))
+                i = match[0]
+            else:
+                i += 1
+        return found
+
+    @classmethod
+    def load(cls, path: Union[str, Path]) -> "DrugLexicon":
+        """Read a ``name,aliases`` CSV whose aliases column is ``|``-separated"""
+        lexicon = cls()
+        with Path(path).open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                lexicon.add(row["name"])
+                for alias in filter(None, (row.get("aliases") or "").split("|")):
+                    lexicon.add(alias, row["name"])
+        logging.info(f"Loaded {len(lexicon)} drug names from {path}")
+        return lexicon
+
+
+class LocalPrescriptionParser:
+    """Deterministic parser for simple typed prescriptions
+
+    Each recognised drug takes the dosage and frequency found between it and the next drug
+    on the same line. Confidence is 0.5 for a name, plus 0.25 each for a dosage and a
+    frequency, and the result is as confident as its weakest medicine. A strength that no
+    known drug accounts for, a "Tab."/"Cap." item naming no known drug, or a line with a
+    frequency, dose form or route but no known drug zeroes the confidence: each usually
+    means a drug missing from the lexicon.
+    """
+
+    def __init__(self, lexicon: DrugLexicon, threshold: float = LOCAL_PARSER_THRESHOLD):
+        self.lexicon = lexicon
+        self.threshold = threshold
+
+    def parse(self, text: str) -> LocalParse:
+        medicines: Dict[str, dict] = {}
+        scores: Dict[str, float] = {}
+        unexplained = False
+        for segment in _SEGMENT.finditer(text or ""):
+            line = segment.group()
+            spans = self.lexicon.find(line)
+            starts = {start for start, _, _ in spans}
+            if any(prefix.end() not in starts for prefix in _ITEM_PREFIX.finditer(line)):
+                unexplained = True
+            if not spans:
+                if _STRENGTH.search(line) or _DOSE_FORM.search(line) or _ROUTE.search(line) or normalize_frequency(line):
+                    unexplained = True
+                continue
+            for k, (start, end, canonical) in enumerate(spans):
+                window = line[end:spans[k + 1][0] if k + 1 < len(spans) else len(line)]
+                if len(_STRENGTH.findall(window)) > 1:
+                    # A second strength before the next known drug implies an unknown drug
+                    unexplained = True
+                dosage = normalize_dosage(window)
+                frequency = normalize_frequency(window)
+                score = 0.5 + (0.25 if dosage else 0.0) + (0.25 if frequency else 0.0)
+                if score > scores.get(canonical, -1):
+                    scores[canonical] = score
+                    medicines[canonical] = {
+                        "name": line[start:end],
+                        "dosage": dosage or "",
+                        "frequency": frequency or "",
+                    }
+        if not medicines or unexplained:
+            return LocalParse(list(medicines.values()), 0.0)
+        return LocalParse(list(medicines.values()), min(scores.values()))
+
+    def accepts(self, result: LocalParse) -> bool:
+        return result.confidence >= self.threshold
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+import os
+from typing import Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+
+from active_drugs import ActiveDrugs, in_stock
+
+MEDICINE_IMPORT_MAX_ROWS = int(os.environ.get('MEDICINE_IMPORT_MAX_ROWS', '5000'))
+MEDICINE_IMPORT_MAX_BYTES = int(os.environ.get('MEDICINE_IMPORT_MAX_BYTES', str(5 * 1024 * 1024)))
+
+
+def _is_csv(content_type: str, filename: Optional[str]) -> bool:
+    return "csv" in content_type or (filename or "").lower().endswith(".csv")
+
+
+def parse_rows(data: bytes, csv_format: bool) -> List[dict]:
+    """Rows of a JSON array of objects, or of a CSV file with a header line naming the fields"""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import must be UTF-8 encoded")
+    if csv_format:
+        # Empty cells mean "not given", so optional fields fall back to their defaults
+        return [
+            {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+            for row in csv.DictReader(io.StringIO(text))
+        ]
+    try:
+        rows = json.loads(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON: {str(e)}")
+    if isinstance(rows, dict) and isinstance(rows.get("medicines"), list):
+        rows = rows["medicines"]
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Expected a JSON array of medicines")
+    return rows
+
+
+async def read_rows(request: Request, max_bytes: int = MEDICINE_IMPORT_MAX_BYTES) -> List[dict]:
+    """Rows from the request body (JSON or text/csv) or from a multipart ``file`` field"""
+    content_type = request.headers.get("content-type", "")
+    filename = None
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Attach the import as a 'file' field")
+        data = await upload.read(max_bytes + 1)
+        content_type, filename = upload.content_type or "", upload.filename
+    else:
+        data = await request.body()
+    if len(data) > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Import exceeds {max_bytes} bytes")
+    return parse_rows(data, _is_csv(content_type, filename))
+
+
+def validate_rows(
+    rows: List[dict],
+    model: Type[BaseModel],
+    max_rows: int = MEDICINE_IMPORT_MAX_ROWS,
+) -> Tuple[List[BaseModel], List[dict]]:
+    """Validate every row; returns the parsed rows and one error entry per invalid row (1-based)"""
+    if not rows:
+        raise HTTPException(status_code=400, detail="No medicines to import")
+    if len(rows) > max_rows:
+        raise HTTPException(status_code=413, detail=f"Import exceeds {max_rows} rows")
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": number, "errors": [{"field": None, "message": "Expected an object"}]})
+            continue
+        try:
+            valid.append(model.model_validate(row))
+        except ValidationError as e:
+            errors.append({"row": number, "errors": [
+                {"field": ".".join(str(part) for part in error["loc"]) or None, "message": error["msg"]}
+                for error in e.errors()
+            ]})
+    return valid, errors
+
+
+async def import_conflicts(active_drugs: ActiveDrugs, user_id: str, medicines: List[dict]) -> List[Tuple[str, dict]]:
+    """Conflicts an import brings in, each paired with the ID of the medicine it is keyed to
+
+    The new drugs are checked against the user's existing regimen, then against each other;
+    each drug pair is reported once. A conflict belongs to the first imported medicine with its
+    ``drug1``. Medicines imported with no stock are not part of the regimen and are skipped.
+    """
+    engine = active_drugs.engine
+    owners: Dict[str, str] = {}
+    for medicine in medicines:
+        drug_id = engine.resolve(medicine["name"]) if in_stock(medicine) else None
+        if drug_id is not None:
+            owners.setdefault(engine.canonical_name(drug_id), medicine["id"])
+    if not owners:
+        return []
+
+    conflicts = await active_drugs.conflicts(user_id, list(owners))
+    seen = {frozenset((c["drug1"], c["drug2"])) for c in conflicts}
+    for conflict in engine.check(list(owners)):
+        pair = frozenset((conflict["drug1"], conflict["drug2"]))
+        if pair not in seen:
+            seen.add(pair)
+            conflicts.append(conflict)
+    return [(owners[conflict["drug1"]], conflict) for conflict in conflicts]
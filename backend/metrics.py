@@ -0,0 +1,206 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Awaitable, Dict, Optional, Tuple, TypeVar
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from pymongo import monitoring
+
+# Set to a shared directory to aggregate metrics across gunicorn workers (see gunicorn.conf.py)
+PROMETHEUS_MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR', '')
+# Sampling profiler for single requests sent with "X-Profile: 1"; off unless enabled here
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp/mediassist-profiles')
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.001'))
+
+T = TypeVar("T")
+
+# Seconds; spans fast Mongo reads up to slow Gemini calls
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+REQUEST_SECONDS = Histogram(
+    "mediassist_request_duration_seconds",
+    "HTTP request latency until the response body is sent",
+    ["method", "endpoint", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "mediassist_stage_duration_seconds",
+    "Latency of named processing stages (ocr, extract, conflicts, scoring, bcrypt, ...)",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_SECONDS = Histogram(
+    "mediassist_mongo_command_duration_seconds",
+    "MongoDB command round trips by command and collection",
+    ["command", "collection", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class RequestTimings:
+    """Stage durations collected while one request is handled, reported as Server-Timing
+
+    Mongo commands complete on Motor's executor threads, hence the lock.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Tuple[float, int]] = {}
+
+    def add(self, name: str, ms: float):
+        with self._lock:
+            total, count = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + ms, count + 1)
+
+    def server_timing(self) -> str:
+        with self._lock:
+            stages = list(self.stages.items())
+        entries = [
+            f'{name};dur={ms:.1f}' + (f';desc="{count}x"' if count > 1 else "")
+            for name, (ms, count) in stages
+        ]
+        entries.append(f"app;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(name: str, seconds: float):
+    """Observe a stage in the histogram and in the Server-Timing of the current request, if any"""
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds * 1000)
+
+
+@contextmanager
+def stage(name: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+async def timed(name: str, awaitable: Awaitable[T]) -> T:
+    """Await under a named stage, for calls run concurrently with asyncio.gather"""
+    with stage(name):
+        return await awaitable
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every command a Motor client sends; pass it in the client's event_listeners
+
+    Motor runs commands with the caller's context copied onto its executor thread, so each
+    command also lands in the Server-Timing of the request that issued it, as ``mongo``.
+    """
+
+    def __init__(self):
+        self._collections: Dict[Tuple[object, int], str] = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        self._collections[(event.connection_id, event.request_id)] = target if isinstance(target, str) else ""
+
+    def _finish(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.labels(event.command_name, collection, outcome).observe(seconds)
+        timings = _current.get()
+        if timings is not None:
+            timings.add("mongo", seconds * 1000)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
+
+
+def _header(scope, name: bytes) -> Optional[bytes]:
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value
+    return None
+
+
+class MetricsMiddleware:
+    """ASGI middleware: request histogram, Server-Timing header and the opt-in request profiler
+
+    Server-Timing lists the stages completed before the response headers were sent, plus
+    ``app`` for the time the app took to start responding. With PROFILING_ENABLED, a request
+    sent with ``X-Profile: 1`` runs under pyinstrument and its HTML report is written to
+    PROFILE_DIR; the response names the file in ``X-Profile-Id``.
+    """
+
+    def __init__(self, app, profiling: bool = PROFILING_ENABLED, profile_dir: str = PROFILE_DIR):
+        self.app = app
+        self.profiling = profiling
+        self.profile_dir = Path(profile_dir)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+        profiler, profile_id = None, None
+        if self.profiling and _header(scope, b"x-profile") == b"1":
+            from pyinstrument import Profiler
+
+            profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+            profile_id = uuid.uuid4().hex
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.server_timing().encode()))
+                if profile_id:
+                    headers.append((b"x-profile-id", profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            if profiler is not None:
+                profiler.start()
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            endpoint = scope.get("endpoint")
+            REQUEST_SECONDS.labels(
+                scope["method"], getattr(endpoint, "__name__", "unmatched"), str(status)
+            ).observe(time.perf_counter() - timings.started)
+            _current.reset(token)
+            if profiler is not None:
+                profiler.stop()
+                self._save_profile(profiler, profile_id, scope)
+
+    def _save_profile(self, profiler, profile_id: str, scope):
+        try:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            (self.profile_dir / f"{profile_id}.html").write_text(profiler.output_html())
+            logging.info(f"Profiled {scope['method']} {scope['path']} as {profile_id}")
+        except Exception as e:
+            logging.warning(f"Profile write error: {str(e)}")
+
+
+def metrics_response() -> Response:
+    """Prometheus exposition of this process's metrics, or of every worker in multiprocess mode"""
+    registry = REGISTRY
+    if PROMETHEUS_MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
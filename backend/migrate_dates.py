@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from pymongo import UpdateOne
+
+# Fields the API used to store as ISO-8601 strings, now written as native BSON dates
+DATE_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "users": ("created_at",),
+    "prescriptions": ("created_at",),
+    "medicines": ("created_at", "stock_counted_at", "restocked_at"),
+    "alerts": ("created_at",),
+    "chat_messages": ("timestamp",),
+    "chat_sessions": ("created_at", "last_timestamp", "summary_until"),
+}
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    # Strings were written from UTC datetimes; treat any without an offset as UTC too
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+async def migrate_collection(collection, fields: Tuple[str, ...], batch_size: int = 1000, dry_run: bool = False) -> dict:
+    """Rewrite string dates in place as BSON dates; returns counts of converted and unparseable values
+
+    Each update is conditional on the string it replaces, so a document rewritten by the API
+    while the migration runs keeps its newer value. Running it again only touches strings left.
+    """
+    counts = {"documents": 0, "converted": 0, "invalid": 0}
+    ops = []
+
+    async def flush():
+        if ops and not dry_run:
+            await collection.bulk_write(ops, ordered=False)
+        ops.clear()
+
+    query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    async for doc in collection.find(query, {field: 1 for field in fields}):
+        match, updates = {"_id": doc["_id"]}, {}
+        for field in fields:
+            value = doc.get(field)
+            if not isinstance(value, str):
+                continue
+            parsed = parse_date(value)
+            if parsed is None:
+                counts["invalid"] += 1
+                continue
+            match[field] = value
+            updates[field] = parsed
+        if updates:
+            counts["documents"] += 1
+            counts["converted"] += len(updates)
+            ops.append(UpdateOne(match, {"$set": updates}))
+        if len(ops) >= batch_size:
+            await flush()
+    await flush()
+    return counts
+
+
+async def migrate(db, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, dict]:
+    report = {}
+    for name, fields in DATE_FIELDS.items():
+        report[name] = await migrate_collection(db[name], fields, batch_size, dry_run)
+        if report[name]["invalid"]:
+            logging.warning(f"{name}: {report[name]['invalid']} date values could not be parsed and were left as strings")
+    return report
+
+
+async def _main(dry_run: bool) -> int:
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    from database import LazyDatabase
+
+    db = LazyDatabase()
+    report = await migrate(db, dry_run=dry_run)
+    for name, counts in report.items():
+        verb = "Would convert" if dry_run else "Converted"
+        print(f"{name:14} {verb} {counts['converted']} dates in {counts['documents']} documents ({counts['invalid']} unparseable)")
+    db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    # python migrate_dates.py [--dry-run]
+    sys.exit(asyncio.run(_main("--dry-run" in sys.argv[1:])))
@@ -0,0 +1,103 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from pymongo import ASCENDING
+
+from responses import DocumentResponse
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', '500'))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    # Cursors come from clients: only scalars and our own date wrapper may reach the query,
+    # never operator documents like {"$ne": null}
+    if isinstance(value, dict):
+        if set(value) != {"$date"} or not isinstance(value["$date"], str):
+            raise ValueError("Unsupported cursor value")
+        return datetime.fromisoformat(value["$date"])
+    if value is not None and not isinstance(value, (str, int, float, bool)):
+        raise ValueError("Unsupported cursor value")
+    return value
+
+
+def encode_cursor(doc: dict, field: str) -> str:
+    """Opaque cursor holding the sort key and ID of the last document on a page"""
+    raw = json.dumps([_encode_value(doc.get(field)), doc["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        decoded = json.loads(raw)
+        if not isinstance(decoded, list) or len(decoded) != 2 or not isinstance(decoded[1], str):
+            raise ValueError("Cursor must hold a sort value and a document ID")
+        return _decode_value(decoded[0]), decoded[1]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_sort(field: str, direction: int) -> list:
+    # The ID breaks ties between documents sharing a timestamp
+    return [(field, direction), ("id", direction)]
+
+
+def keyset_filter(query: dict, field: str, direction: int, cursor: Optional[str]) -> dict:
+    """Restrict a query to the documents after the cursor in (field, id) order"""
+    if not cursor:
+        return query
+    value, doc_id = decode_cursor(cursor)
+    op = "$gt" if direction == ASCENDING else "$lt"
+    return {
+        **query,
+        "$or": [
+            {field: {op: value}},
+            {field: value, "id": {op: doc_id}},
+        ],
+    }
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    field: str,
+    direction: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of documents and the cursor for the next page (None on the last page)"""
+    docs = await collection.find(
+        keyset_filter(query, field, direction, cursor),
+        projection or {"_id": 0},
+    ).sort(keyset_sort(field, direction)).limit(limit + 1).to_list(limit + 1)
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], field)
+    return docs, next_cursor
+
+
+def set_next_cursor(response: Response, request: Request, next_cursor: Optional[str]):
+    """Advertise the next page in headers so list bodies keep their plain-array shape"""
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+
+
+def page_response(docs: List[dict], request: Request, next_cursor: Optional[str]) -> DocumentResponse:
+    """A page of documents as a plain JSON array, with the next-page headers set"""
+    response = DocumentResponse(docs)
+    set_next_cursor(response, request, next_cursor)
+    return response
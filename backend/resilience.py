@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, NamedTuple, Optional, Tuple
+
+
+class DependencyUnavailable(Exception):
+    """A downstream service is refusing work; callers should degrade or answer 503"""
+
+    def __init__(self, dependency: str, retry_after: float, reason: str):
+        super().__init__(f"{dependency} unavailable: {reason}")
+        self.dependency = dependency
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class CircuitOpenError(DependencyUnavailable):
+    pass
+
+
+class LoadShedError(DependencyUnavailable):
+    pass
+
+
+class Permit(NamedTuple):
+    """Admission to call through a breaker, handed back with the call's outcome
+
+    ``generation`` identifies the closed or open period the call started in; only the
+    half-open ``probe`` may close or re-open the circuit.
+    """
+    generation: int
+    probe: bool = False
+
+
+class CircuitBreaker:
+    """Rolling-window breaker that opens on a high error or slow-call rate
+
+    Open circuits fail fast for ``open_seconds``, then let a single probe through
+    (half-open); the probe's outcome closes or re-opens the circuit. Calls admitted before
+    the circuit last changed state are stragglers: they are counted but change nothing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (failed, slow)
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._generation = 0
+        self.times_opened = 0
+        self.stragglers = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.open_seconds:
+            return "half_open"
+        return "open"
+
+    def retry_after(self) -> float:
+        if self._opened_at is None:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> Optional[Permit]:
+        """A permit if a call may proceed now (claiming the probe slot when half-open), else None"""
+        state = self.state
+        if state == "closed":
+            return Permit(self._generation)
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return Permit(self._generation, probe=True)
+        return None
+
+    def release_probe(self, permit: Optional[Permit]):
+        """Give back a probe slot when the probe produced no result (never sent, or cancelled)"""
+        if permit is not None and permit.probe and permit.generation == self._generation:
+            self._probing = False
+
+    def check(self) -> Permit:
+        permit = self.allow()
+        if permit is None:
+            raise CircuitOpenError(self.name, max(1.0, self.retry_after()), "circuit open")
+        return permit
+
+    def record(self, failed: bool, seconds: float, permit: Optional[Permit] = None):
+        """Feed back a call's outcome; without a permit the call is taken as admitted just now"""
+        if permit is None:
+            permit = Permit(self._generation)
+        if permit.generation != self._generation or (self._opened_at is not None and not permit.probe):
+            # Started before the circuit last opened or closed: says nothing about it now
+            self.stragglers += 1
+            return
+        slow = seconds >= self.slow_call_seconds
+        if permit.probe:
+            self._probing = False
+            if failed or slow:
+                self._open()
+            else:
+                self._opened_at = None
+                self._calls.clear()
+                self._generation += 1
+                logging.info(f"Circuit {self.name} closed")
+            return
+        self._calls.append((failed, slow))
+        if len(self._calls) < self.min_calls:
+            return
+        failures = sum(1 for f, _ in self._calls if f) / len(self._calls)
+        slow_calls = sum(1 for _, s in self._calls if s) / len(self._calls)
+        if failures >= self.failure_rate or slow_calls >= self.slow_call_rate:
+            self._open()
+
+    def _open(self):
+        self._opened_at = time.monotonic()
+        self._calls.clear()
+        self._generation += 1
+        self.times_opened += 1
+        logging.warning(f"Circuit {self.name} opened for {self.open_seconds:.0f}s")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "retry_after": round(self.retry_after(), 1),
+            "times_opened": self.times_opened,
+            "stragglers": self.stragglers,
+        }
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by observed latency, with a bounded wait queue
+
+    Fast successes raise the limit by about one per round trip; errors or calls slower
+    than ``target_latency`` cut it multiplicatively. Callers beyond ``max_queue`` waiting,
+    or waiting longer than ``queue_timeout``, are shed with LoadShedError.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_limit: int,
+        min_limit: int = 1,
+        initial_limit: Optional[int] = None,
+        target_latency: float = 5.0,
+        backoff: float = 0.7,
+        max_queue: int = 32,
+        queue_timeout: float = 10.0,
+    ):
+        self.name = name
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._limit = float(initial_limit or max_limit)
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.shed = 0
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.shed += 1
+            raise LoadShedError(self.name, self._retry_hint(), "queue full")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.shed += 1
+            raise LoadShedError(self.name, self._retry_hint(), "queue wait timed out")
+        except BaseException:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was granted just as we gave up; hand it on
+            self.release()
+        else:
+            waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, failed: bool = False, seconds: Optional[float] = None):
+        self.in_flight -= 1
+        if seconds is not None:
+            if failed or seconds > self.target_latency:
+                now = time.monotonic()
+                # Cut once per round trip: calls already in flight at the last cut do not cut again
+                if now - seconds >= self._last_decrease:
+                    self._limit = max(self.min_limit, self._limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+        self._wake()
+
+    def _retry_hint(self) -> float:
+        return max(1.0, math.ceil(self.target_latency))
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": self.queued, "shed": self.shed}
+
+
+class DependencyGuard:
+    """Circuit breaker plus adaptive limiter for one downstream service"""
+
+    def __init__(self, breaker: CircuitBreaker, limiter: AdaptiveLimiter):
+        self.breaker = breaker
+        self.limiter = limiter
+
+    @property
+    def name(self) -> str:
+        return self.breaker.name
+
+    def available(self) -> bool:
+        return self.breaker.state != "open"
+
+    def ensure_available(self):
+        """Raise CircuitOpenError while the circuit is open, without claiming a probe"""
+        if not self.available():
+            raise CircuitOpenError(self.name, max(1.0, self.breaker.retry_after()), "circuit open")
+
+    async def acquire(self) -> Permit:
+        """Claim a call slot, failing fast when the circuit is open; hand the permit to release()"""
+        permit = self.breaker.check()
+        try:
+            await self.limiter.acquire()
+        except BaseException:
+            # Shed, cancelled or failed while queued: the dependency was never called, so
+            # give back a claimed probe slot rather than leave the circuit stuck half-open
+            self.breaker.release_probe(permit)
+            raise
+        if self.breaker.state == "open":
+            # The circuit opened while this caller was queued
+            self.limiter.release()
+            raise CircuitOpenError(self.name, max(1.0, self.breaker.retry_after()), "circuit open")
+        return permit
+
+    def release(self, permit: Permit, seconds: float, failed: Optional[bool]):
+        """Free the slot and record the outcome; ``failed=None`` means the call gave no result"""
+        if failed is None:
+            # Cancelled by our caller: says nothing about the dependency's health
+            self.limiter.release()
+            self.breaker.release_probe(permit)
+            return
+        self.limiter.release(failed, seconds)
+        self.breaker.record(failed, seconds, permit)
+
+    @asynccontextmanager
+    async def call(self) -> AsyncIterator[None]:
+        """Run the body under the breaker and a concurrency slot, recording its outcome"""
+        permit = await self.acquire()
+        started = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        except (asyncio.CancelledError, GeneratorExit):
+            failed = None
+            raise
+        finally:
+            self.release(permit, time.monotonic() - started, failed)
+
+    def stats(self) -> dict:
+        return {"circuit": self.breaker.stats(), "concurrency": self.limiter.stats()}
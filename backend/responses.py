@@ -0,0 +1,28 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+# Datetimes come back from Mongo as UTC; render them with a Z suffix as Pydantic does
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value):
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """Serialise stored documents to JSON; dates and nested structures are handled natively by orjson"""
+    return orjson.dumps(value, default=_default, option=ORJSON_OPTIONS)
+
+
+class DocumentResponse(JSONResponse):
+    """JSON body rendered straight from Mongo documents, without re-validating them through a model
+
+    Read endpoints project the fields their model declares and return this, so a page of
+    documents is serialised once by orjson instead of being coerced into model instances and
+    encoded again.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
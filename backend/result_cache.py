@@ -0,0 +1,81 @@
+import copy
+import hashlib
+import logging
+import os
+import re
+import unicodedata
+from datetime import datetime, timezone
+from typing import Optional
+
+from cachetools import TTLCache
+
+LLM_CACHE_SIZE = int(os.environ.get('LLM_CACHE_SIZE', '1024'))
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', str(30 * 24 * 3600)))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form of a prescription text so trivially different submissions share a key"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text or "")).strip()
+
+
+def digest_key(namespace: str, digest: str, model: str, prompt_version: str) -> str:
+    """SHA-256 cache key over a content digest plus the model and prompt version"""
+    return hashlib.sha256(f"{namespace}:{model}:{prompt_version}:{digest}".encode()).hexdigest()
+
+
+def content_key(namespace: str, content: bytes, model: str, prompt_version: str) -> str:
+    return digest_key(namespace, hashlib.sha256(content).hexdigest(), model, prompt_version)
+
+
+class ResultCache:
+    """Two-tier LLM result cache: in-process LRU in front of a TTL-indexed Mongo collection"""
+
+    def __init__(self, collection, maxsize: int = LLM_CACHE_SIZE, ttl: int = LLM_CACHE_TTL):
+        self.collection = collection
+        self.ttl = ttl
+        self._memory: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._counters = {"memory_hits": 0, "mongo_hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+    async def get(self, key: str) -> Optional[dict]:
+        value = self._memory.get(key)
+        if value is not None:
+            self._counters["memory_hits"] += 1
+            # Callers may mutate the result; keep the cached copy pristine
+            return copy.deepcopy(value)
+        try:
+            doc = await self.collection.find_one({"_id": key}, {"value": 1})
+        except Exception as e:
+            # The cache is an optimisation; a Mongo hiccup must not fail the request
+            self._counters["errors"] += 1
+            logging.warning(f"Result cache read error: {str(e)}")
+            doc = None
+        if doc is None:
+            self._counters["misses"] += 1
+            return None
+        self._counters["mongo_hits"] += 1
+        self._memory[key] = copy.deepcopy(doc["value"])
+        return doc["value"]
+
+    async def set(self, key: str, value: dict):
+        self._memory[key] = copy.deepcopy(value)
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"value": value, "created_at": datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+            self._counters["writes"] += 1
+        except Exception as e:
+            self._counters["errors"] += 1
+            logging.warning(f"Result cache write error: {str(e)}")
+
+    def stats(self) -> dict:
+        lookups = self._counters["memory_hits"] + self._counters["mongo_hits"] + self._counters["misses"]
+        hits = lookups - self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_size": len(self._memory),
+        }
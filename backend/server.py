@@ -1,41 +1,100 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Form, Header, Query, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError
 import os
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from typing import Awaitable, Callable, Dict, List, Literal, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-from passlib.context import CryptContext
 from jose import JWTError, jwt
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import base64
+import hashlib
 import io
-import google.generativeai as genai
-import requests
-import json
 import asyncio
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ.get('DB_NAME', 'mediassist_db')]
+# Local modules read their settings from the environment at import time
+from database import LazyDatabase
+from fda_client import FDAClient
+from interactions import InteractionEngine
+from active_drugs import ActiveDrugs, in_stock, medicine_source, prescription_source
+from alert_sweeper import AlertSweeper, medicine_alerts, stock_fields
+from inference import GeminiInference
+from result_cache import ResultCache, content_key, digest_key, normalize_text
+from blob_store import BlobStore, RangeNotSatisfiable, parse_range
+from uploads import MAX_UPLOAD_BYTES, MULTIPART_OVERHEAD_BYTES, RequestSizeLimit, StoredUpload, ingest_upload
+from jobs import JobQueue
+from medicine_import import MEDICINE_IMPORT_MAX_BYTES, import_conflicts, read_rows, validate_rows
+from streaming import ndjson_lines, sse_event
+from responses import DocumentResponse
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_page, keyset_sort, page_response
+from stats import UserStats
+from chat_sessions import ChatSessions
+from chat_context import ChatContextBuilder
+from indexes import INDEX_CHECK_ON_STARTUP, check_query_plans, ensure_indexes
+from passwords import PasswordHasher
+from extraction import (
+    EXTRACTION_MODE, IMAGE_EXTRACTION_PROMPT, MEDICINES_SCHEMA, PRESCRIPTION_SCHEMA, TEXT_EXTRACTION_PROMPT,
+    json_output, parse_json_response, parse_medicines, parse_prescription
+)
+from timing import StageTimer
+from metrics import MetricsMiddleware, MongoCommandTimer, metrics_response, stage, timed
+from local_parser import DRUG_LEXICON_FILE, DrugLexicon, LocalPrescriptionParser
+from image_preprocess import IMAGE_DUPLICATE_DISTANCE, ImagePreprocessor, hash_distance
+from resilience import DependencyUnavailable
+
+# MongoDB connection, opened on first use in each worker process
+db = LazyDatabase(event_listeners=[MongoCommandTimer()])
 
 # Security
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on a worker pool so logins do not block the event loop
+password_hasher = PasswordHasher()
 security = HTTPBearer()
 JWT_SECRET = os.environ.get('JWT_SECRET', 'mediassist_secret_key_2025')
 JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
+OCR_MODEL = 'gemini-pro-vision'
+EXTRACTION_MODEL = 'gemini-2.5-flash'
+CHAT_MODEL = 'gemini-2.5-flash'
+# Bump when a prescription prompt changes so cached extractions are not reused
+PRESCRIPTION_PROMPT_VERSION = 'v2'
+DRUG_INTERACTIONS_FILE = os.environ.get('DRUG_INTERACTIONS_FILE', '')
+DRUG_ALIASES_FILE = os.environ.get('DRUG_ALIASES_FILE', '')
+INTERACTION_BATCH_MAX = int(os.environ.get('INTERACTION_BATCH_MAX', '1000'))
+
+# Shared openFDA client (pooled connections, per-drug label cache, circuit breaker)
+fda_client = FDAClient()
+
+# Shared Gemini models behind a circuit breaker and adaptive concurrency limit
+inference = GeminiInference(GEMINI_API_KEY)
+
+# Content-addressed cache of OCR/extraction results shared across workers
+result_cache = ResultCache(db.llm_result_cache)
+
+# Prescription images, stored by content hash outside of Mongo documents
+blob_store = BlobStore()
+
+# Shrinks images before OCR on a worker pool; also hashes them to spot re-uploaded scans
+image_preprocessor = ImagePreprocessor()
+
+# Per-user dashboard counters maintained on every write
+user_stats = UserStats(db)
+
+# Expiry and run-out alerts: evaluated on every medicine write and swept periodically
+alert_sweeper = AlertSweeper(db, on_alerts=user_stats.alerts_added)
+
+# Per-session chat summaries kept current as messages are written
+chat_sessions = ChatSessions(db.chat_sessions)
 
-# Create the main app
-app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Local drug interaction database (fallback)
@@ -52,6 +111,21 @@ DRUG_INTERACTIONS = {
     "losartan": ["potassium supplements", "nsaids"]
 }
 
+# Interaction index built once at startup from the dataset file, or the table above
+if DRUG_INTERACTIONS_FILE:
+    interaction_engine = InteractionEngine.load(DRUG_INTERACTIONS_FILE, DRUG_ALIASES_FILE or None)
+else:
+    interaction_engine = InteractionEngine.from_mapping(DRUG_INTERACTIONS)
+
+# Local fast path for typed prescriptions: bundled lexicon plus every name the interaction index knows
+drug_lexicon = DrugLexicon.load(DRUG_LEXICON_FILE)
+for alias, canonical in interaction_engine.names().items():
+    drug_lexicon.add(alias, canonical)
+local_parser = LocalPrescriptionParser(drug_lexicon)
+
+# Each user's current drugs, kept in step with medicine and prescription writes
+active_drugs = ActiveDrugs(db.active_drugs, interaction_engine)
+
 # Models
 class User(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -76,11 +150,17 @@ class Prescription(BaseModel):
     type: str  # "image" or "text"
     original_text: Optional[str] = None
     extracted_text: Optional[str] = None
-    image_base64: Optional[str] = None
+    image_base64: Optional[str] = None  # legacy inline images only
+    image_ref: Optional[str] = None  # SHA-256 of the image in the blob store
+    image_content_type: Optional[str] = None
+    image_size: Optional[int] = None
+    image_phash: Optional[str] = None  # perceptual hash for near-duplicate detection
+    duplicate_of: Optional[str] = None  # earlier prescription with a near-identical image
     medicines: List[dict] = []
     conflicts: List[dict] = []
     verification_score: float = 0.0
     status: str = "pending"  # pending, verified, flagged
+    timings: Optional[Dict[str, float]] = None  # milliseconds per processing stage
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class PrescriptionCreate(BaseModel):
@@ -97,6 +177,7 @@ class Medicine(BaseModel):
     daily_usage: int = 1
     expiry_date: str
     prescription_id: Optional[str] = None
+    runout_date: Optional[str] = None  # projected from quantity and daily_usage
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class MedicineCreate(BaseModel):
@@ -107,6 +188,17 @@ class MedicineCreate(BaseModel):
     expiry_date: str
     prescription_id: Optional[str] = None
 
+class MedicineUpdate(BaseModel):
+    name: Optional[str] = None
+    dosage: Optional[str] = None
+    quantity: Optional[int] = Field(None, ge=0)
+    daily_usage: Optional[int] = Field(None, ge=1)
+    expiry_date: Optional[str] = None
+    prescription_id: Optional[str] = None
+
+class InteractionBatchRequest(BaseModel):
+    regimens: List[List[str]] = Field(..., max_length=INTERACTION_BATCH_MAX)
+
 class ChatMessage(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -131,12 +223,18 @@ class Alert(BaseModel):
     is_read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ExtractionFailed(Exception):
+    """A model call failed for a reason other than the dependency refusing work"""
+
 # Helper functions
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+async def hash_password(password: str) -> str:
+    with stage("bcrypt_hash"):
+        return await password_hasher.hash(password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password: str, hashed_password: str) -> tuple:
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost"""
+    with stage("bcrypt_verify"):
+        return await password_hasher.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(days=7)):
     to_encode = data.copy()
@@ -156,16 +254,14 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication")
 
-async def extract_text_from_image(image_base64: str) -> dict:
+async def extract_text_from_image(image_bytes: bytes, mime_type: str) -> dict:
     """Extract text from prescription image using OpenAI Vision"""
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-pro-vision')
         prompt = "Extract all text from this prescription image. Format your response as JSON: { 'extracted_text': 'complete text from image', 'medicines': [{'name': 'medicine name', 'dosage': 'dosage info', 'frequency': 'frequency'}], 'legibility_score': 0.0-1.0, 'warnings': ['any concerns'] }"
-        response = model.generate_content([prompt, image_base64])
+        response = await inference.generate(OCR_MODEL, [prompt, {"mime_type": mime_type, "data": image_bytes}])
         try:
-            result = json.loads(response.text)
-        except Exception:
+            result = parse_json_response(response.text)
+        except ValueError:
             result = {
                 "extracted_text": response.text,
                 "medicines": [],
@@ -173,68 +269,159 @@ async def extract_text_from_image(image_base64: str) -> dict:
                 "warnings": []
             }
         return result
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logging.error(f"OCR error: {str(e)}")
         return {
             "extracted_text": "Error processing image",
             "medicines": [],
             "legibility_score": 0.0,
-            "warnings": [f"OCR failed: {str(e)}"]
+            "warnings": [f"OCR failed: {str(e)}"],
+            "error": True
         }
 
-async def check_drug_conflicts(medicines: List[str]) -> List[dict]:
-    """Check for drug interactions using FDA API with local fallback"""
-    conflicts = []
-    
-    # Normalize medicine names
-    normalized_meds = [med.lower().strip() for med in medicines]
-    
-    # Check local database first
-    for i, med1 in enumerate(normalized_meds):
-        for med2 in normalized_meds[i+1:]:
-            # Check if either drug has known interactions
-            if med1 in DRUG_INTERACTIONS and med2 in DRUG_INTERACTIONS[med1]:
-                conflicts.append({
-                    "drug1": med1,
-                    "drug2": med2,
-                    "severity": "high",
-                    "description": f"Known interaction between {med1} and {med2}",
-                    "source": "local_db"
-                })
-            elif med2 in DRUG_INTERACTIONS and med1 in DRUG_INTERACTIONS[med2]:
-                conflicts.append({
-                    "drug1": med2,
-                    "drug2": med1,
-                    "severity": "high",
-                    "description": f"Known interaction between {med2} and {med1}",
-                    "source": "local_db"
-                })
-    
-    # Try FDA API for additional checks
+async def extract_structured_from_image(image_bytes: bytes, mime_type: str) -> dict:
+    """Read text, medicines and legibility from the image in one schema-constrained call"""
     try:
-        for med in medicines[:3]:  # Limit to 3 to avoid rate limits
-            response = requests.get(
-                f"https://api.fda.gov/drug/label.json",
-                params={"search": f"openfda.brand_name:{med}", "limit": 1},
-                timeout=5
-            )
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('results'):
-                    result = data['results'][0]
-                    if 'drug_interactions' in result:
-                        conflicts.append({
-                            "drug1": med,
-                            "drug2": "multiple",
-                            "severity": "medium",
-                            "description": result['drug_interactions'][0][:200] if result['drug_interactions'] else "",
-                            "source": "fda_api"
-                        })
+        response = await inference.generate(
+            EXTRACTION_MODEL,
+            [IMAGE_EXTRACTION_PROMPT, {"mime_type": mime_type, "data": image_bytes}],
+            generation_config=json_output(PRESCRIPTION_SCHEMA)
+        )
+    except DependencyUnavailable:
+        raise
     except Exception as e:
-        logging.warning(f"FDA API error: {str(e)}")
-    
+        logging.error(f"Structured extraction error: {str(e)}")
+        return {
+            "extracted_text": "Error processing image",
+            "medicines": [],
+            "legibility_score": 0.0,
+            "warnings": [f"OCR failed: {str(e)}"],
+            "error": True
+        }
+    try:
+        return parse_prescription(response.text)
+    except ValueError:
+        return {
+            "extracted_text": response.text,
+            "medicines": [],
+            "legibility_score": 0.7,
+            "warnings": []
+        }
+
+async def extract_medicines_from_text(text: str) -> Optional[List[dict]]:
+    """Text-only medicine extraction; None when the model call itself failed
+
+    Raises DependencyUnavailable when Gemini is refusing calls, so callers can defer the work.
+    """
+    try:
+        response = await inference.generate(
+            EXTRACTION_MODEL,
+            TEXT_EXTRACTION_PROMPT.format(text=text),
+            generation_config=json_output(MEDICINES_SCHEMA)
+        )
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        logging.error(f"Gemini Flash extraction error: {str(e)}")
+        return None
+    try:
+        return parse_medicines(response.text)
+    except ValueError:
+        return []
+
+async def extract_prescription_from_image(
+    image_bytes: bytes,
+    mime_type: str,
+    cache_key: str,
+    timer: StageTimer,
+    phash: Optional[str] = None
+) -> tuple:
+    """Extract text and medicines from an image, caching the result when the model calls succeed
+
+    In single-pass mode the text-only extraction runs only if the first call found no medicines.
+    DependencyUnavailable propagates so the prescription can be saved as pending instead.
+    """
+    if EXTRACTION_MODE == "two_pass":
+        with timer.stage("ocr"):
+            ocr_result = await extract_text_from_image(image_bytes, mime_type)
+        medicines = []
+    else:
+        with timer.stage("extract"):
+            ocr_result = await extract_structured_from_image(image_bytes, mime_type)
+        medicines = ocr_result.pop('medicines', [])
+
+    if not medicines and not ocr_result.get('error') and ocr_result.get('extracted_text'):
+        with timer.stage("extract_text"):
+            extracted = await extract_medicines_from_text(ocr_result['extracted_text'])
+        if extracted is None:
+            return ocr_result, []
+        medicines = extracted
+
+    if not ocr_result.get('error'):
+        await result_cache.set(cache_key, {"ocr_result": ocr_result, "medicines": medicines, "phash": phash})
+    return ocr_result, medicines
+
+async def find_duplicate_scan(user_id: str, phash: str, prescription_id: str) -> Optional[str]:
+    """ID of the user's most recent other prescription whose image hash is within a few bits"""
+    candidates = await db.prescriptions.find(
+        {"user_id": user_id, "id": {"$ne": prescription_id}, "image_phash": {"$ne": None}},
+        {"_id": 0, "id": 1, "image_phash": 1}
+    ).sort("created_at", -1).to_list(200)
+    for candidate in candidates:
+        if hash_distance(phash, candidate['image_phash']) <= IMAGE_DUPLICATE_DISTANCE:
+            return candidate['id']
+    return None
+
+async def check_drug_conflicts(
+    medicines: List[str],
+    user_id: Optional[str] = None,
+    source: Optional[str] = None
+) -> List[dict]:
+    """Check for drug interactions using FDA API with local fallback
+
+    With a user ID the drugs are also checked against the user's other active medicines and
+    prescriptions (``source`` names the record being checked, whose own drugs are skipped).
+    While the FDA circuit is open only the local index is consulted.
+    """
+    # Check local interaction index first
+    conflicts = interaction_engine.check(medicines)
+
+    # The regimen and FDA label checks are independent, so run them concurrently
+    fda_lookup = timed("fda", fda_client.find_interactions(medicines))
+    if user_id:
+        regimen, fda = await asyncio.gather(timed("regimen", active_drugs.conflicts(user_id, medicines, source)), fda_lookup)
+    else:
+        regimen, fda = [], await fda_lookup
+    seen = {frozenset((c['drug1'], c['drug2'])) for c in conflicts}
+    for conflict in regimen:
+        pair = frozenset((conflict['drug1'], conflict['drug2']))
+        if pair not in seen:
+            seen.add(pair)
+            conflicts.append(conflict)
+    conflicts.extend(fda)
+
     return conflicts
 
+def conflict_alerts(user_id: str, key: str, conflicts: List[dict]) -> List[dict]:
+    """One alert per conflict, keyed by record and drug pair so re-runs add nothing new"""
+    return [
+        Alert(
+            id=str(uuid.uuid5(uuid.NAMESPACE_URL, f"{key}/conflict/{conflict['drug1']}/{conflict['drug2']}")),
+            user_id=user_id,
+            type="conflict",
+            severity="high",
+            title="Drug Interaction Detected",
+            message=conflict['description']
+        ).model_dump()
+        for conflict in conflicts
+    ]
+
+async def raise_conflict_alerts(user_id: str, key: str, conflicts: List[dict]) -> int:
+    # Written in one unordered insert_many; alerts already raised are skipped by the unique ID
+    return await alert_sweeper.insert(conflict_alerts(user_id, key, conflicts))
+
 async def calculate_verification_score(medicines: List[dict], conflicts: List[dict], legibility_score: float) -> float:
     """Calculate prescription verification score"""
     base_score = legibility_score * 100
@@ -249,6 +436,15 @@ async def calculate_verification_score(medicines: List[dict], conflicts: List[di
     score = max(0, min(100, base_score - conflict_penalty))
     return round(score, 2)
 
+def model_projection(model, exclude=()) -> dict:
+    """Project only the fields a response model declares, so documents can be returned as stored"""
+    return {"_id": 0, **{name: 1 for name in model.model_fields if name not in exclude}}
+
+def export_ndjson(collection, query: dict, field: str, direction: int, projection: Optional[dict] = None) -> StreamingResponse:
+    """Stream every matching document as NDJSON straight from the cursor"""
+    cursor = collection.find(query, projection or {"_id": 0}).sort(keyset_sort(field, direction))
+    return StreamingResponse(ndjson_lines(cursor), media_type="application/x-ndjson")
+
 # Auth endpoints
 @api_router.post("/auth/register")
 async def register(user_data: UserCreate):
@@ -258,13 +454,13 @@ async def register(user_data: UserCreate):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Create user
-    hashed_pw = hash_password(user_data.password)
+    hashed_pw = await hash_password(user_data.password)
     user = User(email=user_data.email, full_name=user_data.full_name)
     user_dict = user.model_dump()
     user_dict['password'] = hashed_pw
-    user_dict['created_at'] = user_dict['created_at'].isoformat()
     
     await db.users.insert_one(user_dict)
+    await user_stats.create(user.id)
     
     token = create_access_token({"sub": user.id})
     return {"token": token, "user": {"id": user.id, "email": user.email, "full_name": user.full_name}}
@@ -272,348 +468,689 @@ async def register(user_data: UserCreate):
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email})
-    if not user or not verify_password(credentials.password, user['password']):
+    if not user:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_password(credentials.password, user['password'])
+    if not valid:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Transparently move the stored hash to the configured cost factor
+        await db.users.update_one({"id": user['id'], "password": user['password']}, {"$set": {"password": new_hash}})
     
     token = create_access_token({"sub": user['id']})
     return {"token": token, "user": {"id": user['id'], "email": user['email'], "full_name": user['full_name']}}
 
 # Prescription endpoints
-@api_router.post("/prescriptions/upload-image")
-async def upload_prescription_image(
-    file: UploadFile = File(...),
-    user_id: str = Depends(get_current_user)
-):
-    # Read and encode image
-    contents = await file.read()
-    image_base64 = base64.b64encode(contents).decode('utf-8')
-    
-    # Extract text using OCR (Gemini Vision)
-    ocr_result = await extract_text_from_image(image_base64)
-    extracted_text = ocr_result.get('extracted_text', '')
+async def process_image_prescription(
+    user_id: str,
+    upload: StoredUpload,
+    prescription_id: Optional[str] = None,
+    progress: Optional[Callable[[str], Awaitable[None]]] = None,
+    retry_errors: bool = False
+) -> dict:
+    """OCR -> extraction -> conflict check -> score pipeline for a stored prescription image
 
-    # Use Gemini Flash 2.5 to extract medicines from the extracted text
-    try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""Extract all medicines from the following prescription text. Format your response as JSON: {{'medicines': [{{'name': 'medicine name', 'dosage': 'dosage', 'frequency': 'frequency'}}]}}
-        Prescription: {extracted_text}"""
-        response = model.generate_content(prompt)
-        try:
-            parsed = json.loads(response.text)
-            medicines = parsed.get('medicines', [])
-        except Exception:
-            medicines = []
-    except Exception as e:
-        logging.error(f"Gemini Flash extraction error: {str(e)}")
-        medicines = []
+    Writes are keyed by the prescription ID so a retried job does not duplicate records.
+    With ``retry_errors`` a failed model call raises ExtractionFailed instead of saving an
+    "Error processing image" result, so a job can try again.
+    """
+    async def report(stage: str):
+        if progress is not None:
+            await progress(stage)
+
+    timer = StageTimer()
+
+    # Identical images reuse the cached OCR + extraction result
+    await report("extracting")
+    models = f"{OCR_MODEL}+{EXTRACTION_MODEL}" if EXTRACTION_MODE == "two_pass" else EXTRACTION_MODEL
+    cache_key = digest_key("prescription-image", upload.digest, models, f"{PRESCRIPTION_PROMPT_VERSION}/{image_preprocessor.signature}")
+    with timer.stage("cache"):
+        cached = await result_cache.get(cache_key)
+    if cached is not None:
+        ocr_result = cached['ocr_result']
+        medicines = cached['medicines']
+        phash = cached.get('phash')
+    else:
+        with timer.stage("read_image"):
+            image_bytes = await blob_store.read(upload.digest)
+        # Orient, downscale and recompress before the bytes go to the model
+        with timer.stage("preprocess"):
+            prepared = await image_preprocessor.prepare(image_bytes, upload.content_type)
+        phash = prepared.phash
+        ocr_result, medicines = await extract_prescription_from_image(prepared.data, prepared.mime_type, cache_key, timer, phash)
+        if retry_errors and ocr_result.get('error'):
+            raise ExtractionFailed("; ".join(ocr_result.get('warnings') or ["Image extraction failed"]))
+    extracted_text = ocr_result.get('extracted_text', '')
 
     # Extract medicine names for conflict check
     medicine_names = [med['name'] for med in medicines]
+    prescription_id = prescription_id or str(uuid.uuid4())
 
-    # Check conflicts
-    conflicts = await check_drug_conflicts(medicine_names)
+    # Check conflicts, within the prescription and against the user's other drugs
+    await report("checking_conflicts")
+    with timer.stage("conflicts"):
+        conflicts = await check_drug_conflicts(medicine_names, user_id, prescription_source(prescription_id))
 
     # Calculate score
-    score = await calculate_verification_score(
-        medicines,
-        conflicts,
-        ocr_result.get('legibility_score', 0.7)
-    )
+    await report("scoring")
+    with timer.stage("scoring"):
+        score = await calculate_verification_score(
+            medicines,
+            conflicts,
+            ocr_result.get('legibility_score', 0.7)
+        )
+
+    duplicate_of = None
+    if phash:
+        with timer.stage("duplicate_check"):
+            duplicate_of = await find_duplicate_scan(user_id, phash, prescription_id)
 
     # Create prescription record
+    await report("saving")
     prescription = Prescription(
+        id=prescription_id,
         user_id=user_id,
         type="image",
         extracted_text=extracted_text,
-        image_base64=image_base64,
+        image_ref=upload.digest,
+        image_content_type=upload.content_type,
+        image_size=upload.size,
+        image_phash=phash,
+        duplicate_of=duplicate_of,
         medicines=medicines,
         conflicts=conflicts,
         verification_score=score,
-        status="verified" if score >= 70 and len(conflicts) == 0 else "flagged"
+        status="verified" if score >= 70 and len(conflicts) == 0 else "flagged",
+        timings=timer.as_dict()
     )
 
     prescription_dict = prescription.model_dump()
-    prescription_dict['created_at'] = prescription_dict['created_at'].isoformat()
     
-    await db.prescriptions.insert_one(prescription_dict)
+    with timer.stage("saving"):
+        result = await db.prescriptions.replace_one({"id": prescription.id}, prescription_dict, upsert=True)
+    if result.upserted_id is not None:
+        await user_stats.prescriptions_added(user_id)
+
+    await active_drugs.replace(user_id, prescription_source(prescription.id), medicine_names)
 
     # Create alerts for conflicts
-    for conflict in conflicts:
-        alert = Alert(
-            user_id=user_id,
-            type="conflict",
-            severity="high",
-            title="Drug Interaction Detected",
-            message=conflict['description']
+    await raise_conflict_alerts(user_id, prescription.id, conflicts)
+
+    # The stored timings stop at scoring; the caller also sees the time spent saving
+    prescription_dict['timings'] = timer.as_dict()
+    return prescription_dict
+
+async def extract_text_medicines(text: str, timer: StageTimer, retry_errors: bool = False) -> List[dict]:
+    """Medicines from a typed prescription: local parse first, then the cached or live Gemini extraction
+
+    A failed Gemini call yields no medicines, or raises ExtractionFailed with ``retry_errors``.
+    """
+    # Simple prescriptions are parsed locally; Gemini only sees the ones the parser is unsure of
+    with timer.stage("local_parse"):
+        local = local_parser.parse(text)
+    if local_parser.accepts(local):
+        return local.medicines
+    # Reuse Gemini results for identical texts
+    cache_key = content_key("prescription-text", normalize_text(text).encode(), EXTRACTION_MODEL, PRESCRIPTION_PROMPT_VERSION)
+    with timer.stage("cache"):
+        parsed = await result_cache.get(cache_key)
+    if parsed is None:
+        with timer.stage("extract_text"):
+            medicines = await extract_medicines_from_text(text)
+        if medicines is None and retry_errors:
+            raise ExtractionFailed("Text extraction failed")
+        parsed = {"medicines": medicines or []}
+        if medicines is not None:
+            await result_cache.set(cache_key, parsed)
+    return parsed.get('medicines', [])
+
+async def save_text_prescription(
+    user_id: str,
+    text: str,
+    medicines: List[dict],
+    timer: StageTimer,
+    prescription_id: Optional[str] = None,
+    pending: bool = False
+) -> dict:
+    """Check conflicts, score and store a typed prescription, keyed by ID so reprocessing replaces it"""
+    medicine_names = [med['name'] for med in medicines]
+    prescription_id = prescription_id or str(uuid.uuid4())
+    with timer.stage("conflicts"):
+        conflicts = await check_drug_conflicts(medicine_names, user_id, prescription_source(prescription_id))
+    with timer.stage("scoring"):
+        score = await calculate_verification_score(medicines, conflicts, 1.0)
+
+    if pending:
+        status = "pending"
+    else:
+        status = "verified" if score >= 70 and len(conflicts) == 0 else "flagged"
+    prescription = Prescription(
+        id=prescription_id,
+        user_id=user_id,
+        type="text",
+        original_text=text,
+        extracted_text=text,
+        medicines=medicines,
+        conflicts=conflicts,
+        verification_score=score,
+        status=status,
+        timings=timer.as_dict()
+    )
+
+    prescription_dict = prescription.model_dump()
+
+    result = await db.prescriptions.replace_one({"id": prescription.id}, prescription_dict, upsert=True)
+    if result.upserted_id is not None:
+        await user_stats.prescriptions_added(user_id)
+    await active_drugs.replace(user_id, prescription_source(prescription.id), medicine_names)
+    await raise_conflict_alerts(user_id, prescription.id, conflicts)
+    return prescription_dict
+
+async def defer_image_prescription(user_id: str, upload: StoredUpload, prescription_id: str, error: DependencyUnavailable) -> dict:
+    """Store the upload as a pending prescription and queue its extraction for when Gemini is back"""
+    prescription = Prescription(
+        id=prescription_id,
+        user_id=user_id,
+        type="image",
+        image_ref=upload.digest,
+        image_content_type=upload.content_type,
+        image_size=upload.size
+    )
+    prescription_dict = prescription.model_dump()
+    result = await db.prescriptions.replace_one({"id": prescription.id}, prescription_dict, upsert=True)
+    if result.upserted_id is not None:
+        await user_stats.prescriptions_added(user_id)
+
+    job = await prescription_jobs.enqueue(
+        "prescription_image",
+        user_id,
+        {"upload": upload._asdict(), "prescription_id": prescription_id},
+        delay=error.retry_after
+    )
+    prescription_dict['job_id'] = job['id']
+    return prescription_dict
+
+async def run_prescription_job(job: dict, progress: Callable[[str], Awaitable[None]]) -> dict:
+    payload = job['payload']
+    # Transient model errors (timeouts, 5xx) fail the attempt so the queue retries with backoff;
+    # the last attempt saves whatever it got, as the synchronous path does
+    retry_errors = job['attempts'] < job['max_attempts']
+    if job['type'] == "prescription_text":
+        # Re-extraction of a typed prescription saved as pending while Gemini was unavailable
+        await progress("extracting")
+        timer = StageTimer()
+        medicines = await extract_text_medicines(payload['text'], timer, retry_errors)
+        await progress("saving")
+        prescription = await save_text_prescription(
+            job['user_id'], payload['text'], medicines, timer, prescription_id=payload['prescription_id']
+        )
+    else:
+        prescription = await process_image_prescription(
+            job['user_id'],
+            StoredUpload(**payload['upload']),
+            prescription_id=payload['prescription_id'],
+            progress=progress,
+            retry_errors=retry_errors
+        )
+    return {
+        "prescription_id": prescription['id'],
+        "status": prescription['status'],
+        "verification_score": prescription['verification_score'],
+        "timings": prescription['timings']
+    }
+
+# Background workers for mode=async image uploads and prescriptions deferred during outages
+prescription_jobs = JobQueue(db.prescription_jobs, run_prescription_job)
+
+@api_router.post("/prescriptions/upload-image")
+async def upload_prescription_image(
+    file: UploadFile = File(...),
+    mode: Literal["sync", "async"] = "sync",
+    idempotency_key: Optional[str] = Header(None),
+    user_id: str = Depends(get_current_user)
+):
+    # Stream the upload into the blob store, hashing and size-checking as it arrives
+    upload = await ingest_upload(file, blob_store)
+
+    if mode == "async":
+        # Hand the pipeline to the job workers and let the client poll or follow events
+        job = await prescription_jobs.enqueue(
+            "prescription_image",
+            user_id,
+            {"upload": upload._asdict(), "prescription_id": str(uuid.uuid4())},
+            idempotency_key=f"{user_id}:{idempotency_key}" if idempotency_key else None
         )
-        alert_dict = alert.model_dump()
-        alert_dict['created_at'] = alert_dict['created_at'].isoformat()
-        await db.alerts.insert_one(alert_dict)
+        return JSONResponse(status_code=202, content={
+            "job_id": job['id'],
+            "status": job['status'],
+            "status_url": f"/api/prescriptions/jobs/{job['id']}",
+            "events_url": f"/api/prescriptions/jobs/{job['id']}/events"
+        })
 
     # Return the full prescription object for frontend compatibility
-    return prescription_dict
+    prescription_id = str(uuid.uuid4())
+    try:
+        return await process_image_prescription(user_id, upload, prescription_id=prescription_id)
+    except DependencyUnavailable as e:
+        # Gemini is shedding load or its circuit is open: accept the scan now, extract it later
+        logging.warning(f"Deferring prescription image: {str(e)}")
+        return DocumentResponse(status_code=202, content=await defer_image_prescription(user_id, upload, prescription_id, e))
+
+@api_router.get("/prescriptions/jobs/{job_id}")
+async def get_prescription_job(job_id: str, user_id: str = Depends(get_current_user)):
+    job = await prescription_jobs.get(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.get("/prescriptions/jobs/{job_id}/events")
+async def stream_prescription_job(job_id: str, user_id: str = Depends(get_current_user)):
+    if not await prescription_jobs.get(job_id, user_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        prescription_jobs.events(job_id, user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @api_router.post("/prescriptions/submit-text")
 async def submit_prescription_text(
     prescription_data: PrescriptionCreate,
     user_id: str = Depends(get_current_user)
 ):
-    # Use Gemini to parse text and extract medicines
+    timer = StageTimer()
+    text = prescription_data.text or ""
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"Parse this prescription text and extract medicines. Format as JSON: {{'medicines': [{{'name': 'medicine name', 'dosage': 'dosage', 'frequency': 'frequency'}}]}} Prescription: {prescription_data.text}"
-        response = model.generate_content(prompt)
         try:
-            parsed = json.loads(response.text)
-        except Exception:
-            parsed = {"medicines": []}
-        
-        medicine_names = [med['name'] for med in parsed.get('medicines', [])]
-        conflicts = await check_drug_conflicts(medicine_names)
-        score = await calculate_verification_score(parsed.get('medicines', []), conflicts, 1.0)
-        
-        prescription = Prescription(
-            user_id=user_id,
-            type="text",
-            original_text=prescription_data.text,
-            extracted_text=prescription_data.text,
-            medicines=parsed.get('medicines', []),
-            conflicts=conflicts,
-            verification_score=score,
-            status="verified" if score >= 70 and len(conflicts) == 0 else "flagged"
-        )
-        
-        prescription_dict = prescription.model_dump()
-        prescription_dict['created_at'] = prescription_dict['created_at'].isoformat()
-        
-        await db.prescriptions.insert_one(prescription_dict)
-        
-        return prescription
+            medicines = await extract_text_medicines(text, timer)
+        except DependencyUnavailable as e:
+            # Keep what the local parser found and re-extract once Gemini accepts calls again
+            logging.warning(f"Deferring prescription text: {str(e)}")
+            prescription = await save_text_prescription(
+                user_id, text, local_parser.parse(text).medicines, timer, pending=True
+            )
+            job = await prescription_jobs.enqueue(
+                "prescription_text",
+                user_id,
+                {"text": text, "prescription_id": prescription['id']},
+                delay=e.retry_after
+            )
+            prescription['job_id'] = job['id']
+            return DocumentResponse(status_code=202, content=prescription)
+        return await save_text_prescription(user_id, text, medicines, timer)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/prescriptions", response_model=List[Prescription])
-async def get_prescriptions(user_id: str = Depends(get_current_user)):
-    prescriptions = await db.prescriptions.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    for p in prescriptions:
-        if isinstance(p['created_at'], str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
-    return prescriptions
+@api_router.get("/prescriptions", responses={200: {"model": List[Prescription]}})
+async def get_prescriptions(
+    request: Request,
+    include_image: bool = False,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    user_id: str = Depends(get_current_user)
+):
+    # Images are served by /prescriptions/{id}/image; only legacy inline copies are opt-in here
+    projection = model_projection(Prescription, () if include_image else ("image_base64",))
+    query = {"user_id": user_id}
+    if output == "ndjson":
+        return export_ndjson(db.prescriptions, query, "created_at", DESCENDING, projection)
+    prescriptions, next_cursor = await fetch_page(db.prescriptions, query, "created_at", DESCENDING, limit, cursor, projection)
+    return page_response(prescriptions, request, next_cursor)
 
-@api_router.get("/prescriptions/{prescription_id}")
+@api_router.get("/prescriptions/{prescription_id}", responses={200: {"model": Prescription}})
 async def get_prescription(prescription_id: str, user_id: str = Depends(get_current_user)):
     prescription = await db.prescriptions.find_one({"id": prescription_id, "user_id": user_id}, {"_id": 0})
     if not prescription:
         raise HTTPException(status_code=404, detail="Prescription not found")
-    if isinstance(prescription['created_at'], str):
-        prescription['created_at'] = datetime.fromisoformat(prescription['created_at'])
-    return prescription
+    return DocumentResponse(prescription)
+
+@api_router.get("/prescriptions/{prescription_id}/image")
+async def get_prescription_image(prescription_id: str, request: Request, user_id: str = Depends(get_current_user)):
+    prescription = await db.prescriptions.find_one(
+        {"id": prescription_id, "user_id": user_id},
+        {"_id": 0, "image_ref": 1, "image_content_type": 1, "image_base64": 1}
+    )
+    if not prescription:
+        raise HTTPException(status_code=404, detail="Prescription not found")
+
+    image_ref = prescription.get('image_ref')
+    size = await blob_store.size(image_ref) if image_ref else None
+    if size is None and prescription.get('image_base64'):
+        # Prescriptions created before the blob store keep their image inline
+        data = base64.b64decode(prescription['image_base64'])
+        image_ref = hashlib.sha256(data).hexdigest()
+        size = len(data)
+    elif size is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    else:
+        data = None
+
+    etag = f'"{image_ref}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable",
+    }
+    if request.headers.get("if-none-match") in (etag, "*"):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        byte_range = parse_range(request.headers.get("range"), size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    status_code = 200
+    start, end = 0, size - 1
+    if byte_range is not None:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    media_type = prescription.get('image_content_type') or "application/octet-stream"
+    if data is not None:
+        return Response(content=data[start:end + 1], status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(
+        blob_store.iter_range(image_ref, start, end),
+        status_code=status_code,
+        headers=headers,
+        media_type=media_type
+    )
+
+# Interaction endpoints
+@api_router.post("/interactions/check-batch")
+async def check_interactions_batch(batch: InteractionBatchRequest, user_id: str = Depends(get_current_user)):
+    return {"results": interaction_engine.check_batch(batch.regimens)}
 
 # Medicine stock endpoints
 @api_router.post("/medicines")
 async def add_medicine(medicine_data: MedicineCreate, user_id: str = Depends(get_current_user)):
     medicine = Medicine(user_id=user_id, **medicine_data.model_dump())
+    stock = stock_fields(medicine.quantity, medicine.daily_usage, medicine.created_at)
+    medicine.runout_date = stock['runout_date']
     medicine_dict = medicine.model_dump()
-    medicine_dict['created_at'] = medicine_dict['created_at'].isoformat()
+    medicine_dict.update(stock)
     
     await db.medicines.insert_one(medicine_dict)
-    
-    # Check for expiry alert
-    from datetime import date
-    expiry_date = datetime.strptime(medicine.expiry_date, '%Y-%m-%d').replace(tzinfo=timezone.utc)
-    days_until_expiry = (expiry_date - datetime.now(timezone.utc)).days
-    
-    if days_until_expiry <= 30:
-        alert = Alert(
-            user_id=user_id,
-            type="expiry",
-            severity="medium" if days_until_expiry <= 30 else "low",
-            title="Medicine Expiring Soon",
-            message=f"{medicine.name} expires in {days_until_expiry} days"
-        )
-        alert_dict = alert.model_dump()
-        alert_dict['created_at'] = alert_dict['created_at'].isoformat()
-        await db.alerts.insert_one(alert_dict)
-    
-    # Check stock level
-    if medicine.quantity <= 5:
-        alert = Alert(
-            user_id=user_id,
-            type="stock",
-            severity="high" if medicine.quantity <= 2 else "medium",
-            title="Low Stock Alert",
-            message=f"Only {medicine.quantity} units of {medicine.name} remaining"
-        )
-        alert_dict = alert.model_dump()
-        alert_dict['created_at'] = alert_dict['created_at'].isoformat()
-        await db.alerts.insert_one(alert_dict)
-    
+    await user_stats.medicine_added(user_id, medicine_dict)
+
+    # Check the new drug against the user's other medicines and prescriptions
+    conflicts = await active_drugs.track_medicine(user_id, None, medicine_dict)
+
+    # Conflict, expiry, low-stock and run-out alerts in one write; the sweeper raises the
+    # date-driven ones later as dates approach
+    await alert_sweeper.insert(conflict_alerts(user_id, medicine.id, conflicts) + medicine_alerts(medicine_dict))
     return medicine
 
-@api_router.get("/medicines", response_model=List[Medicine])
-async def get_medicines(user_id: str = Depends(get_current_user)):
-    medicines = await db.medicines.find({"user_id": user_id}, {"_id": 0}).to_list(100)
-    for m in medicines:
-        if isinstance(m['created_at'], str):
-            m['created_at'] = datetime.fromisoformat(m['created_at'])
-    return medicines
+@api_router.post("/medicines/import")
+async def import_medicines(request: Request, user_id: str = Depends(get_current_user)):
+    """Add many medicines from a JSON array or a CSV file (header: name,dosage,quantity,daily_usage,expiry_date)
+
+    Every row is validated before anything is written; if any row is invalid the import is
+    rejected with the errors of each bad row. Valid imports are written with one unordered
+    bulk write, and their conflict, expiry and stock alerts with one insert.
+    """
+    rows, errors = validate_rows(await read_rows(request), MedicineCreate)
+    if errors:
+        raise HTTPException(status_code=422, detail={"message": f"{len(errors)} invalid rows; nothing was imported", "rows": errors})
+
+    now = datetime.now(timezone.utc)
+    medicine_dicts = []
+    for row in rows:
+        medicine = Medicine(user_id=user_id, created_at=now, **row.model_dump())
+        stock = stock_fields(medicine.quantity, medicine.daily_usage, now)
+        medicine.runout_date = stock['runout_date']
+        medicine_dicts.append({**medicine.model_dump(), **stock})
+
+    failed = set()
+    try:
+        await db.medicines.bulk_write([InsertOne(doc) for doc in medicine_dicts], ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed.add(error["index"])
+        logging.warning(f"Medicine import: {len(failed)} of {len(medicine_dicts)} rows failed to write")
+    imported = [doc for i, doc in enumerate(medicine_dicts) if i not in failed]
+    await user_stats.medicines_added(user_id, imported)
+
+    # Checked before the new drugs join the active set, so they are not matched against themselves
+    conflicts = await import_conflicts(active_drugs, user_id, imported)
+    await active_drugs.add_many(user_id, [(medicine_source(doc['id']), [doc['name']]) for doc in imported if in_stock(doc)])
+
+    alerts = []
+    for medicine_id, conflict in conflicts:
+        alerts.extend(conflict_alerts(user_id, medicine_id, [conflict]))
+    for doc in imported:
+        alerts.extend(medicine_alerts(doc, now))
+    new_alerts = await alert_sweeper.insert(alerts)
+
+    return {
+        "imported": len(imported),
+        "failed": [{"row": i + 1, "name": medicine_dicts[i]['name']} for i in sorted(failed)],
+        "medicine_ids": [doc['id'] for doc in imported],
+        "conflicts": [conflict for _, conflict in conflicts],
+        "alerts_created": new_alerts
+    }
+
+@api_router.get("/medicines", responses={200: {"model": List[Medicine]}})
+async def get_medicines(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    user_id: str = Depends(get_current_user)
+):
+    projection = model_projection(Medicine)
+    query = {"user_id": user_id}
+    if output == "ndjson":
+        return export_ndjson(db.medicines, query, "created_at", ASCENDING, projection)
+    medicines, next_cursor = await fetch_page(db.medicines, query, "created_at", ASCENDING, limit, cursor, projection)
+    return page_response(medicines, request, next_cursor)
 
 @api_router.put("/medicines/{medicine_id}")
 async def update_medicine(
     medicine_id: str,
-    updates: dict,
+    medicine_update: MedicineUpdate,
     user_id: str = Depends(get_current_user)
 ):
-    result = await db.medicines.update_one(
-        {"id": medicine_id, "user_id": user_id},
-        {"$set": updates}
-    )
-    if result.modified_count == 0:
+    updates = medicine_update.model_dump(exclude_none=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    query = {"id": medicine_id, "user_id": user_id}
+    for _ in range(3):
+        changes, match = dict(updates), query
+        if 'quantity' in updates or 'daily_usage' in updates:
+            # Re-project the run-out date in the same write, conditional on the counts it was
+            # computed from; a higher count starts a new stock cycle
+            current = await db.medicines.find_one(query, {"_id": 0, "quantity": 1, "daily_usage": 1})
+            if current is None:
+                raise HTTPException(status_code=404, detail="Medicine not found")
+            quantity = updates.get('quantity', current.get('quantity', 0))
+            changes.update(stock_fields(quantity, updates.get('daily_usage', current.get('daily_usage', 1))))
+            if quantity > current.get('quantity', 0):
+                changes['restocked_at'] = changes['stock_counted_at']
+            match = {**query, "quantity": current.get('quantity'), "daily_usage": current.get('daily_usage')}
+        before = await db.medicines.find_one_and_update(
+            match,
+            {"$set": changes},
+            return_document=ReturnDocument.BEFORE
+        )
+        if before is not None or match is query:
+            break
+        # The counts changed since they were read: recompute from the new ones
+    else:
+        raise HTTPException(status_code=409, detail="Medicine was changed concurrently, please retry")
+    if before is None:
         raise HTTPException(status_code=404, detail="Medicine not found")
+    after = {**before, **changes}
+    await user_stats.medicine_updated(user_id, before, after)
+    # A renamed, used-up or restocked medicine moves in the active set; re-check what joins it
+    conflicts = await active_drugs.track_medicine(user_id, before, after)
+    await alert_sweeper.insert(conflict_alerts(user_id, medicine_id, conflicts) + medicine_alerts(after))
     return {"message": "Updated successfully"}
 
 @api_router.delete("/medicines/{medicine_id}")
 async def delete_medicine(medicine_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.medicines.delete_one({"id": medicine_id, "user_id": user_id})
-    if result.deleted_count == 0:
+    medicine = await db.medicines.find_one_and_delete({"id": medicine_id, "user_id": user_id})
+    if medicine is None:
         raise HTTPException(status_code=404, detail="Medicine not found")
+    await user_stats.medicine_removed(user_id, medicine)
+    await active_drugs.remove(user_id, medicine_source(medicine_id))
     return {"message": "Deleted successfully"}
 
 # Chat assistant endpoints
-@api_router.post("/chat")
-async def chat_with_ai(chat_request: ChatRequest, user_id: str = Depends(get_current_user)):
+async def summarize_chat(prompt: str) -> str:
+    response = await inference.generate(CHAT_MODEL, prompt)
+    return response.text
+
+# Recent turns within a token budget plus a rolling per-session summary
+chat_context = ChatContextBuilder(db.chat_messages, db.chat_sessions, summarize_chat)
+
+async def save_chat_message(user_id: str, session_id: str, role: str, content: str) -> ChatMessage:
+    message = ChatMessage(
+        user_id=user_id,
+        session_id=session_id,
+        role=role,
+        content=content
+    )
+    message_dict = message.model_dump()
+    await db.chat_messages.insert_one(message_dict)
+    await chat_sessions.record(message_dict)
+    return message
+
+async def prepare_chat_turn(user_id: str, chat_request: ChatRequest) -> tuple:
+    """Load context for a chat turn and save the user message; returns (session_id, history, prompt)"""
     session_id = chat_request.session_id or str(uuid.uuid4())
     
-    # Get chat history
-    history = await db.chat_messages.find(
-        {"user_id": user_id, "session_id": session_id},
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(50)
+    # Chat history and the user's medicines are independent, so fetch them concurrently
+    context, medicines = await asyncio.gather(
+        chat_context.build(user_id, session_id),
+        db.medicines.find({"user_id": user_id}, {"_id": 0, "name": 1, "dosage": 1}).to_list(5)
+    )
     
     # Save user message
-    user_msg = ChatMessage(
-        user_id=user_id,
-        session_id=session_id,
-        role="user",
-        content=chat_request.message
-    )
-    user_msg_dict = user_msg.model_dump()
-    user_msg_dict['timestamp'] = user_msg_dict['timestamp'].isoformat()
-    await db.chat_messages.insert_one(user_msg_dict)
+    await save_chat_message(user_id, session_id, "user", chat_request.message)
+    
+    medicine_list = ", ".join([f"{m['name']} ({m['dosage']})" for m in medicines])
+    history = context.render()
+    if history:
+        history += "\n\n"
+    prompt = f"""You are MediAssist, a helpful AI health assistant. You help patients with symptom analysis, medication information, and general health guidance.\nUser's current medications: {medicine_list or 'None'}\nImportant:\n- Provide helpful information but always recommend consulting a doctor for serious symptoms\n- Be empathetic and clear\n- If asked about drug interactions, check their medication list\n- Never provide emergency medical advice - always recommend calling emergency services for urgent issues\n\n{history}User: {chat_request.message}"""
+    return session_id, context.recent, prompt
+
+@api_router.post("/chat")
+async def chat_with_ai(chat_request: ChatRequest, user_id: str = Depends(get_current_user)):
+    # Fail fast with 503 while Gemini's circuit is open, before the user message is stored
+    inference.ensure_available()
+    session_id, history, prompt = await prepare_chat_turn(user_id, chat_request)
     
     try:
-        # Get user's medicines for context
-        medicines = await db.medicines.find({"user_id": user_id}, {"_id": 0, "name": 1, "dosage": 1}).to_list(100)
-        medicine_list = ", ".join([f"{m['name']} ({m['dosage']})" for m in medicines[:5]])
-
-        genai.configure(api_key=GEMINI_API_KEY)
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        prompt = f"""You are MediAssist, a helpful AI health assistant. You help patients with symptom analysis, medication information, and general health guidance.\nUser's current medications: {medicine_list or 'None'}\nImportant:\n- Provide helpful information but always recommend consulting a doctor for serious symptoms\n- Be empathetic and clear\n- If asked about drug interactions, check their medication list\n- Never provide emergency medical advice - always recommend calling emergency services for urgent issues\n\nUser: {chat_request.message}"""
-        response = model.generate_content(prompt)
+        with stage("chat_llm"):
+            response = await inference.generate(CHAT_MODEL, prompt)
         response_text = response.text if hasattr(response, 'text') else str(response)
 
         # Save assistant message
-        assistant_msg = ChatMessage(
-            user_id=user_id,
-            session_id=session_id,
-            role="assistant",
-            content=response_text
-        )
-        assistant_msg_dict = assistant_msg.model_dump()
-        assistant_msg_dict['timestamp'] = assistant_msg_dict['timestamp'].isoformat()
-        await db.chat_messages.insert_one(assistant_msg_dict)
+        await save_chat_message(user_id, session_id, "assistant", response_text)
 
         return {"response": response_text, "session_id": session_id}
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/chat/stream")
+async def chat_with_ai_stream(chat_request: ChatRequest, user_id: str = Depends(get_current_user)):
+    """Server-sent events: session, then one token event per chunk, then done (or error)"""
+    inference.ensure_available()
+    session_id, history, prompt = await prepare_chat_turn(user_id, chat_request)
+
+    async def events():
+        yield sse_event("session", {"session_id": session_id})
+        parts = []
+        try:
+            async for text in inference.stream(CHAT_MODEL, prompt):
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+        except Exception as e:
+            logging.error(f"Chat stream error: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+            return
+        # Persist the assistant reply only once the full completion has arrived
+        assistant_msg = await save_chat_message(user_id, session_id, "assistant", "".join(parts))
+        yield sse_event("done", {"session_id": session_id, "message_id": assistant_msg.id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @api_router.get("/chat/history/{session_id}")
-async def get_chat_history(session_id: str, user_id: str = Depends(get_current_user)):
-    messages = await db.chat_messages.find(
-        {"user_id": user_id, "session_id": session_id},
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(100)
-    
-    for msg in messages:
-        if isinstance(msg['timestamp'], str):
-            msg['timestamp'] = datetime.fromisoformat(msg['timestamp'])
-    
-    return messages
+async def get_chat_history(
+    session_id: str,
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    user_id: str = Depends(get_current_user)
+):
+    query = {"user_id": user_id, "session_id": session_id}
+    if output == "ndjson":
+        return export_ndjson(db.chat_messages, query, "timestamp", ASCENDING)
+    messages, next_cursor = await fetch_page(db.chat_messages, query, "timestamp", ASCENDING, limit, cursor)
+    return page_response(messages, request, next_cursor)
 
 @api_router.get("/chat/sessions")
-async def get_chat_sessions(user_id: str = Depends(get_current_user)):
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$sort": {"timestamp": -1}},
-        {"$group": {
-            "_id": "$session_id",
-            "last_message": {"$first": "$content"},
-            "last_timestamp": {"$first": "$timestamp"}
-        }}
-    ]
-    sessions = await db.chat_messages.aggregate(pipeline).to_list(100)
-    return [{"session_id": s['_id'], "last_message": s['last_message'][:50], "last_timestamp": s['last_timestamp']} for s in sessions]
+async def get_chat_sessions(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    sessions, next_cursor = await chat_sessions.page(user_id, limit, cursor)
+    return page_response([{
+        "session_id": s['session_id'],
+        "last_message": s['last_message'],
+        "last_timestamp": s['last_timestamp'],
+        "message_count": s.get('message_count', 0)
+    } for s in sessions], request, next_cursor)
 
 # Alerts endpoints
-@api_router.get("/alerts", response_model=List[Alert])
-async def get_alerts(user_id: str = Depends(get_current_user)):
-    alerts = await db.alerts.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
-    for a in alerts:
-        if isinstance(a['created_at'], str):
-            a['created_at'] = datetime.fromisoformat(a['created_at'])
-    return alerts
+@api_router.get("/alerts", responses={200: {"model": List[Alert]}})
+async def get_alerts(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    output: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+    user_id: str = Depends(get_current_user)
+):
+    projection = model_projection(Alert)
+    query = {"user_id": user_id}
+    if output == "ndjson":
+        return export_ndjson(db.alerts, query, "created_at", DESCENDING, projection)
+    alerts, next_cursor = await fetch_page(db.alerts, query, "created_at", DESCENDING, limit, cursor, projection)
+    return page_response(alerts, request, next_cursor)
 
 @api_router.put("/alerts/{alert_id}/read")
 async def mark_alert_read(alert_id: str, user_id: str = Depends(get_current_user)):
-    result = await db.alerts.update_one(
+    before = await db.alerts.find_one_and_update(
         {"id": alert_id, "user_id": user_id},
-        {"$set": {"is_read": True}}
+        {"$set": {"is_read": True}},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.modified_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Alert not found")
+    if not before.get('is_read'):
+        await user_stats.alert_read(user_id)
     return {"message": "Alert marked as read"}
 
 @api_router.get("/dashboard/stats")
-async def get_dashboard_stats(user_id: str = Depends(get_current_user)):
-    prescriptions_count = await db.prescriptions.count_documents({"user_id": user_id})
-    medicines_count = await db.medicines.count_documents({"user_id": user_id})
-    alerts_count = await db.alerts.count_documents({"user_id": user_id, "is_read": False})
-    
-    # Get medicines expiring soon
-    medicines = await db.medicines.find({"user_id": user_id}, {"_id": 0}).to_list(100)
-    expiring_soon = 0
-    low_stock = 0
-    
-    for med in medicines:
-        if med.get('quantity', 0) <= 5:
-            low_stock += 1
-        try:
-            expiry = datetime.fromisoformat(med['expiry_date'])
-            if (expiry - datetime.now(timezone.utc)).days <= 30:
-                expiring_soon += 1
-        except:
-            pass
-    
-    return {
-        "total_prescriptions": prescriptions_count,
-        "total_medicines": medicines_count,
-        "unread_alerts": alerts_count,
-        "expiring_soon": expiring_soon,
-        "low_stock": low_stock
-    }
+async def get_dashboard_stats(refresh: bool = False, user_id: str = Depends(get_current_user)):
+    # O(1) read of the maintained counters; refresh=true recounts with one aggregation
+    return await user_stats.get(user_id, refresh=refresh)
 
-# Include router
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["http://localhost:3000"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+@api_router.get("/inference/stats")
+async def get_inference_stats(user_id: str = Depends(get_current_user)):
+    return {**inference.stats(), "result_cache": result_cache.stats(), "fda": fda_client.cache_info()}
 
 logging.basicConfig(
     level=logging.INFO,
@@ -621,6 +1158,67 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+async def dependency_unavailable(request: Request, exc: DependencyUnavailable) -> JSONResponse:
+    """Shed requests that need an unavailable dependency with 503 and a Retry-After hint"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "dependency": exc.dependency},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))}
+    )
+
+async def startup_services():
+    await ensure_indexes(db)
+    if INDEX_CHECK_ON_STARTUP:
+        for row in await check_query_plans(db):
+            if row['collscan']:
+                logger.warning(f"Query {row['query']} on {row['collection']} runs a COLLSCAN")
+    prescription_jobs.start()
+    alert_sweeper.start()
+
+async def shutdown_services():
+    await prescription_jobs.stop()
+    await alert_sweeper.stop()
+    await chat_context.close()
+    db.close()
+    image_preprocessor.close()
+    await fda_client.close()
+    password_hasher.close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await startup_services()
+    try:
+        yield
+    finally:
+        await shutdown_services()
+
+async def metrics() -> Response:
+    """Prometheus scrape endpoint: request, stage and Mongo command latency histograms"""
+    return metrics_response()
+
+def create_app() -> FastAPI:
+    """Build the ASGI app; each worker process creates its clients and pools on first use"""
+    app = FastAPI(lifespan=lifespan)
+    app.include_router(api_router)
+    app.add_exception_handler(DependencyUnavailable, dependency_unavailable)
+    # Refuse oversized uploads before Starlette spools their multipart bodies to disk
+    app.add_middleware(RequestSizeLimit, limits={
+        "/api/prescriptions/upload-image": MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES,
+        "/api/medicines/import": MEDICINE_IMPORT_MAX_BYTES + MULTIPART_OVERHEAD_BYTES,
+    })
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["http://localhost:3000"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+        # Let browser dev tools show the per-stage breakdown and profile ID of cross-origin
+        # requests, and the frontend read the next-page cursor of list endpoints
+        expose_headers=["Server-Timing", "X-Profile-Id", "X-Next-Cursor", "Link"],
+    )
+    # Outermost, so request latency includes every other middleware
+    app.add_middleware(MetricsMiddleware)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+    return app
+
+app = create_app()
@@ -0,0 +1,151 @@
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Iterable, Optional
+
+EXPIRY_WINDOW_DAYS = 30
+LOW_STOCK_THRESHOLD = 5
+
+COUNTERS = ("total_prescriptions", "total_medicines", "unread_alerts", "low_stock")
+
+
+def expiry_key(expiry_date) -> Optional[str]:
+    """Normalise a medicine's expiry date to its YYYY-MM-DD bucket, or None if unparseable"""
+    try:
+        return datetime.strptime(str(expiry_date)[:10], '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+
+def expiry_cutoff(now: Optional[datetime] = None) -> str:
+    """Last expiry date that still counts as expiring soon"""
+    now = now or datetime.now(timezone.utc)
+    return (now + timedelta(days=EXPIRY_WINDOW_DAYS)).date().isoformat()
+
+
+def is_low_stock(medicine: dict) -> bool:
+    return medicine.get('quantity', 0) <= LOW_STOCK_THRESHOLD
+
+
+class UserStats:
+    """Per-user dashboard counters kept up to date with atomic $inc on every write
+
+    Expiring-soon depends on the current date, so medicines are counted per expiry date
+    and the buckets up to the cutoff are summed on read.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.collection = db.user_stats
+
+    async def create(self, user_id: str):
+        """Start an empty stats document for a new user"""
+        await self.collection.update_one(
+            {"user_id": user_id},
+            {"$setOnInsert": {**{name: 0 for name in COUNTERS}, "expiry_buckets": {}}},
+            upsert=True,
+        )
+
+    async def _inc(self, user_id: str, changes: dict):
+        changes = {k: v for k, v in changes.items() if v}
+        if not changes:
+            return
+        try:
+            # No upsert: users without a document are seeded from the collections on read
+            await self.collection.update_one({"user_id": user_id}, {"$inc": changes})
+        except Exception as e:
+            logging.warning(f"User stats update error: {str(e)}")
+
+    @staticmethod
+    def _medicine_changes(medicine: dict, sign: int) -> dict:
+        changes = {"total_medicines": sign, "low_stock": sign if is_low_stock(medicine) else 0}
+        key = expiry_key(medicine.get('expiry_date'))
+        if key:
+            changes[f"expiry_buckets.{key}"] = sign
+        return changes
+
+    async def medicine_added(self, user_id: str, medicine: dict):
+        await self._inc(user_id, self._medicine_changes(medicine, 1))
+
+    async def medicines_added(self, user_id: str, medicines: Iterable[dict]):
+        """One $inc for a batch of new medicines"""
+        changes: Dict[str, int] = {}
+        for medicine in medicines:
+            for key, value in self._medicine_changes(medicine, 1).items():
+                changes[key] = changes.get(key, 0) + value
+        await self._inc(user_id, changes)
+
+    async def medicine_removed(self, user_id: str, medicine: dict):
+        await self._inc(user_id, self._medicine_changes(medicine, -1))
+
+    async def medicine_updated(self, user_id: str, before: dict, after: dict):
+        changes = self._medicine_changes(after, 1)
+        for key, value in self._medicine_changes(before, -1).items():
+            changes[key] = changes.get(key, 0) + value
+        await self._inc(user_id, changes)
+
+    async def prescriptions_added(self, user_id: str, count: int = 1):
+        await self._inc(user_id, {"total_prescriptions": count})
+
+    async def alerts_added(self, user_id: str, count: int = 1):
+        await self._inc(user_id, {"unread_alerts": count})
+
+    async def alert_read(self, user_id: str):
+        await self._inc(user_id, {"unread_alerts": -1})
+
+    async def compute(self, user_id: str) -> dict:
+        """Recount everything in a single aggregation round trip"""
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$project": {"_id": 0, "kind": "medicine", "quantity": 1, "expiry_date": 1}},
+            {"$unionWith": {"coll": "prescriptions", "pipeline": [
+                {"$match": {"user_id": user_id}},
+                {"$project": {"_id": 0, "kind": "prescription"}},
+            ]}},
+            {"$unionWith": {"coll": "alerts", "pipeline": [
+                {"$match": {"user_id": user_id, "is_read": False}},
+                {"$project": {"_id": 0, "kind": "alert"}},
+            ]}},
+            {"$facet": {
+                "kinds": [{"$group": {"_id": "$kind", "count": {"$sum": 1}}}],
+                "low_stock": [
+                    {"$match": {"kind": "medicine", "quantity": {"$lte": LOW_STOCK_THRESHOLD}}},
+                    {"$count": "count"},
+                ],
+                "expiry_buckets": [
+                    {"$match": {"kind": "medicine"}},
+                    {"$group": {"_id": {"$substrCP": [{"$toString": "$expiry_date"}, 0, 10]}, "count": {"$sum": 1}}},
+                ],
+            }},
+        ]
+        result = (await self.db.medicines.aggregate(pipeline).to_list(1))[0]
+        kinds = {row["_id"]: row["count"] for row in result["kinds"]}
+        buckets = {}
+        for row in result["expiry_buckets"]:
+            key = expiry_key(row["_id"])
+            if key:
+                buckets[key] = buckets.get(key, 0) + row["count"]
+        return {
+            "total_prescriptions": kinds.get("prescription", 0),
+            "total_medicines": kinds.get("medicine", 0),
+            "unread_alerts": kinds.get("alert", 0),
+            "low_stock": result["low_stock"][0]["count"] if result["low_stock"] else 0,
+            "expiry_buckets": buckets,
+        }
+
+    async def rebuild(self, user_id: str) -> dict:
+        counts = await self.compute(user_id)
+        await self.collection.update_one({"user_id": user_id}, {"$set": counts}, upsert=True)
+        return counts
+
+    async def get(self, user_id: str, refresh: bool = False) -> dict:
+        doc = None if refresh else await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+        if doc is None:
+            doc = await self.rebuild(user_id)
+        cutoff = expiry_cutoff()
+        return {
+            "total_prescriptions": doc.get("total_prescriptions", 0),
+            "total_medicines": doc.get("total_medicines", 0),
+            "unread_alerts": doc.get("unread_alerts", 0),
+            "expiring_soon": sum(n for day, n in doc.get("expiry_buckets", {}).items() if day <= cutoff),
+            "low_stock": doc.get("low_stock", 0),
+        }
@@ -0,0 +1,19 @@
+from typing import AsyncIterator
+
+from responses import dumps
+
+
+def sse_event(event: str, data) -> str:
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+# Comment line that keeps proxies from closing an idle event stream
+SSE_KEEPALIVE = ": keepalive\n\n"
+
+
+async def ndjson_lines(cursor) -> AsyncIterator[bytes]:
+    """Serialise documents from a Motor cursor one line at a time as they arrive"""
+    async for doc in cursor:
+        doc.pop("_id", None)
+        yield dumps(doc) + b"\n"
@@ -0,0 +1,28 @@
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from metrics import record_stage
+
+
+class StageTimer:
+    """Wall-clock milliseconds per named pipeline stage; repeated stages accumulate
+
+    Each stage is also observed in the stage latency histogram and the request's Server-Timing.
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+            record_stage(name, seconds)
+
+    def as_dict(self) -> Dict[str, float]:
+        return {name: round(ms, 2) for name, ms in self.stages.items()}
@@ -0,0 +1,119 @@
+import os
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+from blob_store import BlobStore
+
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(256 * 1024)))
+# Room for the multipart boundary, part headers and small form fields around the file
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# Enough leading bytes to tell every accepted format apart
+_SNIFF_BYTES = 16
+_HEIF_BRANDS = {b"heic": "image/heic", b"heix": "image/heic", b"heif": "image/heif", b"mif1": "image/heif"}
+
+
+class StoredUpload(NamedTuple):
+    digest: str
+    size: int
+    content_type: str
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Detect the image formats Gemini accepts from their magic numbers"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp":
+        return _HEIF_BRANDS.get(head[8:12])
+    return None
+
+
+async def ingest_upload(
+    file: UploadFile,
+    store: BlobStore,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> StoredUpload:
+    """Stream an uploaded image into the blob store in chunks
+
+    The content type is sniffed from the first bytes and the size limit is enforced as
+    data arrives, so memory use per upload stays at one chunk whatever the file size.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+
+    head = b""
+    while len(head) < _SNIFF_BYTES:
+        chunk = await file.read(_SNIFF_BYTES - len(head))
+        if not chunk:
+            break
+        head += chunk
+    content_type = sniff_image_type(head)
+    if content_type is None:
+        raise HTTPException(status_code=415, detail="Unsupported image type; upload a JPEG, PNG, WEBP or HEIC image")
+
+    writer = store.writer()
+    try:
+        await writer.write(head)
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            if writer.size + len(chunk) > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Image exceeds {max_bytes} bytes")
+            await writer.write(chunk)
+        digest = await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+    return StoredUpload(digest=digest, size=writer.size, content_type=content_type)
+
+
+def _too_large(limit: int) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+
+class RequestSizeLimit:
+    """ASGI middleware capping request bodies on upload paths before they are parsed
+
+    Starlette spools a whole multipart body to a temp file before the endpoint runs, so the
+    size checks inside the endpoints come too late to protect memory and disk. A declared
+    Content-Length over the path's limit is refused with 413 before any of the body is read;
+    otherwise the body is counted as it arrives and reading stops with 413 once it passes.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        for key, value in scope.get("headers", ()):
+            if key == b"content-length" and value.isdigit() and int(value) > limit:
+                error = _too_large(limit)
+                await JSONResponse(status_code=error.status_code, content={"detail": error.detail})(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes the response
+                    raise _too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+# Keep uploads made while importing or exercising the server out of the source tree
+os.environ.setdefault('BLOB_STORE_DIR', tempfile.mkdtemp(prefix='mediassist-tests-'))
+
+
+@pytest.fixture
+def server_db(monkeypatch):
+    """The server module's database, swapped for an empty in-memory one"""
+    from mongomock_motor import AsyncMongoMockClient
+    import server
+
+    monkeypatch.setattr(server.db, '_client', AsyncMongoMockClient(tz_aware=True))
+    return server.db
+
+
+@pytest.fixture
+def mock_db():
+    """An empty in-memory Motor database"""
+    from mongomock_motor import AsyncMongoMockClient
+
+    return AsyncMongoMockClient(tz_aware=True)['mediassist_test']
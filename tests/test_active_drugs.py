@@ -0,0 +1,149 @@
+import asyncio
+
+import pytest
+
+from active_drugs import ActiveDrugs, in_stock, medicine_source, prescription_source, rebuild
+from interactions import InteractionEngine
+
+USER_ID = "active-drugs-test"
+
+
+@pytest.fixture
+def engine() -> InteractionEngine:
+    engine = InteractionEngine()
+    engine.add_drug("warfarin", aliases=["Coumadin"])
+    engine.add_interaction("warfarin", "aspirin", "high")
+    engine.add_interaction("warfarin", "ibuprofen", "medium")
+    return engine
+
+
+@pytest.fixture
+def active(mock_db, engine) -> ActiveDrugs:
+    return ActiveDrugs(mock_db.active_drugs, engine)
+
+
+def medicine(medicine_id: str, name: str, quantity: int = 10) -> dict:
+    return {"id": medicine_id, "user_id": USER_ID, "name": name, "quantity": quantity}
+
+
+async def drugs(active: ActiveDrugs) -> dict:
+    docs = await active.collection.find({"user_id": USER_ID}, {"_id": 0}).to_list(None)
+    return {doc["drug"]: sorted(doc["sources"]) for doc in docs}
+
+
+def pairs(conflicts) -> list:
+    return sorted((c["drug1"], c["drug2"]) for c in conflicts)
+
+
+def test_in_stock():
+    assert in_stock({"quantity": 1})
+    assert not in_stock({"quantity": 0})
+    assert not in_stock({})
+
+
+def test_sources_share_a_drug_until_the_last_one_is_removed(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("m1"), ["Coumadin 5mg", "unknown drug"])
+        await active.add(USER_ID, prescription_source("p1"), ["warfarin", "aspirin"])
+        assert await drugs(active) == {
+            "warfarin": [medicine_source("m1"), prescription_source("p1")],
+            "aspirin": [prescription_source("p1")],
+        }
+        await active.remove(USER_ID, prescription_source("p1"))
+        assert await drugs(active) == {"warfarin": [medicine_source("m1")]}
+        await active.replace(USER_ID, medicine_source("m1"), ["aspirin"])
+        assert await drugs(active) == {"aspirin": [medicine_source("m1")]}
+
+    asyncio.run(scenario())
+
+
+def test_conflicts_check_new_drugs_against_the_active_set(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("m1"), ["warfarin"])
+        assert pairs(await active.conflicts(USER_ID, ["aspirin", "ibuprofen", "metformin"])) == [
+            ("aspirin", "warfarin"), ("ibuprofen", "warfarin")
+        ]
+        assert await active.conflicts(USER_ID, ["metformin"]) == []
+        # Another user's regimen is never consulted
+        assert await active.conflicts("someone-else", ["aspirin"]) == []
+
+    asyncio.run(scenario())
+
+
+def test_conflicts_ignore_drugs_only_the_checked_source_added(active):
+    async def scenario():
+        await active.add(USER_ID, prescription_source("p1"), ["warfarin"])
+        assert await active.conflicts(USER_ID, ["aspirin"], source=prescription_source("p1")) == []
+        await active.add(USER_ID, medicine_source("m1"), ["warfarin"])
+        assert pairs(await active.conflicts(USER_ID, ["aspirin"], source=prescription_source("p1"))) == [
+            ("aspirin", "warfarin")
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_medicine_leaves_the_set_at_zero_quantity_and_rejoins_when_restocked(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("m1"), ["warfarin"])
+        aspirin = medicine("m2", "aspirin", quantity=2)
+        assert pairs(await active.track_medicine(USER_ID, None, aspirin)) == [("aspirin", "warfarin")]
+
+        used_up = {**aspirin, "quantity": 0}
+        assert await active.track_medicine(USER_ID, aspirin, used_up) == []
+        assert "aspirin" not in await drugs(active)
+        # An out-of-stock drug no longer conflicts with new ones
+        assert await active.conflicts(USER_ID, ["warfarin"]) == []
+
+        restocked = {**aspirin, "quantity": 30}
+        assert pairs(await active.track_medicine(USER_ID, used_up, restocked)) == [("aspirin", "warfarin")]
+        assert await drugs(active) == {
+            "warfarin": [medicine_source("m1")],
+            "aspirin": [medicine_source("m2")],
+        }
+        # Counting stock down without reaching 0 leaves the set alone
+        assert await active.track_medicine(USER_ID, restocked, {**restocked, "quantity": 29}) == []
+
+    asyncio.run(scenario())
+
+
+def test_medicine_added_without_stock_stays_out_of_the_set(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("m1"), ["warfarin"])
+        assert await active.track_medicine(USER_ID, None, medicine("m2", "aspirin", quantity=0)) == []
+        assert await drugs(active) == {"warfarin": [medicine_source("m1")]}
+
+    asyncio.run(scenario())
+
+
+def test_renamed_medicine_swaps_its_drug(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("m1"), ["warfarin"])
+        before = medicine("m2", "metformin")
+        await active.track_medicine(USER_ID, None, before)
+        conflicts = await active.track_medicine(USER_ID, before, {**before, "name": "ibuprofen"})
+        assert pairs(conflicts) == [("ibuprofen", "warfarin")]
+        assert await drugs(active) == {
+            "warfarin": [medicine_source("m1")],
+            "ibuprofen": [medicine_source("m2")],
+        }
+
+    asyncio.run(scenario())
+
+
+def test_rebuild_skips_out_of_stock_medicines(mock_db, engine):
+    async def scenario():
+        await mock_db.medicines.insert_many([
+            medicine("m1", "warfarin"),
+            medicine("m2", "aspirin", quantity=0),
+        ])
+        await mock_db.prescriptions.insert_one(
+            {"id": "p1", "user_id": USER_ID, "medicines": [{"name": "ibuprofen"}, {"name": "unknown"}]}
+        )
+        await mock_db.active_drugs.insert_one({"user_id": USER_ID, "drug": "stale", "sources": ["medicine:gone"]})
+        assert await rebuild(mock_db, engine) == 2
+        assert await drugs(ActiveDrugs(mock_db.active_drugs, engine)) == {
+            "warfarin": [medicine_source("m1")],
+            "ibuprofen": [prescription_source("p1")],
+        }
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from alert_sweeper import RUNOUT_WINDOW_DAYS, SWEEP_ID, AlertSweeper
+from indexes import INDEXES, ensure_indexes
+from stats import EXPIRY_WINDOW_DAYS
+
+USER_ID = "sweeper-test"
+DAY = datetime(2030, 1, 1, 9, tzinfo=timezone.utc)
+
+
+def on(days: int) -> str:
+    return (DAY.date() + timedelta(days=days)).isoformat()
+
+
+def medicine(medicine_id: str, expiry_days: int = 365, runout_days: int = None) -> dict:
+    return {
+        "id": medicine_id,
+        "user_id": USER_ID,
+        "name": medicine_id,
+        "quantity": 50,
+        "daily_usage": 1,
+        "expiry_date": on(expiry_days),
+        "runout_date": on(runout_days) if runout_days is not None else None,
+    }
+
+
+@pytest.fixture
+def added() -> Counter:
+    """New alerts per user, as reported to the stats counters"""
+    return Counter()
+
+
+@pytest.fixture
+def sweeper(mock_db, added) -> AlertSweeper:
+    async def on_alerts(user_id: str, count: int):
+        added[user_id] += count
+
+    asyncio.run(ensure_indexes(mock_db, [spec for spec in INDEXES if spec.collection in ("alerts", "alert_sweeps")]))
+    return AlertSweeper(mock_db, on_alerts=on_alerts, interval=3600)
+
+
+async def alerts(sweeper: AlertSweeper) -> list:
+    docs = await sweeper.db.alerts.find({}, {"_id": 0}).to_list(None)
+    return sorted((doc["title"], doc["message"].split()[0]) for doc in docs)
+
+
+def test_consecutive_sweeps_alert_each_state_once(sweeper, added):
+    async def scenario():
+        await sweeper.db.medicines.insert_many([
+            medicine("inside", expiry_days=10),
+            # Enters the expiry window on the second day
+            medicine("edge", expiry_days=EXPIRY_WINDOW_DAYS + 1),
+            medicine("runout", runout_days=RUNOUT_WINDOW_DAYS),
+            medicine("far"),
+        ])
+        assert await sweeper.sweep(DAY) == 2
+        assert await alerts(sweeper) == [("Medicine Expiring Soon", "inside"), ("Medicine Running Out", "runout")]
+
+        # The watermarks only let the day's new entrants through
+        assert await sweeper.sweep(DAY + timedelta(days=1)) == 1
+        assert ("Medicine Expiring Soon", "edge") in await alerts(sweeper)
+
+        # A medicine added behind the watermark is not swept; it was alerted when it was written
+        await sweeper.db.medicines.insert_one(medicine("late", expiry_days=5))
+        assert await sweeper.sweep(DAY + timedelta(days=2)) == 0
+
+        # Passing the expiry date is a new state with its own alert
+        assert await sweeper.sweep(DAY + timedelta(days=11)) == 2
+        assert {("Medicine Expired", "inside"), ("Medicine Expired", "late")} <= set(await alerts(sweeper))
+        assert added == {USER_ID: 5}
+
+    asyncio.run(scenario())
+
+
+def test_resweeping_a_range_does_not_duplicate_alerts(sweeper, added):
+    async def scenario():
+        await sweeper.db.medicines.insert_many([medicine("a", expiry_days=3), medicine("b", runout_days=1)])
+        assert await sweeper.sweep(DAY) == 2
+        # Lost watermarks (e.g. a sweep that died after inserting) re-read the range: the uuid5 IDs dedupe it
+        await sweeper.db.alert_sweeps.delete_many({})
+        assert await sweeper.sweep(DAY) == 0
+        assert await sweeper.db.alerts.count_documents({}) == 2
+        assert added == {USER_ID: 2}
+
+    asyncio.run(scenario())
+
+
+def test_overlapping_sweep_waits_for_the_lease(sweeper):
+    async def scenario():
+        await sweeper.db.medicines.insert_one(medicine("a", expiry_days=3))
+        # Another worker holds the lease and dies before finishing its sweep
+        assert await sweeper._claim(DAY) is not None
+        assert await sweeper.sweep(DAY) is None
+        assert await sweeper.sweep(DAY + timedelta(seconds=30)) is None
+        assert await sweeper.db.alerts.count_documents({}) == 0
+
+        # Once the lease runs out the next worker takes over from the unchanged watermarks
+        later = DAY + timedelta(seconds=1801)
+        assert await sweeper.sweep(later) == 1
+        state = await sweeper.db.alert_sweeps.find_one({"id": SWEEP_ID})
+        assert state["lease_expires_at"] is None
+        assert state["expiry_through"] == (later.date() + timedelta(days=EXPIRY_WINDOW_DAYS)).isoformat()
+        assert await sweeper.sweep(later) == 0
+
+    asyncio.run(scenario())
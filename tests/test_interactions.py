@@ -0,0 +1,111 @@
+import json
+
+import pytest
+
+from interactions import InteractionEngine, normalize_drug_name
+
+
+@pytest.fixture
+def engine() -> InteractionEngine:
+    engine = InteractionEngine()
+    engine.add_drug("warfarin", aliases=["Coumadin", "Jantoven"])
+    engine.add_drug("ibuprofen", aliases=["Advil", "Motrin"])
+    engine.add_interaction("warfarin", "aspirin", "high", "Increased bleeding risk")
+    engine.add_interaction("warfarin", "ibuprofen", "medium")
+    engine.add_interaction("lisinopril", "spironolactone", "medium")
+    return engine
+
+
+def pairs(conflicts) -> list:
+    return [(c["drug1"], c["drug2"]) for c in conflicts]
+
+
+def test_normalize_drug_name():
+    assert normalize_drug_name("  Warfarin   Sodium ") == "warfarin sodium"
+
+
+def test_aliases_and_strength_suffixes_resolve_to_the_canonical_drug(engine):
+    warfarin = engine.resolve("warfarin")
+    assert engine.resolve("COUMADIN") == warfarin
+    assert engine.resolve("Coumadin 5mg") == warfarin
+    assert engine.resolve("warfarin (5 mg) tablet") == warfarin
+    assert engine.resolve("unknown drug") is None
+    assert engine.resolve("") is None
+
+
+def test_interactions_are_symmetric_and_keep_the_worst_severity(engine):
+    engine.add_interaction("ibuprofen", "warfarin", "high")
+    engine.add_interaction("warfarin", "ibuprofen", "low")
+    warfarin, ibuprofen = engine.resolve("warfarin"), engine.resolve("ibuprofen")
+    assert engine.conflict(warfarin, ibuprofen)["severity"] == "high"
+    assert engine.conflict(ibuprofen, warfarin)["severity"] == "high"
+    assert engine.interaction_count == 3
+
+
+def test_check_reports_each_pair_once_in_regimen_order(engine):
+    conflicts = engine.check(["Aspirin 81mg", "Metformin", "Coumadin", "Advil"])
+    assert pairs(conflicts) == [("aspirin", "warfarin"), ("warfarin", "ibuprofen")]
+    assert conflicts[0]["description"] == "Increased bleeding risk"
+    assert conflicts[1]["description"] == "Known interaction between warfarin and ibuprofen"
+    assert {c["source"] for c in conflicts} == {"local_db"}
+
+
+def test_duplicate_drugs_in_one_regimen_are_checked_once(engine):
+    # Brand, generic and strength variants of the same drug are one drug
+    conflicts = engine.check(["warfarin", "Coumadin 5mg", "aspirin", "Aspirin", "Jantoven"])
+    assert pairs(conflicts) == [("warfarin", "aspirin")]
+    # A drug never conflicts with itself
+    assert engine.check(["warfarin", "warfarin"]) == []
+    engine.add_interaction("warfarin", "Coumadin")
+    assert engine.check(["warfarin", "Coumadin"]) == []
+
+
+def test_check_batch_checks_each_regimen_independently(engine):
+    results = engine.check_batch([
+        ["warfarin", "aspirin"],
+        ["aspirin", "ibuprofen"],
+        ["lisinopril", "spironolactone", "lisinopril"],
+        [],
+    ])
+    assert [pairs(result) for result in results] == [
+        [("warfarin", "aspirin")],
+        [],
+        [("lisinopril", "spironolactone")],
+        [],
+    ]
+
+
+def test_from_mapping():
+    engine = InteractionEngine.from_mapping({"warfarin": ["aspirin", "ibuprofen"]}, severity="medium")
+    assert pairs(engine.check(["ibuprofen", "warfarin"])) == [("ibuprofen", "warfarin")]
+    assert engine.check(["aspirin", "ibuprofen"]) == []
+
+
+def test_load_json_and_csv_datasets(tmp_path):
+    dataset = tmp_path / "interactions.json"
+    dataset.write_text(json.dumps({
+        "drugs": [{"name": "Simvastatin", "aliases": ["Zocor"]}],
+        "interactions": [{"drug1": "simvastatin", "drug2": "clarithromycin", "severity": "high"}],
+    }))
+    assert pairs(InteractionEngine.load(dataset).check(["Zocor 20mg", "Clarithromycin"])) == [
+        ("simvastatin", "clarithromycin")
+    ]
+
+    dataset = tmp_path / "interactions.csv"
+    dataset.write_text("drug1,drug2,severity,description\nsertraline,tramadol,,Serotonin syndrome\n")
+    aliases = tmp_path / "aliases.csv"
+    aliases.write_text("alias,name\nZoloft,sertraline\n")
+    conflicts = InteractionEngine.load(dataset, aliases).check(["zoloft", "tramadol"])
+    assert pairs(conflicts) == [("sertraline", "tramadol")]
+    assert conflicts[0]["severity"] == "high"
+    assert conflicts[0]["description"] == "Serotonin syndrome"
+
+
+def test_batch_request_is_capped():
+    from pydantic import ValidationError
+
+    from server import INTERACTION_BATCH_MAX, InteractionBatchRequest
+
+    assert len(InteractionBatchRequest(regimens=[["warfarin"]] * INTERACTION_BATCH_MAX).regimens) == INTERACTION_BATCH_MAX
+    with pytest.raises(ValidationError):
+        InteractionBatchRequest(regimens=[["warfarin"]] * (INTERACTION_BATCH_MAX + 1))
@@ -0,0 +1,137 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from jobs import JobQueue
+from resilience import CircuitOpenError
+
+USER_ID = "jobs-test"
+TEXT = "Foobarin twice daily"
+
+
+def test_failed_text_extraction_is_retried_until_the_last_attempt(server_db, monkeypatch):
+    import server
+
+    calls = []
+
+    async def failing_extraction(text):
+        calls.append(text)
+        return None
+
+    monkeypatch.setattr(server, "extract_medicines_from_text", failing_extraction)
+
+    async def scenario():
+        jobs = JobQueue(server_db.prescription_jobs, server.run_prescription_job, max_attempts=2, retry_delay=0.0)
+        job = await jobs.enqueue("prescription_text", USER_ID, {"text": TEXT, "prescription_id": "p1"})
+
+        await jobs._run(await jobs._claim())
+        retried = await jobs.get(job["id"], USER_ID)
+        assert (retried["status"], retried["stage"]) == ("queued", "retrying")
+        assert retried["error"] == "Text extraction failed"
+        assert await server_db.prescriptions.count_documents({}) == 0
+
+        # The last attempt saves the prescription without medicines, as the synchronous path does
+        await jobs._run(await jobs._claim())
+        done = await jobs.get(job["id"], USER_ID)
+        assert done["status"] == "succeeded"
+        assert done["result"]["prescription_id"] == "p1"
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+async def no_op(job, progress) -> dict:
+    return {}
+
+
+async def failing(job, progress) -> dict:
+    raise RuntimeError("boom")
+
+
+def queue(mock_db, handler=no_op, **kwargs) -> JobQueue:
+    return JobQueue(mock_db.jobs, handler, **kwargs)
+
+
+async def expire_lease(jobs: JobQueue, job_id: str):
+    await jobs.collection.update_one(
+        {"id": job_id}, {"$set": {"lease_expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    )
+
+
+def test_enqueue_is_idempotent_and_claims_run_in_order(mock_db):
+    async def scenario():
+        jobs = queue(mock_db)
+        await mock_db.jobs.create_index("idempotency_key", unique=True, sparse=True)
+        first = await jobs.enqueue("t", USER_ID, {}, idempotency_key="k1")
+        assert (await jobs.enqueue("t", USER_ID, {}, idempotency_key="k1"))["id"] == first["id"]
+        second = await jobs.enqueue("t", USER_ID, {})
+        await jobs.enqueue("t", USER_ID, {}, delay=60)
+
+        claimed = await jobs._claim()
+        assert (claimed["id"], claimed["status"], claimed["attempts"]) == (first["id"], "running", 1)
+        assert (await jobs._claim())["id"] == second["id"]
+        # The delayed job is not due yet, and running jobs hold their lease
+        assert await jobs._claim() is None
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(mock_db):
+    async def scenario():
+        jobs = queue(mock_db)
+        job = await jobs.enqueue("t", USER_ID, {})
+        await jobs._claim()
+        await expire_lease(jobs, job["id"])
+        reclaimed = await jobs._claim()
+        assert (reclaimed["id"], reclaimed["attempts"]) == (job["id"], 2)
+        assert reclaimed["lease_expires_at"] > datetime.now(timezone.utc)
+
+    asyncio.run(scenario())
+
+
+def test_expired_lease_on_the_last_attempt_is_dead_lettered(mock_db):
+    async def scenario():
+        jobs = queue(mock_db, max_attempts=2)
+        job = await jobs.enqueue("t", USER_ID, {})
+        for _ in range(2):
+            await jobs._claim()
+            await expire_lease(jobs, job["id"])
+        assert await jobs._claim() is None
+        dead = await jobs.get(job["id"], USER_ID)
+        assert (dead["status"], dead["stage"], dead["attempts"]) == ("failed", "failed", 2)
+        assert dead["lease_expires_at"] is None
+
+    asyncio.run(scenario())
+
+
+def test_failed_attempts_back_off_then_fail_the_job(mock_db):
+    async def scenario():
+        jobs = queue(mock_db, failing, max_attempts=3, retry_delay=10.0)
+        job = await jobs.enqueue("t", USER_ID, {})
+        for attempt, delay in ((1, 10), (2, 20)):
+            started = datetime.now(timezone.utc)
+            await jobs._run(await jobs._claim())
+            retrying = await jobs.get(job["id"], USER_ID)
+            assert (retrying["status"], retrying["attempts"], retrying["error"]) == ("queued", attempt, "boom")
+            assert timedelta(seconds=delay - 1) < retrying["run_after"] - started <= timedelta(seconds=delay + 1)
+            assert await jobs._claim() is None
+            await jobs.collection.update_one({"id": job["id"]}, {"$set": {"run_after": started}})
+        await jobs._run(await jobs._claim())
+        assert (await jobs.get(job["id"], USER_ID))["status"] == "failed"
+        assert await jobs._claim() is None
+
+    asyncio.run(scenario())
+
+
+def test_dependency_outage_defers_without_using_an_attempt(mock_db):
+    async def unavailable(job, progress) -> dict:
+        raise CircuitOpenError("gemini", 30.0, "circuit open")
+
+    async def scenario():
+        jobs = queue(mock_db, unavailable, retry_delay=1.0)
+        job = await jobs.enqueue("t", USER_ID, {})
+        await jobs._run(await jobs._claim())
+        deferred = await jobs.get(job["id"], USER_ID)
+        assert (deferred["status"], deferred["stage"], deferred["attempts"]) == ("queued", "waiting", 0)
+        assert deferred["run_after"] - datetime.now(timezone.utc) > timedelta(seconds=25)
+
+    asyncio.run(scenario())
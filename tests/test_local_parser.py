@@ -0,0 +1,87 @@
+import pytest
+
+from local_parser import (
+    DRUG_LEXICON_FILE,
+    DrugLexicon,
+    LocalPrescriptionParser,
+    normalize_dosage,
+    normalize_frequency,
+)
+
+
+@pytest.fixture(scope="module")
+def parser() -> LocalPrescriptionParser:
+    return LocalPrescriptionParser(DrugLexicon.load(DRUG_LEXICON_FILE))
+
+
+def names(result) -> list:
+    return [medicine["name"].lower() for medicine in result.medicines]
+
+
+@pytest.mark.parametrize("text, dosage", [
+    ("Metformin 500 mg", "500mg"),
+    ("Salbutamol 100 µg", "100mcg"),
+    ("Amoxicillin/clav 500/125mg", "500/125mg"),
+    ("take two tablets", "two tablets"),
+    ("twice daily", None),
+])
+def test_normalize_dosage(text, dosage):
+    assert normalize_dosage(text) == dosage
+
+
+@pytest.mark.parametrize("text, frequency", [
+    ("1 tab b.i.d.", "twice daily"),
+    ("TDS", "three times daily"),
+    ("q8h", "every 8 hours"),
+    ("at night", "at bedtime"),
+    ("after breakfast", "once daily"),
+    ("prn", "as needed"),
+    ("daily as needed", "once daily as needed"),
+    ("500mg", None),
+])
+def test_normalize_frequency(text, frequency):
+    assert normalize_frequency(text) == frequency
+
+
+def test_aliases_scan_to_their_canonical_drug():
+    lexicon = DrugLexicon()
+    lexicon.add("acetaminophen")
+    lexicon.add("Tylenol Extra Strength", "acetaminophen")
+    assert lexicon.find("Tylenol extra strength 500mg") == [(0, 22, "acetaminophen")]
+    assert len(lexicon) == 2
+
+
+def test_simple_prescription_is_accepted(parser):
+    result = parser.parse("Metformin 500mg twice daily\nAtorvastatin 20mg at night")
+    assert names(result) == ["metformin", "atorvastatin"]
+    assert result.medicines[0] == {"name": "Metformin", "dosage": "500mg", "frequency": "twice daily"}
+    assert result.confidence == 1.0
+    assert parser.accepts(result)
+
+
+def test_header_lines_without_medicine_wording_are_ignored(parser):
+    result = parser.parse("Dr. A. Rao, City Clinic\nPatient: J. Doe\nMetformin 500mg twice daily")
+    assert names(result) == ["metformin"]
+    assert parser.accepts(result)
+
+
+@pytest.mark.parametrize("unknown_line", [
+    "Foobarin twice daily",
+    "Foobarin 2 tablets",
+    "Foobarin by mouth",
+    "Foobarin 10mg",
+    "Tab. Foobarin",
+])
+def test_line_with_an_unknown_drug_is_not_accepted(parser, unknown_line):
+    # Accepting would skip Gemini, and the unknown drug would never reach the interaction check
+    result = parser.parse(f"Metformin 500mg twice daily\n{unknown_line}")
+    assert names(result) == ["metformin"]
+    assert result.confidence == 0.0
+    assert not parser.accepts(result)
+
+
+def test_missing_dosage_or_frequency_lowers_confidence(parser):
+    result = parser.parse("Metformin twice daily")
+    assert result.confidence == 0.75
+    assert parser.parse("Metformin").confidence == 0.5
+    assert parser.parse("").confidence == 0.0
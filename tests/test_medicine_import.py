@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from active_drugs import ActiveDrugs, medicine_source
+from interactions import InteractionEngine
+from medicine_import import import_conflicts, parse_rows, read_rows, validate_rows
+from server import MedicineCreate
+
+USER_ID = "import-test"
+
+CSV = (
+    "name,dosage,quantity,daily_usage,expiry_date,prescription_id\r\n"
+    "Aspirin,81mg,30,1,2030-01-01,\r\n"
+    " Metformin , 500mg ,60,,2030-06-01,\r\n"
+)
+
+
+def request(body: bytes, content_type: str) -> Request:
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", content_type.encode())]}
+    return Request(scope, receive)
+
+
+def test_parse_csv_trims_cells_and_drops_empty_ones():
+    assert parse_rows(("\ufeff" + CSV).encode(), csv_format=True) == [
+        {"name": "Aspirin", "dosage": "81mg", "quantity": "30", "daily_usage": "1", "expiry_date": "2030-01-01"},
+        {"name": "Metformin", "dosage": "500mg", "quantity": "60", "expiry_date": "2030-06-01"},
+    ]
+
+
+def test_parse_json_array_or_wrapped_object():
+    rows = [{"name": "Aspirin"}]
+    assert parse_rows(json.dumps(rows).encode(), csv_format=False) == rows
+    assert parse_rows(json.dumps({"medicines": rows}).encode(), csv_format=False) == rows
+
+
+@pytest.mark.parametrize("data", [b"{not json", b'{"name": "Aspirin"}', b"\xff\xfe"])
+def test_parse_rejects_malformed_imports(data):
+    with pytest.raises(HTTPException) as raised:
+        parse_rows(data, csv_format=False)
+    assert raised.value.status_code == 400
+
+
+def test_read_rows_from_csv_and_json_bodies():
+    rows = asyncio.run(read_rows(request(CSV.encode(), "text/csv")))
+    assert [row["name"] for row in rows] == ["Aspirin", "Metformin"]
+    rows = asyncio.run(read_rows(request(b'[{"name": "Aspirin"}]', "application/json")))
+    assert rows == [{"name": "Aspirin"}]
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(read_rows(request(CSV.encode(), "text/csv"), max_bytes=10))
+    assert raised.value.status_code == 413
+
+
+def test_validate_rows_reports_every_bad_row_by_number():
+    rows = parse_rows(CSV.encode(), csv_format=True) + [
+        {"name": "Ibuprofen", "dosage": "200mg", "quantity": "many", "expiry_date": "2030-01-01"},
+        "not an object",
+        {"dosage": "5mg", "quantity": 1, "expiry_date": "2030-01-01"},
+    ]
+    valid, errors = validate_rows(rows, MedicineCreate)
+    assert [medicine.name for medicine in valid] == ["Aspirin", "Metformin"]
+    assert valid[1].daily_usage == 1
+    assert [error["row"] for error in errors] == [3, 4, 5]
+    assert [e["field"] for e in errors[0]["errors"]] == ["quantity"]
+    assert errors[1]["errors"] == [{"field": None, "message": "Expected an object"}]
+    assert [e["field"] for e in errors[2]["errors"]] == ["name"]
+
+
+def test_validate_rows_limits():
+    with pytest.raises(HTTPException) as raised:
+        validate_rows([], MedicineCreate)
+    assert raised.value.status_code == 400
+    with pytest.raises(HTTPException) as raised:
+        validate_rows([{}] * 3, MedicineCreate, max_rows=2)
+    assert raised.value.status_code == 413
+
+
+@pytest.fixture
+def active(mock_db) -> ActiveDrugs:
+    engine = InteractionEngine()
+    engine.add_drug("warfarin", aliases=["Coumadin"])
+    engine.add_interaction("warfarin", "aspirin", "high")
+    engine.add_interaction("aspirin", "ibuprofen", "medium")
+    return ActiveDrugs(mock_db.active_drugs, engine)
+
+
+def medicine(medicine_id: str, name: str, quantity: int = 10) -> dict:
+    return {"id": medicine_id, "user_id": USER_ID, "name": name, "quantity": quantity}
+
+
+def summary(conflicts) -> list:
+    return [(medicine_id, c["drug1"], c["drug2"]) for medicine_id, c in conflicts]
+
+
+def test_import_row_conflicting_with_existing_stock(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("stock"), ["warfarin"])
+        return await import_conflicts(active, USER_ID, [medicine("m1", "Metformin"), medicine("m2", "Aspirin 81mg")])
+
+    assert summary(asyncio.run(scenario())) == [("m2", "aspirin", "warfarin")]
+
+
+def test_import_rows_conflicting_with_each_other(active):
+    conflicts = asyncio.run(import_conflicts(active, USER_ID, [medicine("m1", "ibuprofen"), medicine("m2", "aspirin")]))
+    assert summary(conflicts) == [("m1", "ibuprofen", "aspirin")]
+
+
+def test_import_reports_each_pair_once_and_keys_duplicates_to_the_first_row(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("stock"), ["aspirin"])
+        # Warfarin twice (generic and brand) plus aspirin, which is also in stock already
+        return await import_conflicts(active, USER_ID, [
+            medicine("m1", "warfarin"), medicine("m2", "Coumadin"), medicine("m3", "aspirin"),
+        ])
+
+    assert summary(asyncio.run(scenario())) == [("m1", "warfarin", "aspirin")]
+
+
+def test_import_rows_without_stock_raise_no_conflicts(active):
+    async def scenario():
+        await active.add(USER_ID, medicine_source("stock"), ["warfarin"])
+        return await import_conflicts(active, USER_ID, [medicine("m1", "aspirin", quantity=0), medicine("m2", "unknown")])
+
+    assert asyncio.run(scenario()) == []
@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+from pymongo import ASCENDING, DESCENDING
+
+from pagination import decode_cursor, encode_cursor, keyset_filter
+
+
+def raw_cursor(payload) -> str:
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trips_dates_and_scalars():
+    created_at = datetime(2025, 3, 1, 12, 30, tzinfo=timezone.utc)
+    assert decode_cursor(encode_cursor({"id": "a", "created_at": created_at}, "created_at")) == (created_at, "a")
+    assert decode_cursor(encode_cursor({"id": "b", "quantity": 3}, "quantity")) == (3, "b")
+    assert decode_cursor(encode_cursor({"id": "c"}, "created_at")) == (None, "c")
+
+
+def test_keyset_filter_continues_after_the_cursor():
+    cursor = encode_cursor({"id": "a", "created_at": "2025-01-01"}, "created_at")
+    assert keyset_filter({"user_id": "u"}, "created_at", DESCENDING, cursor) == {
+        "user_id": "u",
+        "$or": [
+            {"created_at": {"$lt": "2025-01-01"}},
+            {"created_at": "2025-01-01", "id": {"$lt": "a"}},
+        ],
+    }
+    assert keyset_filter({"user_id": "u"}, "created_at", ASCENDING, None) == {"user_id": "u"}
+
+
+@pytest.mark.parametrize("payload", [
+    [{"$ne": None}, "a"],
+    [{"$date": "2025-01-01", "$gt": 1}, "a"],
+    [{"$date": 5}, "a"],
+    [{"$date": "not a date"}, "a"],
+    [["nested"], "a"],
+    ["2025-01-01", {"$ne": None}],
+    ["2025-01-01", 7],
+    ["2025-01-01"],
+    {"value": 1, "id": "a"},
+])
+def test_crafted_cursors_are_rejected_with_400(payload):
+    with pytest.raises(HTTPException) as raised:
+        keyset_filter({"user_id": "u"}, "created_at", ASCENDING, raw_cursor(payload))
+    assert raised.value.status_code == 400
+
+
+def test_garbage_cursor_is_rejected_with_400():
+    with pytest.raises(HTTPException) as raised:
+        decode_cursor("%%%not-base64")
+    assert raised.value.status_code == 400
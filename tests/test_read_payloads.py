@@ -0,0 +1,116 @@
+"""The list endpoints skip FastAPI's response validation, so check their payloads against the models"""
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+import httpx
+from pydantic import TypeAdapter
+
+import server
+
+USER_ID = "payload-test"
+
+
+def seed(db):
+    created_at = datetime(2025, 5, 1, 8, 0, tzinfo=timezone.utc)
+    prescriptions, medicines, alerts = [], [], []
+    for i in range(3):
+        prescription = server.Prescription(
+            user_id=USER_ID,
+            type="text",
+            original_text="Metformin 500mg twice daily",
+            image_base64="aGVsbG8=",
+            medicines=[{"name": "Metformin", "dosage": "500mg", "frequency": "twice daily"}],
+            verification_score=100.0,
+            status="verified",
+            timings={"local_parse": 0.1},
+            created_at=created_at + timedelta(hours=i),
+        ).model_dump()
+        medicine = server.Medicine(
+            user_id=USER_ID,
+            name="Metformin",
+            dosage="500mg",
+            quantity=30,
+            daily_usage=2,
+            expiry_date="2030-01-01",
+            runout_date="2025-05-16",
+            created_at=created_at + timedelta(hours=i),
+        ).model_dump()
+        # Fields the sweeper stores alongside the API's own
+        medicine.update({"stock_counted_at": created_at, "restocked_at": created_at})
+        alert = server.Alert(
+            user_id=USER_ID,
+            type="expiry",
+            severity="medium",
+            title="Medicine Expiring Soon",
+            message="Metformin expires in 12 days",
+            created_at=created_at + timedelta(hours=i),
+        ).model_dump()
+        prescriptions.append(prescription)
+        medicines.append(medicine)
+        alerts.append(alert)
+
+    async def insert():
+        await db.prescriptions.insert_many(prescriptions)
+        await db.medicines.insert_many(medicines)
+        await db.alerts.insert_many(alerts)
+
+    asyncio.run(insert())
+    return {"prescriptions": prescriptions, "medicines": medicines, "alerts": alerts}
+
+
+def get(path: str, **params) -> httpx.Response:
+    token = server.create_access_token({"sub": USER_ID})
+
+    async def send():
+        transport = httpx.ASGITransport(app=server.create_app())
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test", headers={"Authorization": f"Bearer {token}"}
+        ) as client:
+            return await client.get(path, params=params)
+
+    response = asyncio.run(send())
+    response.raise_for_status()
+    return response
+
+
+def assert_matches_model(payload, model, stored: List[dict], exclude=()):
+    parsed = TypeAdapter(List[model]).validate_python(payload)
+    assert len(parsed) == len(stored)
+    by_id = {doc["id"]: doc for doc in stored}
+    for item, model_item in zip(payload, parsed):
+        # Exactly the model's fields, with the stored values, and dates as UTC ISO strings
+        assert set(item) == set(model.model_fields) - set(exclude)
+        expected = model.model_validate(by_id[item["id"]]).model_dump(mode="json", exclude=set(exclude))
+        assert model_item.model_dump(mode="json", exclude=set(exclude)) == expected
+        assert item["created_at"].endswith("Z")
+
+
+def test_list_payloads_match_their_models(server_db):
+    stored = seed(server_db)
+    assert_matches_model(get("/api/prescriptions").json(), server.Prescription, stored["prescriptions"], ("image_base64",))
+    assert_matches_model(get("/api/prescriptions", include_image="true").json(), server.Prescription, stored["prescriptions"])
+    assert_matches_model(get("/api/medicines").json(), server.Medicine, stored["medicines"])
+    assert_matches_model(get("/api/alerts").json(), server.Alert, stored["alerts"])
+
+
+def test_ndjson_exports_match_the_json_pages(server_db):
+    seed(server_db)
+    for path in ("/api/prescriptions", "/api/medicines", "/api/alerts"):
+        lines = get(path, format="ndjson").text.splitlines()
+        assert [json.loads(line) for line in lines] == get(path).json()
+
+
+def test_single_prescription_matches_its_model(server_db):
+    stored = seed(server_db)["prescriptions"][0]
+    payload = get(f"/api/prescriptions/{stored['id']}").json()
+    assert server.Prescription.model_validate(payload).model_dump(mode="json") == \
+        server.Prescription.model_validate(stored).model_dump(mode="json")
+
+
+def test_openapi_schema_still_documents_the_models():
+    paths = server.create_app().openapi()["paths"]
+    for path, model in (("/api/prescriptions", "Prescription"), ("/api/medicines", "Medicine"), ("/api/alerts", "Alert")):
+        schema = paths[path]["get"]["responses"]["200"]["content"]["application/json"]["schema"]
+        assert schema["items"]["$ref"].endswith(f"/{model}")
@@ -0,0 +1,291 @@
+"""Circuit breaker, load shedding and 503 mapping, against the local fake Gemini and openFDA"""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from benchmarks.fakes import FakeFDAServer, FakeGeminiModel, install_fake_gemini
+from fda_client import FDAClient
+from inference import GeminiInference
+from resilience import (
+    AdaptiveLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    DependencyGuard,
+    DependencyUnavailable,
+    LoadShedError,
+)
+
+REGIMEN = ["warfarin", "aspirin", "metformin"]
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.min_calls):
+        breaker.record(True, 0.0)
+
+
+def test_breaker_opens_on_failure_rate_and_fails_fast():
+    breaker = CircuitBreaker("test", min_calls=4, failure_rate=0.5, open_seconds=30.0)
+    breaker.record(False, 0.0)
+    breaker.record(False, 0.0)
+    breaker.record(True, 0.0)
+    assert breaker.state == "closed"
+    breaker.record(True, 0.0)
+    assert breaker.state == "open"
+    assert breaker.times_opened == 1
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.check()
+    assert raised.value.retry_after > 29
+
+
+def test_breaker_opens_on_slow_calls():
+    breaker = CircuitBreaker("test", min_calls=3, slow_call_seconds=1.0, slow_call_rate=0.6)
+    for _ in range(3):
+        breaker.record(False, 2.0)
+    assert breaker.state == "open"
+
+
+def test_half_open_breaker_lets_one_probe_through():
+    breaker = CircuitBreaker("test", min_calls=1, open_seconds=0.05)
+    open_breaker(breaker)
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    probe = breaker.allow()
+    assert probe.probe
+    assert breaker.allow() is None
+
+    breaker.record(True, 0.0, probe)
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+    time.sleep(0.06)
+    probe = breaker.allow()
+    breaker.record(False, 0.0, probe)
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_stragglers_do_not_close_or_reopen_the_circuit():
+    breaker = CircuitBreaker("test", min_calls=5, open_seconds=0.05)
+    permits = [breaker.allow() for _ in range(60)]
+    for permit in permits[:5]:
+        breaker.record(True, 0.1, permit)
+    assert breaker.state == "open"
+
+    # Calls admitted before the circuit opened finish while it is open
+    breaker.record(False, 0.1, permits[5])
+    assert breaker.state == "open"
+    for permit in permits[6:]:
+        breaker.record(True, 0.1, permit)
+    assert breaker.times_opened == 1
+    assert breaker.stragglers == 55
+
+    # ... or after the probe closed it again
+    time.sleep(0.06)
+    late = breaker.allow()
+    probe = breaker.allow()
+    assert late.probe and probe is None
+    breaker.record(False, 0.0, late)
+    assert breaker.state == "closed"
+    for _ in range(5):
+        breaker.record(True, 0.1, permits[0])
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_leaves_the_circuit_half_open():
+    async def scenario():
+        guard = DependencyGuard(
+            CircuitBreaker("gemini", min_calls=1, open_seconds=0.05),
+            AdaptiveLimiter("gemini", max_limit=1),
+        )
+        inference = GeminiInference("", timeout=2.0, guard=guard)
+        install_fake_gemini(inference, FakeGeminiModel("ok", latency=1.0))
+        open_breaker(guard.breaker)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(inference.generate("gemini-2.5-flash", "ping"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert guard.breaker.state == "half_open"
+        assert guard.limiter.in_flight == 0
+        assert guard.breaker.allow().probe
+
+    asyncio.run(scenario())
+
+
+def test_probe_cancelled_while_queued_releases_the_half_open_slot():
+    async def scenario():
+        guard = DependencyGuard(
+            CircuitBreaker("test", min_calls=1, open_seconds=0.05),
+            AdaptiveLimiter("test", max_limit=1),
+        )
+        await guard.limiter.acquire()  # the only slot is taken, so the probe queues
+        open_breaker(guard.breaker)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(guard.acquire())
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert guard.breaker.state == "half_open"
+        assert guard.breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_shed_probe_releases_the_half_open_slot():
+    async def scenario():
+        guard = DependencyGuard(
+            CircuitBreaker("test", min_calls=1, open_seconds=0.05),
+            AdaptiveLimiter("test", max_limit=1, max_queue=0),
+        )
+        await guard.limiter.acquire()
+        open_breaker(guard.breaker)
+        await asyncio.sleep(0.06)
+        with pytest.raises(LoadShedError):
+            await guard.acquire()
+        assert guard.breaker.allow()
+
+    asyncio.run(scenario())
+
+
+def test_limiter_sheds_when_the_queue_is_full_or_the_wait_times_out():
+    async def scenario():
+        limiter = AdaptiveLimiter("test", max_limit=1, max_queue=1, queue_timeout=0.05)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(LoadShedError, match="queue full"):
+            await limiter.acquire()
+        with pytest.raises(LoadShedError, match="timed out"):
+            await waiter
+        assert limiter.shed == 2
+        assert limiter.queued == 0
+
+        limiter.release()
+        await limiter.acquire()
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_limiter_backs_off_on_slow_calls_and_recovers():
+    limiter = AdaptiveLimiter("test", max_limit=8, target_latency=0.1)
+    limiter.in_flight = 1
+    limiter.release(seconds=0.5)
+    assert limiter.limit < 8
+    backed_off = limiter.limit
+    for _ in range(50):
+        limiter.in_flight = 1
+        limiter.release(seconds=0.01)
+    assert limiter.limit > backed_off
+
+
+def test_fda_circuit_opens_fails_fast_and_recovers():
+    async def scenario():
+        with FakeFDAServer(latency=0.01) as fda:
+            guard = DependencyGuard(
+                CircuitBreaker("fda", min_calls=3, open_seconds=0.5, slow_call_seconds=0.2),
+                AdaptiveLimiter("fda", max_limit=8, target_latency=0.1, queue_timeout=0.5),
+            )
+            client = FDAClient(base_url=fda.url, timeout=0.3, guard=guard)
+            try:
+                assert len(await client.find_interactions(REGIMEN, deadline=2.0)) == 2
+
+                fda.latency = 1.0
+                for _ in range(3):
+                    # Every check goes to the (slow) service rather than the label cache
+                    client._cache.clear()
+                    await client.find_interactions(REGIMEN, deadline=0.5)
+                assert guard.breaker.state == "open"
+
+                requests = fda.requests
+                client._cache.clear()
+                started = time.perf_counter()
+                assert await client.find_interactions(REGIMEN, deadline=0.5) == []
+                assert time.perf_counter() - started < 0.05
+                assert fda.requests == requests
+
+                fda.latency = 0.01
+                await asyncio.sleep(guard.breaker.open_seconds)
+                # The half-open circuit lets a single probe through; the next check runs in full
+                client._cache.clear()
+                await client.find_interactions(REGIMEN, deadline=2.0)
+                assert guard.breaker.state == "closed"
+                client._cache.clear()
+                assert len(await client.find_interactions(REGIMEN, deadline=2.0)) == 2
+            finally:
+                await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_gemini_limit_backs_off_sheds_and_opens():
+    calls = 40
+
+    async def scenario():
+        guard = DependencyGuard(
+            CircuitBreaker("gemini", min_calls=5, open_seconds=30.0, slow_call_seconds=5.0),
+            AdaptiveLimiter("gemini", max_limit=8, target_latency=0.1, max_queue=calls, queue_timeout=1.0),
+        )
+        inference = GeminiInference("", timeout=2.0, guard=guard)
+        model = install_fake_gemini(inference, FakeGeminiModel("ok", latency=0.02, seed=1))
+
+        async def call():
+            try:
+                await inference.generate("gemini-2.5-flash", "ping")
+                return "ok"
+            except LoadShedError:
+                return "shed"
+            except DependencyUnavailable:
+                return "open"
+            except Exception:
+                return "error"
+
+        async def burst() -> dict:
+            outcomes = await asyncio.gather(*(call() for _ in range(calls)))
+            return {k: outcomes.count(k) for k in ("ok", "shed", "open", "error")}
+
+        assert (await burst())["ok"] == calls
+
+        model.latency = 0.3
+        slow = await burst()
+        assert guard.limiter.limit < guard.limiter.max_limit
+        assert slow["shed"] > 0
+
+        model.error_rate = 1.0
+        model.latency = 0.02
+        failing = await burst()
+        assert guard.breaker.state == "open"
+        assert failing["open"] > 0
+
+    asyncio.run(scenario())
+
+
+def test_chat_answers_503_with_retry_after_while_gemini_is_open(monkeypatch):
+    import server
+
+    # An open circuit fails the request before it reaches the model or the database
+    guard = DependencyGuard(
+        CircuitBreaker("gemini", min_calls=1, open_seconds=30.0),
+        AdaptiveLimiter("gemini", max_limit=1),
+    )
+    open_breaker(guard.breaker)
+    monkeypatch.setattr(server.inference, "guard", guard)
+    token = server.create_access_token({"sub": "resilience-test"})
+
+    async def post_chat() -> httpx.Response:
+        transport = httpx.ASGITransport(app=server.create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(
+                "/api/chat",
+                json={"message": "hello"},
+                headers={"Authorization": f"Bearer {token}"},
+            )
+
+    response = asyncio.run(post_chat())
+    assert response.status_code == 503
+    assert response.json()["dependency"] == "gemini"
+    assert 1 <= int(response.headers["retry-after"]) <= 30
@@ -0,0 +1,83 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from indexes import INDEXES, ensure_indexes
+from stats import LOW_STOCK_THRESHOLD, expiry_cutoff, expiry_key
+
+
+def in_days(days: int) -> str:
+    return (datetime.now(timezone.utc) + timedelta(days=days)).date().isoformat()
+
+
+async def recount(db, user_id: str) -> dict:
+    """What UserStats.compute counts, with plain queries (mongomock has no $unionWith)"""
+    medicines = await db.medicines.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+    cutoff = expiry_cutoff()
+    return {
+        "total_prescriptions": await db.prescriptions.count_documents({"user_id": user_id}),
+        "total_medicines": len(medicines),
+        "unread_alerts": await db.alerts.count_documents({"user_id": user_id, "is_read": False}),
+        "expiring_soon": sum(1 for m in medicines if (expiry_key(m["expiry_date"]) or "9999") <= cutoff),
+        "low_stock": sum(1 for m in medicines if m["quantity"] <= LOW_STOCK_THRESHOLD),
+    }
+
+
+def test_counters_match_a_recount_after_mixed_writes(server_db):
+    import server
+
+    async def scenario():
+        await ensure_indexes(server_db, [spec for spec in INDEXES if spec.collection in ("alerts", "medicines")])
+        transport = httpx.ASGITransport(app=server.create_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            registered = await client.post(
+                "/api/auth/register",
+                json={"email": "stats@example.com", "password": "secret", "full_name": "Stats Test"},
+            )
+            user_id = registered.json()["user"]["id"]
+            client.headers["Authorization"] = f"Bearer {registered.json()['token']}"
+
+            async def add(name: str, quantity: int, expiry_days: int) -> str:
+                response = await client.post("/api/medicines", json={
+                    "name": name, "dosage": "10mg", "quantity": quantity, "expiry_date": in_days(expiry_days),
+                })
+                assert response.status_code == 200, response.text
+                return response.json()["id"]
+
+            plenty = await add("Vitamin D", 90, 400)
+            low = await add("Zinc", 3, 400)
+            expiring = await add("Folic acid", 40, 10)
+            response = await client.post("/api/medicines/import", json=[
+                {"name": "Magnesium", "dosage": "250mg", "quantity": 2, "expiry_date": in_days(5)},
+                {"name": "Iron", "dosage": "65mg", "quantity": 30, "expiry_date": in_days(200)},
+            ])
+            assert response.status_code == 200, response.text
+            response = await client.post(
+                "/api/prescriptions/submit-text", json={"type": "text", "text": "Metformin 500mg twice daily"}
+            )
+            assert response.status_code == 200, response.text
+
+            # Low stock and expiring soon both flip, in each direction
+            for medicine_id, update in (
+                (plenty, {"quantity": 1, "expiry_date": in_days(3)}),
+                (low, {"quantity": 60}),
+                (expiring, {"expiry_date": in_days(300)}),
+            ):
+                response = await client.put(f"/api/medicines/{medicine_id}", json=update)
+                assert response.status_code == 200, response.text
+            assert (await client.delete(f"/api/medicines/{low}")).status_code == 200
+
+            alerts = (await client.get("/api/alerts")).json()
+            assert alerts
+            assert (await client.put(f"/api/alerts/{alerts[0]['id']}/read")).status_code == 200
+
+            stats = (await client.get("/api/dashboard/stats")).json()
+        return stats, await recount(server_db, user_id)
+
+    stats, expected = asyncio.run(scenario())
+    assert stats == expected
+    assert expected["total_medicines"] == 4
+    assert expected["total_prescriptions"] == 1
+    assert expected["low_stock"] == 2
+    assert expected["expiring_soon"] == 2
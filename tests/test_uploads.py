@@ -0,0 +1,83 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI, File, UploadFile
+
+from uploads import RequestSizeLimit, sniff_image_type
+
+LIMIT = 1024
+
+
+def limited_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(RequestSizeLimit, limits={"/upload": LIMIT})
+    return app
+
+
+def post(content, headers=None) -> httpx.Response:
+    async def send():
+        transport = httpx.ASGITransport(app=limited_app())
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/upload", content=content, headers=headers)
+
+    return asyncio.run(send())
+
+
+def multipart(payload: bytes) -> tuple:
+    boundary = "limit-test"
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="scan.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+    return body, {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def test_upload_within_the_limit_reaches_the_endpoint():
+    body, headers = multipart(b"x" * 100)
+    response = post(body, headers)
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_declared_oversized_body_is_refused_before_it_is_read():
+    body, headers = multipart(b"x" * (LIMIT * 4))
+    chunks_read = 0
+
+    async def stream():
+        nonlocal chunks_read
+        for start in range(0, len(body), 256):
+            chunks_read += 1
+            yield body[start:start + 256]
+
+    response = post(stream(), {**headers, "Content-Length": str(len(body))})
+    assert response.status_code == 413
+    assert chunks_read == 0
+
+
+def test_undeclared_body_stops_being_read_past_the_limit():
+    body, headers = multipart(b"x" * (LIMIT * 16))
+    chunks_read = 0
+
+    async def stream():
+        nonlocal chunks_read
+        for start in range(0, len(body), 256):
+            chunks_read += 1
+            yield body[start:start + 256]
+
+    response = post(stream(), headers)
+    assert response.status_code == 413
+    assert chunks_read <= LIMIT // 256 + 2
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(b"\xff\xd8\xff\xe0" + b"\0" * 12) == "image/jpeg"
+    assert sniff_image_type(b"\x89PNG\r\n\x1a\n" + b"\0" * 8) == "image/png"
+    assert sniff_image_type(b"RIFF\0\0\0\0WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"\0\0\0\x18ftypheic\0\0\0\0") == "image/heic"
+    assert sniff_image_type(b"%PDF-1.7" + b"\0" * 8) is None